@@ -4,14 +4,18 @@ Top-level dinkum module.
 Contains core execution information.
 """
 
+import os
 import sys
 from importlib.metadata import version
+import numpy as np
 import pandas as pd
 
 __version__ = version("dinkum-bio")
 
 import itertools
 import collections
+import concurrent.futures
+import threading
 
 from . import vfg
 from .vfg import GeneStateInfo, DEFAULT_OFF, get_gene, Gene
@@ -19,6 +23,8 @@ from . import vfn
 from .vfn import get_tissue, Tissue
 from . import observations
 from . import utils
+from .serialize import save_model, load_model
+from .edges import from_edges
 from .exceptions import *
 
 
@@ -39,6 +45,7 @@ def run_and_display_df(
     verbose=False,
     save_image=None,
     trace_fn=None,
+    use_cache=True,
 ):
     """
     Run and display the circuit model; for use in Jupyter notebooks.
@@ -53,6 +60,8 @@ def run_and_display_df(
     - 'verbose' - display more text output.
     - 'save_image' - save image to this file.
     - 'canvas_type' - 'ipycanvas' or 'pillow' (default: 'pillow')
+    - 'use_cache' - set to False to bypass the result cache, if enabled
+      (see dinkum.cache).
     """
     from dinkum.display import MultiTissuePanel
 
@@ -62,7 +71,13 @@ def run_and_display_df(
         tissue_names = vfn.get_tissue_names()
 
     try:
-        tc = _run(start=start, stop=stop, verbose=verbose, trace_fn=trace_fn)
+        tc = _run(
+            start=start,
+            stop=stop,
+            verbose=verbose,
+            trace_fn=trace_fn,
+            use_cache=use_cache,
+        )
     except DinkumException as e:
         print(f"ERROR: {str(e)}", file=sys.stderr)
         print("Halting execution.", file=sys.stderr)
@@ -145,6 +160,9 @@ class OnlyGeneStates:
         return rl
 
 
+_ligand_lock = threading.Lock()
+
+
 class TissueAndGeneStateAtTime:
     """
     Hold the gene activity state for multiple tissues at a particular tp.
@@ -164,14 +182,56 @@ class TissueAndGeneStateAtTime:
         assert time is not None
 
         self._tissues = list(tissues)
+        self._tissue_names = set(t.name for t in self._tissues)
         self._tissues_by_name = {}  # @CTB do we need to set from tissues?
         self.time = time
+        self._ligand_levels = None
 
     def __setitem__(self, tissue, genes):
         "set Tissue object by name."
-        assert tissue in self._tissues
+        assert tissue.name in self._tissue_names
         assert isinstance(genes, OnlyGeneStates)
         self._tissues_by_name[tissue.name] = genes
+        self._ligand_levels = None
+
+    def get_ligand_levels(self):
+        """Return a dict mapping each ligand to an array of the level of
+        it that each tissue (in neighbor graph order) receives from this
+        state, given the ligand's range and attenuation.
+
+        Computed once, with one sparse matrix-vector product per ligand.
+        """
+        graph = vfn.get_neighbor_graph()
+        ligands = vfg.get_ligands()
+        cached = self._ligand_levels
+        if cached is not None and cached[0] is graph and cached[1] == ligands:
+            return cached[2]
+
+        # tissues advanced in parallel threads share this state: compute once
+        with _ligand_lock:
+            cached = self._ligand_levels
+            if cached is not None and cached[0] is graph and cached[1] == ligands:
+                return cached[2]
+            return self._compute_ligand_levels(graph, ligands)
+
+    def _compute_ligand_levels(self, graph, ligands):
+
+        received = {}
+        for ligand in ligands:
+            levels = np.zeros(len(graph))
+            for i, name in enumerate(graph.tissue_names):
+                gene_states = self._tissues_by_name.get(name)
+                if gene_states is not None and gene_states.is_active(ligand.name):
+                    levels[i] = float(gene_states.get_level(ligand.name))
+            received[ligand] = graph.signal(
+                levels,
+                juxtacrine=getattr(ligand, "is_juxtacrine", False),
+                range=getattr(ligand, "range", 1),
+                attenuation=getattr(ligand, "attenuation", 1.0),
+            )
+
+        self._ligand_levels = (graph, ligands, received)
+        return received
 
     def __getitem__(self, tissue):
         "get Tissue object."
@@ -263,51 +323,168 @@ class TissueGeneStates(collections.UserDict):
             time_state[tissue] = gene_state
 
         gene_state.set_gene_state(gene=gene, state_info=state_info)
+        time_state._ligand_levels = None
 
-    def to_dataframe(self, gene_names=None):
+    def to_arrays(self, *, timepoints=None, tissue_names=None, gene_names=None):
         """
-        Convert to a pandas DataFrame.
+        Convert to numpy arrays.
+
+        Returns (timepoints, level, active), where 'level' and 'active' are
+        indexed by [timepoint, tissue, gene] in the order of the given
+        'timepoints', 'tissue_names' and 'gene_names' (default: all).
+        Missing states are level 0 / not active.
         """
-        level_rows = []
-        active_rows = []
+        default_tissue_names, default_gene_names = self._get_axis_names()
+        if timepoints is None:
+            timepoints = sorted(self.keys())
+        if tissue_names is None:
+            tissue_names = default_tissue_names
+        if gene_names is None:
+            gene_names = default_gene_names
+
+        timepoints = list(timepoints)
+        level, active, _, _ = self._collect_arrays(timepoints, tissue_names, gene_names)
+        return timepoints, level, active
+
+    def _get_axis_names(self):
+        "Return the default (tissue names, gene names) for exports."
+        return vfn.get_tissue_names(), vfg.get_gene_names()
+
+    def _collect_arrays(self, timepoints, tissue_names, gene_names):
+        """Return (level, active, is_set, is_float) arrays, indexed by
+        [timepoint, tissue, gene]; 'is_float' marks levels that are not
+        ints."""
+        shape = (len(timepoints), len(tissue_names), len(gene_names))
+        level = np.zeros(shape)
+        active = np.zeros(shape, dtype=bool)
+        is_set = np.zeros(shape, dtype=bool)
+        is_float = np.zeros(shape, dtype=bool)
+
+        gene_index = {name: k for k, name in enumerate(gene_names)}
+        for i, timepoint in enumerate(timepoints):
+            time_state = self.get(timepoint)
+            if time_state is None:
+                continue
+            for j, tissue_name in enumerate(tissue_names):
+                gene_states = time_state._tissues_by_name.get(tissue_name)
+                if gene_states is None:
+                    continue
+                for gene_name, gsi in gene_states.genes_by_name.items():
+                    k = gene_index.get(gene_name)
+                    if k is not None:
+                        level[i, j, k] = gsi.level
+                        active[i, j, k] = gsi.active
+                        is_set[i, j, k] = True
+                        is_float[i, j, k] = not isinstance(gsi.level, int)
+
+        return level, active, is_set, is_float
+
+    def _get_tissue_mask(self, timepoints, tissue_names):
+        "Return a bool array marking the tissues in each timepoint's state."
+        index = {name: j for j, name in enumerate(tissue_names)}
+        mask = np.zeros((len(timepoints), len(tissue_names)), dtype=bool)
+        for i, timepoint in enumerate(timepoints):
+            for tissue in self[timepoint].tissues:
+                mask[i, index[tissue.name]] = True
+        return mask
+
+    def _get_table(self, gene_names):
+        """Return (timepoints, tissue_names, gene_names, rows, columns) for
+        the dataframes: 'rows' holds the (timepoint, tissue) indices of
+        each tissue state, and 'columns' the arrays for the genes."""
+        timepoints = list(self.keys())
+        tissue_names, all_gene_names = self._get_axis_names()
+        if gene_names is None:
+            names = all_gene_names
+        else:
+            names = list(gene_names)
+            known = set(all_gene_names)
+            for name in names:
+                if name not in known:
+                    raise DinkumInvalidGene(f"unknown gene name: '{name}'")
+
+        level, active, is_set, is_float = self._collect_arrays(
+            timepoints, tissue_names, names
+        )
+        mask = self._get_tissue_mask(timepoints, tissue_names)
+        rows = np.nonzero(mask)
 
-        # extract gene names?
-        all_gene_names = set()
         if gene_names is None:
-            for timepoint, state in self.items():
-                for tissue in state.tissues:
-                    tissue_name = tissue.name
-                    activity = state.get_by_tissue_name(tissue_name)
-                    all_gene_names.update(activity.genes_by_name)
+            # only genes that were set somewhere
+            keep = is_set[rows].any(axis=0)
+            names = [name for name, k in zip(names, keep) if k]
+            level = level[:, :, keep]
+            active = active[:, :, keep]
+            is_float = is_float[:, :, keep]
 
-            gene_names = list(sorted(all_gene_names))
+        return timepoints, tissue_names, names, rows, (level, active, is_float)
 
-        for timepoint, tissue_and_gene_sat in self.items():
-            timepoint_str = f"t={timepoint}"
+    def to_dataframe(self, gene_names=None, *, multi_index=False):
+        """
+        Convert to a pair of pandas DataFrames, (level_df, active_df).
 
-            # for each tissue, get level of each gene
-            for tissue in tissue_and_gene_sat.tissues:
-                level_d = dict(
-                    tissue=tissue.name, timepoint=timepoint, timepoint_str=timepoint_str
-                )
-                active_d = dict(
-                    tissue=tissue.name, timepoint=timepoint, timepoint_str=timepoint_str
-                )
-                for gene_name in gene_names:
-                    gene = get_gene(gene_name)
-                    gsi = self.get_gene_state_info(
-                        timepoint=timepoint, delay=0, gene=gene, tissue=tissue
-                    )
-                    level_d[gene_name] = gsi.level
-                    active_d[gene_name] = gsi.active
-                level_rows.append(level_d)
-                active_rows.append(active_d)
-
-        level_df = pd.DataFrame.from_dict(level_rows).set_index("timepoint")
-        active_df = pd.DataFrame.from_dict(active_rows).set_index("timepoint")
+        Each has one row per tissue per timepoint, and one column per gene
+        in 'gene_names' (default: all genes that are set). By default, the
+        index is the timepoint, with 'tissue' and 'timepoint_str' columns;
+        with 'multi_index', the index is (timepoint, tissue) instead.
+        """
+        timepoints, tissue_names, gene_names, rows, arrays = self._get_table(gene_names)
+        level, active, is_float = (x[rows] for x in arrays)
+        t_idx, j_idx = rows
+
+        times = np.array(timepoints, dtype=int)[t_idx]
+        tissue = pd.Categorical.from_codes(j_idx, categories=tissue_names)
+        if multi_index:
+            index = pd.MultiIndex.from_arrays(
+                [times, tissue], names=["timepoint", "tissue"]
+            )
+            labels = {}
+        else:
+            index = pd.Index(times, name="timepoint")
+            timepoint_str = pd.Categorical.from_codes(
+                t_idx, categories=[f"t={tp}" for tp in timepoints]
+            )
+            labels = dict(tissue=tissue, timepoint_str=timepoint_str)
+
+        # levels that were all set as ints stay ints
+        as_int = ~is_float.any(axis=0)
+        level_d = dict(labels)
+        active_d = dict(labels)
+        for k, gene_name in enumerate(gene_names):
+            level_d[gene_name] = level[:, k].astype(int) if as_int[k] else level[:, k]
+            active_d[gene_name] = active[:, k]
+
+        level_df = pd.DataFrame(level_d, index=index)
+        active_df = pd.DataFrame(active_d, index=index)
 
         return level_df, active_df
 
+    def to_long_dataframe(self, gene_names=None):
+        """
+        Convert to a tidy pandas DataFrame, with one row per gene per tissue
+        per timepoint, and columns 'time', 'tissue', 'gene', 'level' and
+        'active'. Genes are as for to_dataframe.
+        """
+        timepoints, tissue_names, gene_names, rows, arrays = self._get_table(gene_names)
+        level, active, _ = (x[rows] for x in arrays)
+        t_idx, j_idx = rows
+        n_genes = len(gene_names)
+
+        times = np.array(timepoints, dtype=int)[t_idx]
+        return pd.DataFrame(
+            dict(
+                time=np.repeat(times, n_genes),
+                tissue=pd.Categorical.from_codes(
+                    np.repeat(j_idx, n_genes), categories=tissue_names
+                ),
+                gene=pd.Categorical.from_codes(
+                    np.tile(np.arange(n_genes), len(t_idx)), categories=gene_names
+                ),
+                level=level.reshape(-1),
+                active=active.reshape(-1),
+            )
+        )
+
 
 class Timecourse:
     """
@@ -315,7 +492,16 @@ class Timecourse:
     start and stop.
     """
 
-    def __init__(self, *, start=None, stop=None, trace_fn=None):
+    def __init__(
+        self, *, start=None, stop=None, trace_fn=None, columnar=False, store=None
+    ):
+        """If 'columnar' is set, states are stored in arrays (see
+        dinkum.columnar); it may be True, or the numpy dtype for levels.
+
+        If 'store' is set, states are written straight to an on-disk store
+        (see dinkum.store): either a new directory, or an existing store,
+        which is cleared on each run.
+        """
         assert start is not None
         assert stop is not None
 
@@ -325,6 +511,8 @@ class Timecourse:
         self.stop = stop
         self.states_d = TissueGeneStates()
         self.trace_fn = trace_fn
+        self.columnar = columnar
+        self.store = store
 
     def reset(self):
         self.states_d = TissueGeneStates()
@@ -338,7 +526,124 @@ class Timecourse:
     def __len__(self):
         return len(self.states_d)
 
-    def run(self, *, verbose=False):
+    def run(self, *, verbose=False, stop_fn=None, processes=1, threads=1):
+        """Run the time course.
+
+        If 'stop_fn' is given, it is called with each timepoint's new state,
+        and the run stops early if it returns True.
+
+        With 'processes' > 1, tissues are partitioned across that many
+        worker processes (see dinkum.partition), with identical results;
+        None uses all CPUs. With 'threads' > 1, the tissues (of each
+        process) are advanced by a pool of that many threads, and merged
+        in tissue order. Runs with a trace_fn are always serial.
+        """
+        if self.trace_fn:
+            processes = threads = 1
+        if not len(self.states_d):
+            self.states_d = self._make_states()
+
+        try:
+            self._run(
+                verbose=verbose, stop_fn=stop_fn, processes=processes, threads=threads
+            )
+        finally:
+            flush = getattr(self.states_d, "flush", None)
+            if flush is not None:
+                flush()
+
+    def _make_states(self):
+        "Return the (empty) container to store this run's states in."
+        timepoints = range(self.start, self.stop + 1)
+        if self.store is not None:
+            from dinkum import store
+
+            if isinstance(self.store, (str, os.PathLike)):
+                params = dict(start=self.start, stop=self.stop)
+                self.store = store.create_store(
+                    self.store, timepoints=timepoints, params=params
+                )
+            else:
+                self.store.check_run(timepoints)
+                self.store.clear()
+            return self.store
+
+        if self.columnar:
+            from dinkum.columnar import ColumnarTissueGeneStates
+
+            kw = {} if self.columnar is True else dict(level_dtype=self.columnar)
+            return ColumnarTissueGeneStates(timepoints=timepoints, **kw)
+
+        return TissueGeneStates()
+
+    def _run(self, *, verbose, stop_fn, processes, threads):
+        if processes == 1:
+            return self._run_in_process(
+                verbose=verbose, stop_fn=stop_fn, threads=threads
+            )
+
+        from dinkum import partition
+
+        return partition.run_partitioned(
+            self, processes=processes, verbose=verbose, stop_fn=stop_fn, threads=threads
+        )
+
+    @staticmethod
+    def _get_rules_by_tissue(tissues):
+        """Return {tissue name: rules}, skipping is_present rules for other
+        tissues, which have no opinion there."""
+        rules_by_tissue = {t.name: [] for t in tissues}
+        for r in vfg.get_rules():
+            if isinstance(r, vfg.Interaction_IsPresent):
+                if r.tissue.name in rules_by_tissue:
+                    rules_by_tissue[r.tissue.name].append(r)
+            else:
+                for rules in rules_by_tissue.values():
+                    rules.append(r)
+        return rules_by_tissue
+
+    def _advance_tissue(self, tp, tissue, rules):
+        """Compute the gene states of 'tissue' at 'tp' from the earlier states.
+
+        Only reads shared state, so may be called from several threads.
+        """
+        next_active = OnlyGeneStates()
+        trace_fn = self.trace_fn
+        for r in rules:
+            # advance state of all genes based on last state
+            for gene, state_info in r.advance(
+                timepoint=tp, states=self.states_d, tissue=tissue
+            ):
+
+                next_active.set_gene_state(gene=gene, state_info=state_info)
+                if trace_fn:
+                    trace_fn(tp=tp, tissue=tissue, gene=gene, state_info=state_info)
+
+        return next_active
+
+    def _advance_tissues(self, tp, tissues, rules_by_tissue, *, pool=None, threads=1):
+        """Return the gene states of each of 'tissues' at 'tp', in order,
+        computed in 'threads' blocks by the thread 'pool' if given."""
+
+        def advance_block(block):
+            return [
+                self._advance_tissue(tp, tissue, rules_by_tissue[tissue.name])
+                for tissue in block
+            ]
+
+        if pool is None:
+            return advance_block(tissues)
+
+        n_blocks = min(threads, len(tissues))
+        size = -(-len(tissues) // max(n_blocks, 1))
+        blocks = [tissues[i : i + size] for i in range(0, len(tissues), size)]
+
+        results = []
+        for block_results in pool.map(advance_block, blocks):
+            results.extend(block_results)
+        return results
+
+    def _run_in_process(self, *, verbose=False, stop_fn=None, threads=1):
         start = self.start
         stop = self.stop
 
@@ -349,34 +654,35 @@ class Timecourse:
                 print(f"\ttissue {t.name}")
             print("")
 
+        # build shared lookups before any threads start
+        rules_by_tissue = self._get_rules_by_tissue(tissues)
+        vfn.get_neighbor_graph()
+
+        pool = None
+        if threads > 1:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
         # advance one tick at a time
-        this_state = {}
-        trace_fn = self.trace_fn
-        for tp in range(start, stop + 1):
-            next_state = TissueAndGeneStateAtTime(tissues=tissues, time=tp)
-
-            for tissue in tissues:
-                seen = set()
-                next_active = OnlyGeneStates()
-                for r in vfg.get_rules():
-                    # advance state of all genes based on last state
-                    for gene, state_info in r.advance(
-                        timepoint=tp, states=self.states_d, tissue=tissue
-                    ):
-
-                        next_active.set_gene_state(gene=gene, state_info=state_info)
-                        if trace_fn:
-                            trace_fn(
-                                tp=tp, tissue=tissue, gene=gene, state_info=state_info
-                            )
-
-                next_state[tissue] = next_active
-                if verbose:
-                    print(tp, tissue.name, next_active)
-
-            # advance => next state
-            self.states_d[tp] = next_state
-            this_state = next_state
+        try:
+            for tp in range(start, stop + 1):
+                next_state = TissueAndGeneStateAtTime(tissues=tissues, time=tp)
+
+                results = self._advance_tissues(
+                    tp, tissues, rules_by_tissue, pool=pool, threads=threads
+                )
+                for tissue, next_active in zip(tissues, results):
+                    next_state[tissue] = next_active
+                    if verbose:
+                        print(tp, tissue.name, next_active)
+
+                # advance => next state
+                self.states_d[tp] = next_state
+
+                if stop_fn is not None and stop_fn(next_state):
+                    break
+        finally:
+            if pool is not None:
+                pool.shutdown()
 
     def check(self):
         "Test all of the observations for all of the states."
@@ -388,20 +694,36 @@ class Timecourse:
         return self.states_d
 
 
-def _run(*, start, stop, trace_fn=None, verbose=False):
-    "Run a time course. No output by default."
-    tc = Timecourse(start=start, stop=stop, trace_fn=trace_fn)
-    tc.run(verbose=verbose)
+def _run(*, start, stop, trace_fn=None, verbose=False, use_cache=True):
+    """Run a time course. No output by default.
+
+    The result is fetched from, or stored in, the result cache if it is
+    enabled, unless 'use_cache' is False; runs with a trace_fn are never
+    cached.
+    """
+    from dinkum import cache
+
+    if use_cache and trace_fn is None and cache.is_enabled():
+        tc = cache.run(start=start, stop=stop, verbose=verbose)
+    else:
+        tc = Timecourse(start=start, stop=stop, trace_fn=trace_fn)
+        tc.run(verbose=verbose)
     tc.check()
     return tc
 
 
-def run(start, stop, *, verbose=False, trace_fn=None):
+def run(start, stop, *, verbose=False, trace_fn=None, use_cache=True):
     """Run a time course in 'headless' mode - minimal output.
 
     Use for Python script/test execution.
     """
-    tc = _run(start=start, stop=stop, verbose=verbose, trace_fn=trace_fn)
+    tc = _run(
+        start=start,
+        stop=stop,
+        verbose=verbose,
+        trace_fn=trace_fn,
+        use_cache=use_cache,
+    )
 
     for state in tc:
         print(f"time={state.time}")
@@ -414,3 +736,13 @@ def run(start, stop, *, verbose=False, trace_fn=None):
     tc.check()
 
     return tc
+
+
+def compile(*, verbose=False):
+    """Compile the current model into a specialized simulation kernel, and
+    return it as a dinkum.codegen.CompiledModel; run it with
+    .run(start=..., stop=...).
+    """
+    from dinkum import codegen
+
+    return codegen.compile(verbose=verbose)
@@ -0,0 +1,187 @@
+"""approximate Bayesian computation against qualitative observations.
+
+ABC-SMC (sequential Monte Carlo) over the parameter space exposed by
+get_params of the given fit genes, with a uniform prior over the
+parameter bounds. The distance between a simulation and the data is the
+fraction of observations that fail, or optionally the mean graded
+per-observation distance.
+
+Each simulation stops as soon as its distance exceeds the current
+tolerance, since more timepoints can only make it worse.
+"""
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+import dinkum
+from dinkum import observations, parallel
+from dinkum.vfg_functions import ParameterMap
+from dinkum.sensitivity import get_param_bounds
+
+ABCPopulation = collections.namedtuple(
+    "ABCPopulation", ["particles", "weights", "distances", "epsilon", "n_simulations"]
+)
+
+
+def _make_distance_fn(start, stop, *, pmap, vary_index, graded):
+    """Return fn((values, epsilon)) that runs the model and returns the
+    distance, stopping early once it exceeds epsilon."""
+    tc = dinkum.Timecourse(start=start, stop=stop)
+    base_values = pmap.values.copy()
+
+    def calc_distance(item):
+        values, epsilon = item
+        params = base_values.copy()
+        params[vary_index] = values
+        pmap.set_values(params)
+
+        checker = observations.ObservationChecker()
+
+        def stop_fn(state):
+            checker.check(state)
+            return checker.distance(graded=graded) > epsilon
+
+        tc.reset()
+        tc.run(stop_fn=stop_fn)
+        return checker.distance(graded=graded)
+
+    return calc_distance
+
+
+def _kernel_density(x, centers, weights, chol):
+    "Weighted sum of Gaussian kernels (covariance chol @ chol.T) at each x."
+    inv = np.linalg.inv(chol)
+    z = (x[:, None, :] - centers[None, :, :]) @ inv.T
+    return np.exp(-0.5 * np.sum(z * z, axis=2)) @ weights
+
+
+def run_abc_smc(
+    start,
+    stop,
+    *,
+    fit_genes,
+    n_particles=100,
+    n_generations=5,
+    bounds=None,
+    quantile=0.5,
+    min_epsilon=0.0,
+    graded=False,
+    max_simulations=100000,
+    seed=None,
+    processes=None,
+    batch_size=None,
+):
+    """Sample the posterior of the fit genes' parameters by ABC-SMC.
+
+    The first population is drawn from the prior (uniform over the
+    parameter bounds, optionally overridden by 'bounds'). Each later
+    population perturbs particles from the previous one with a Gaussian
+    kernel, keeping those within a tolerance set at the 'quantile' of the
+    previous population's distances. Stops after 'n_generations', once the
+    tolerance reaches 'min_epsilon', or after 'max_simulations' proposals;
+    proposals outside the bounds count toward it, though they aren't run.
+
+    Proposals are evaluated 'batch_size' at a time (by default,
+    n_particles) across worker processes.
+
+    Returns a list of ABCPopulation, one per generation; 'particles' is a
+    DataFrame with one column per parameter. The fit genes' parameters
+    are left at the weighted posterior mean of the last population.
+    """
+    assert 0 < quantile <= 1
+    rng = np.random.default_rng(seed)
+    pmap = ParameterMap(fit_genes)
+    names, lower, upper = get_param_bounds(pmap, bounds)
+    vary_index = np.array([pmap.index[name] for name in names], dtype=int)
+    k = len(names)
+    if batch_size is None:
+        batch_size = n_particles
+
+    calc_distance = _make_distance_fn(
+        start, stop, pmap=pmap, vary_index=vary_index, graded=graded
+    )
+
+    populations = []
+    n_total = 0
+    with parallel.WorkerPool(calc_distance, processes=processes) as pool:
+        epsilon = np.inf
+        prev = None
+        for generation in range(n_generations):
+            if prev is not None:
+                epsilon = np.quantile(prev.distances, quantile)
+                # distances are often discrete; make sure the tolerance shrinks
+                max_d = prev.distances.max()
+                lower_d = prev.distances[prev.distances < max_d]
+                if epsilon >= max_d and len(lower_d):
+                    epsilon = lower_d.max()
+                epsilon = max(epsilon, min_epsilon)
+                # twice the weighted covariance of the last population
+                cov = 2 * np.atleast_2d(
+                    np.cov(prev_x, rowvar=False, aweights=prev.weights)
+                )
+                cov += np.eye(k) * 1e-12 * (upper - lower) ** 2
+                chol = np.linalg.cholesky(cov)
+
+            accepted_x, accepted_d = [], []
+            n_sims = 0
+            while len(accepted_x) < n_particles:
+                if n_total >= max_simulations:
+                    break
+                n = min(batch_size, max_simulations - n_total)
+                if prev is None:
+                    x = lower + rng.random((n, k)) * (upper - lower)
+                else:
+                    pick = rng.choice(len(prev_x), size=n, p=prev.weights)
+                    x = prev_x[pick] + rng.standard_normal((n, k)) @ chol.T
+                    x = x[np.all((x >= lower) & (x <= upper), axis=1)]
+                n_total += n
+                if not len(x):
+                    continue
+
+                dists = pool.map([(xi, epsilon) for xi in x])
+                n_sims += len(x)
+                for xi, d in zip(x, dists):
+                    if d <= epsilon and len(accepted_x) < n_particles:
+                        accepted_x.append(xi)
+                        accepted_d.append(d)
+
+            if len(accepted_x) < n_particles:
+                print(
+                    f"ABC-SMC: stopping at generation {generation}; "
+                    f"max_simulations={max_simulations} proposals reached"
+                )
+                break
+
+            x = np.array(accepted_x)
+            if prev is None:
+                weights = np.ones(len(x))
+            else:
+                # uniform prior => weight is 1 / proposal density
+                weights = 1 / _kernel_density(x, prev_x, prev.weights, chol)
+            weights /= weights.sum()
+
+            prev = ABCPopulation(
+                particles=pd.DataFrame(x, columns=names),
+                weights=weights,
+                distances=np.array(accepted_d),
+                epsilon=epsilon,
+                n_simulations=n_sims,
+            )
+            prev_x = x
+            populations.append(prev)
+            print(
+                f"ABC-SMC generation {generation}: epsilon={epsilon:.4g}, "
+                f"{n_sims} simulations"
+            )
+
+            if epsilon <= min_epsilon:
+                break
+
+    values = pmap.values.copy()
+    if populations:
+        values[vary_index] = populations[-1].weights @ prev_x
+    pmap.set_values(values)
+
+    return populations
@@ -0,0 +1,313 @@
+"""find the attractors of the Boolean abstraction of the model.
+
+We run the Boolean abstraction up to the last change in the maternal
+inputs (is_present), after which the model no longer depends on time.
+From there, we start many trajectories - every on/off combination of
+the non-maternal genes across tissues, or a random sample of them - and
+run them in batches until each repeats, giving a fixed point (period 1)
+or a limit cycle. Between batches, states are hashed so that
+trajectories that have merged are only explored once.
+
+Initial conditions are split into partitions that are explored in
+parallel worker processes.
+"""
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+from dinkum import vfg, parallel
+from dinkum.boolean import BooleanModel, pack_bits, unpack_bits
+
+Attractor = collections.namedtuple("Attractor", ["states", "period", "basin_size"])
+
+AttractorReport = collections.namedtuple(
+    "AttractorReport", ["tissue_names", "gene_names", "initial", "attractors", "basin"]
+)
+
+
+def get_maternal_gene_names():
+    "Return the names of the genes set by is_present."
+    return sorted(
+        set(
+            ix.dest.name
+            for ix in vfg.get_rules()
+            if isinstance(ix, vfg.Interaction_IsPresent)
+        )
+    )
+
+
+def make_initial_conditions(
+    model, *, free_genes=None, max_exhaustive=2**16, n_samples=10000, seed=None
+):
+    """Return initial conditions for 'model', as a bool array indexed by
+    [condition, tissue, gene].
+
+    Every gene in 'free_genes' (default: all non-maternal genes) is set on
+    or off independently in every tissue. All combinations are returned if
+    there are at most 'max_exhaustive' of them; otherwise, 'n_samples'
+    random combinations.
+    """
+    if free_genes is None:
+        maternal = set(get_maternal_gene_names())
+        free_genes = [name for name in model.gene_names if name not in maternal]
+    free_i = [model.gene_index[name] for name in free_genes]
+
+    n_tissues = len(model.tissue_names)
+    n_bits = len(free_i) * n_tissues
+    if 2**n_bits <= max_exhaustive:
+        idx = np.arange(2**n_bits)
+        bits = ((idx[:, None] >> np.arange(n_bits)) & 1).astype(bool)
+    else:
+        rng = np.random.default_rng(seed)
+        bits = rng.random((n_samples, n_bits)) < 0.5
+
+    initial = np.zeros((len(bits), n_tissues, len(model.gene_names)), dtype=bool)
+    initial[:, :, free_i] = bits.reshape(len(bits), n_tissues, len(free_i))
+    return initial
+
+
+def _state_rows(model, history, timepoints, n):
+    """Hash input: pack each trajectory's (present, active) state at each of
+    'timepoints' into bytes, as a uint8 array [time, condition, byte]."""
+    rows = []
+    for tp in timepoints:
+        if tp in history:
+            present, active = history[tp]
+        else:
+            present = active = model.gene_zeros
+        bits = np.concatenate([unpack_bits(present, n), unpack_bits(active, n)])
+        # (2 * gene, tissue, condition) => (condition, bits)
+        bits = bits.reshape(-1, n).T
+        rows.append(np.packbits(bits, axis=1))
+    return np.array(rows)
+
+
+def _canonical_cycle(rows):
+    "Rotate a cycle (a list of bytes) so that it starts at its smallest state."
+    start = min(range(len(rows)), key=lambda i: rows[i])
+    return tuple(rows[start:] + rows[:start])
+
+
+def _find_cycles(model, start, initial, *, max_steps, max_period, chunk_size):
+    """Return, for each initial condition, its attractor as a canonical
+    tuple of state bytes, or None if no cycle was found."""
+    n = len(initial)
+    w = model.max_delay
+    settle = model.get_settle_time(start)
+
+    # run the maternal inputs up to the point where they stop changing
+    model.set_width(1)
+    history = {}
+    model.advance(range(start, settle + 1), history)
+
+    # then set the free genes from the initial conditions
+    free = initial.any(axis=0)
+    windows = {}
+    for tp in range(settle - w + 1, settle + 1):
+        present, active = history.get(tp, (model.gene_zeros, model.gene_zeros))
+        present = np.repeat(unpack_bits(present, 1), n, axis=2)
+        active = np.repeat(unpack_bits(active, 1), n, axis=2)
+        if tp == settle:
+            bits = initial.transpose(2, 1, 0)
+            present = np.where(free.T[:, :, None], bits, present)
+            active = np.where(free.T[:, :, None], bits, active)
+        windows[tp] = (present, active)
+
+    def pack_windows(index):
+        return {
+            tp: (pack_bits(present[:, :, index]), pack_bits(active[:, :, index]))
+            for tp, (present, active) in windows.items()
+        }
+
+    rows = _state_rows(model, pack_windows(slice(None)), sorted(windows), n)
+    owner = np.arange(n)  # condition => live trajectory, or -1 once resolved
+    results = [None] * n
+    t = settle
+    while t < settle + max_steps and (owner >= 0).any():
+        # trajectories that have merged are explored only once from here on
+        keys = rows[-w:].transpose(1, 0, 2).reshape(rows.shape[1], -1)
+        _, first, inverse = np.unique(
+            keys, axis=0, return_index=True, return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        owner = np.where(owner >= 0, inverse[owner], -1)
+        rows = rows[:, first]
+        windows = {
+            tp: (present[:, :, first], active[:, :, first])
+            for tp, (present, active) in windows.items()
+        }
+        u = len(first)
+
+        k = min(chunk_size, settle + max_steps - t)
+        model.set_width(u)
+        history = pack_windows(slice(None))
+        model.advance(range(t + 1, t + k + 1), history)
+        new_tps = list(range(t + 1, t + k + 1))
+        rows = np.concatenate([rows, _state_rows(model, history, new_tps, u)])
+        t += k
+        windows = {
+            tp: (unpack_bits(history[tp][0], u), unpack_bits(history[tp][1], u))
+            for tp in range(t - w + 1, t + 1)
+        }
+
+        # look for the shortest period p at which the last window repeats
+        last = len(rows) - 1
+        period = np.zeros(u, dtype=int)
+        for p in range(1, max_period + 1):
+            if last - (w - 1) - p < 0:
+                break
+            same = np.ones(u, dtype=bool)
+            for j in range(w):
+                same &= (rows[last - j] == rows[last - j - p]).all(axis=1)
+            period[(period == 0) & same] = p
+
+        for i in np.flatnonzero(period):
+            p = period[i]
+            cycle = [rows[s, i].tobytes() for s in range(last - p + 1, last + 1)]
+            cycle = _canonical_cycle(cycle)
+            for c in np.flatnonzero(owner == i):
+                results[c] = cycle
+
+        # keep going with the unresolved trajectories
+        keep = np.flatnonzero(period == 0)
+        new_index = np.full(u, -1)
+        new_index[keep] = np.arange(len(keep))
+        owner = np.where(owner >= 0, new_index[owner], -1)
+        rows = rows[:, keep]
+        windows = {
+            tp: (present[:, :, keep], active[:, :, keep])
+            for tp, (present, active) in windows.items()
+        }
+
+    return results
+
+
+def _decode_state(model, row):
+    "Return the on genes (present and active) encoded in 'row', as [tissue, gene]."
+    n_genes, n_tissues = len(model.gene_names), len(model.tissue_names)
+    bits = np.unpackbits(np.frombuffer(row, dtype=np.uint8))
+    bits = bits[: 2 * n_genes * n_tissues].astype(bool)
+    present, active = bits.reshape(2, n_genes, n_tissues)
+    return (present & active).T
+
+
+def find_attractors(
+    start=1,
+    *,
+    initial=None,
+    free_genes=None,
+    max_exhaustive=2**16,
+    n_samples=10000,
+    max_steps=100,
+    max_period=None,
+    seed=None,
+    on_level=100,
+    chunk_size=10,
+    processes=None,
+    n_partitions=None,
+):
+    """Find the fixed points and limit cycles of the current model's
+    Boolean abstraction.
+
+    Initial conditions are given by 'initial', indexed by [condition,
+    tissue, gene], or else made by make_initial_conditions. They set the
+    free genes (those that are on in any condition) at the time the
+    maternal inputs stop changing; from there, trajectories run in
+    chunks of 'chunk_size' steps, up to 'max_steps', looking for cycles
+    of length up to 'max_period' (default: max_steps // 2).
+
+    Returns an AttractorReport: 'attractors' is a list of Attractor,
+    ordered by decreasing basin size, where 'states' is a bool array of
+    the on genes, indexed by [step, tissue, gene]; 'basin' gives the
+    index of each initial condition's attractor, or -1 if none was found.
+    """
+    model = BooleanModel(on_level=on_level)
+    if initial is None:
+        initial = make_initial_conditions(
+            model,
+            free_genes=free_genes,
+            max_exhaustive=max_exhaustive,
+            n_samples=n_samples,
+            seed=seed,
+        )
+    initial = np.asarray(initial, dtype=bool)
+    if max_period is None:
+        max_period = max(max_steps // 2, 1)
+
+    if n_partitions is None:
+        n_partitions = parallel.get_num_processes(processes)
+    partitions = [p for p in np.array_split(initial, n_partitions) if len(p)]
+
+    def explore(partition):
+        return _find_cycles(
+            model,
+            start,
+            partition,
+            max_steps=max_steps,
+            max_period=max_period,
+            chunk_size=chunk_size,
+        )
+
+    cycles = []
+    for result in parallel.map_processes(explore, partitions, processes=processes):
+        cycles.extend(result)
+
+    counts = collections.Counter(c for c in cycles if c is not None)
+    ordered = sorted(counts, key=lambda c: (-counts[c], c))
+    index = {c: i for i, c in enumerate(ordered)}
+
+    attractors = []
+    for c in ordered:
+        states = np.array([_decode_state(model, row) for row in c])
+        attractors.append(Attractor(states=states, period=len(c), basin_size=counts[c]))
+    basin = np.array([index.get(c, -1) if c else -1 for c in cycles], dtype=int)
+
+    return AttractorReport(
+        tissue_names=model.tissue_names,
+        gene_names=model.gene_names,
+        initial=initial,
+        attractors=attractors,
+        basin=basin,
+    )
+
+
+def _minimal_cycle(steps):
+    "Reduce a cycle to its shortest repeating unit, canonically rotated."
+    n = len(steps)
+    for p in range(1, n + 1):
+        if n % p == 0 and steps == steps[:p] * (n // p):
+            steps = steps[:p]
+            break
+    start = min(range(len(steps)), key=lambda i: steps[i])
+    return tuple(steps[start:] + steps[:start])
+
+
+def tissue_basins(report, tissue_name):
+    """Summarize the attractors of 'report' as seen in one tissue.
+
+    Returns a DataFrame with one row per distinct attractor within the
+    tissue: 'states' lists the on genes at each step of the cycle, and
+    'basin_size' / 'fraction' count the initial conditions that reach it.
+    """
+    j = report.tissue_names.index(tissue_name)
+    sizes = collections.Counter()
+    for attractor in report.attractors:
+        steps = [
+            tuple(g for g, on in zip(report.gene_names, state[j]) if on)
+            for state in attractor.states
+        ]
+        sizes[_minimal_cycle(steps)] += attractor.basin_size
+
+    rows = []
+    for states, size in sorted(sizes.items(), key=lambda x: (-x[1], x[0])):
+        rows.append(
+            dict(
+                states=states,
+                period=len(states),
+                basin_size=size,
+                fraction=size / len(report.basin),
+            )
+        )
+    return pd.DataFrame(rows, columns=["states", "period", "basin_size", "fraction"])
@@ -0,0 +1,381 @@
+"""Boolean abstraction of the model, simulated with bit-parallel operations.
+
+Each rule is abstracted into truth functions of its inputs, by running it
+on every combination of input genes being present (at 'on_level') or not,
+and active or not. Gene states are then packed into uint64 bitsets, one
+bit per initial condition, so that thousands of trajectories advance
+together using bitwise operations; tissues are a separate array axis, so
+that ligand signaling between neighbors is also bitwise.
+
+The abstraction matches the integer engine exactly on Boolean-exact
+models, where every gene level is either 0 or 'on_level'; use
+check_boolean_exact to verify this for a given model.
+"""
+
+import collections
+import itertools
+
+import numpy as np
+
+import dinkum
+from dinkum import vfg, vfn
+from dinkum import vfg_functions as vf
+from dinkum.exceptions import DinkumNotBoolean
+
+# rule classes whose output depends only on the current input states
+BOOLEAN_CLASSES = (
+    vf.LinearCombination,
+    vf.LogisticActivator,
+    vf.LogisticMultiActivator,
+    vf.LogisticRepressor,
+    vf.LogisticRepressor2,
+    vf.LogisticMultiRepressor,
+)
+
+MAX_INPUT_GENES = 6
+
+_WORD = np.dtype("<u8")
+
+BooleanRun = collections.namedtuple(
+    "BooleanRun", ["timepoints", "tissue_names", "gene_names", "present", "active"]
+)
+
+
+def pack_bits(bits):
+    "Pack a bool array along its last axis into uint64 words."
+    bits = np.asarray(bits, dtype=bool)
+    n_words = -(-bits.shape[-1] // 64)
+    padded = np.zeros(bits.shape[:-1] + (n_words * 64,), dtype=bool)
+    padded[..., : bits.shape[-1]] = bits
+    packed = np.packbits(padded, axis=-1, bitorder="little")
+    return np.ascontiguousarray(packed).view(_WORD)
+
+
+def unpack_bits(words, n):
+    "Unpack uint64 words along the last axis into 'n' bools."
+    words = np.ascontiguousarray(words, dtype=_WORD)
+    bits = np.unpackbits(words.view(np.uint8), axis=-1, bitorder="little")
+    return bits[..., :n].astype(bool)
+
+
+def _build_node(table, var, unique):
+    """Reduce a truth table over variables var, var+1, ... into a decision
+    diagram: True, False, or a shared (var, if_true, if_false) node."""
+    if table.all():
+        return True
+    if not table.any():
+        return False
+
+    if_true = _build_node(table[1], var + 1, unique)
+    if_false = _build_node(table[0], var + 1, unique)
+    if if_true == if_false:
+        return if_true
+    key = (var, if_true, if_false)
+    return unique.setdefault(key, key)
+
+
+def _eval_node(node, inputs, ones, memo):
+    "Evaluate a decision diagram on packed 'inputs', one array per variable."
+    if node is True:
+        return ones
+    if node is False:
+        return np.zeros_like(ones)
+
+    result = memo.get(id(node))
+    if result is None:
+        var, if_true, if_false = node
+        x = inputs[var]
+        if if_true is True and if_false is False:
+            result = x
+        elif if_true is False and if_false is True:
+            result = ~x
+        elif if_false is False:
+            result = x & _eval_node(if_true, inputs, ones, memo)
+        elif if_true is True:
+            result = x | _eval_node(if_false, inputs, ones, memo)
+        else:
+            t = _eval_node(if_true, inputs, ones, memo)
+            f = _eval_node(if_false, inputs, ones, memo)
+            result = (x & t) | (~x & f)
+        memo[id(node)] = result
+    return result
+
+
+class _TableStates:
+    "Stand-in for TissueGeneStates, holding one combination of input states."
+
+    def __init__(self, gene_states, ligand_present):
+        self.gene_states = gene_states
+        self.ligand_present = ligand_present
+
+    def __bool__(self):
+        return True
+
+    def get_gene_state_info(self, *, timepoint, delay=0, gene, tissue):
+        return self.gene_states.get(gene.name, vfg.DEFAULT_OFF)
+
+    def get(self, timepoint):
+        return self
+
+    def get_ligand_levels(self):
+        n = len(vfn.get_neighbor_graph())
+        level = np.inf if self.ligand_present else 0.0
+        return {ligand: np.full(n, level) for ligand in vfg.get_ligands()}
+
+
+def _get_ligand(gene):
+    "Return the ligand a receptor listens to, or None."
+    if gene.is_receptor:
+        return getattr(gene, "_set_ligand", None)
+    return None
+
+
+class _PresentRule:
+    "Abstraction of Interaction_IsPresent."
+
+    def __init__(self, ix, model):
+        self.gene_i = model.gene_index[ix.dest.name]
+        self.tissue_i = model.tissue_index[ix.tissue.name]
+        self.start = ix.start
+        self.duration = ix.duration
+        self.present = ix.level > 0
+        self.ligand = _get_ligand(ix.dest)
+        self.delay = 1
+
+    def apply(self, tp, model, history, present, active):
+        if tp < self.start:
+            return
+        if self.duration is not None and tp >= self.start + self.duration:
+            return
+
+        row = self.tissue_i
+        present[self.gene_i, row] = model.ones[row] if self.present else 0
+        if self.ligand is not None:
+            lig = model.ligand_on(self.ligand, history.get(tp - self.delay))
+            active[self.gene_i, row] = lig[row]
+        else:
+            active[self.gene_i, row] = model.ones[row]
+
+
+class _TruthRule:
+    "Abstraction of a rule with no time or tissue dependence, as truth functions."
+
+    def __init__(self, ix, model, on_level):
+        if isinstance(ix, vfg.Interaction_Custom):
+            delay = ix.delay
+            dest = ix.dest
+        elif isinstance(ix, vfg.Interaction_CustomObj) and isinstance(
+            ix.obj, BOOLEAN_CLASSES
+        ):
+            delay = ix.obj.delay
+            dest = ix.obj.target
+        else:
+            raise DinkumNotBoolean(f"cannot abstract rule {ix} for {ix.dest}")
+
+        input_names = list(dict.fromkeys(ix.get_input_gene_names()))
+        if len(input_names) > MAX_INPUT_GENES:
+            raise DinkumNotBoolean(
+                f"rule for {dest.name} has more than {MAX_INPUT_GENES} inputs"
+            )
+
+        self.gene_i = model.gene_index[dest.name]
+        self.delay = delay
+        self.input_i = [model.gene_index[name] for name in input_names]
+        self.ligand = _get_ligand(dest)
+        self.is_receptor = dest.is_receptor
+
+        # variables: (present, active) for each input, then ligand if receptor
+        n_vars = 2 * len(input_names) + (1 if dest.is_receptor else 0)
+        tables = np.zeros((3,) + (2,) * n_vars, dtype=bool)
+        tissue = vfn.get_tissues()[0]
+        for combo in itertools.product([0, 1], repeat=n_vars):
+            gene_states = {}
+            for n, name in enumerate(input_names):
+                level = on_level if combo[2 * n] else 0
+                gene_states[name] = vfg.GeneStateInfo(level, bool(combo[2 * n + 1]))
+            ligand_present = bool(combo[-1]) if dest.is_receptor else True
+
+            states = _TableStates(gene_states, ligand_present)
+            for gene, gsi in ix.advance(timepoint=1, states=states, tissue=tissue):
+                tables[(0,) + combo] = True
+                tables[(1,) + combo] = gsi.level > 0
+                tables[(2,) + combo] = bool(gsi.active)
+
+        unique = {}
+        self.writes, self.present, self.active = [
+            _build_node(t, 0, unique) for t in tables
+        ]
+
+    def apply(self, tp, model, history, present, active):
+        prev = history.get(tp - self.delay)
+        if prev is None:
+            prev_present = prev_active = model.gene_zeros
+        else:
+            prev_present, prev_active = prev
+
+        inputs = []
+        for i in self.input_i:
+            inputs.append(prev_present[i])
+            inputs.append(prev_active[i])
+        if self.is_receptor:
+            inputs.append(model.ligand_on(self.ligand, prev))
+
+        memo = {}
+        writes = _eval_node(self.writes, inputs, model.ones, memo)
+        p = _eval_node(self.present, inputs, model.ones, memo)
+        a = _eval_node(self.active, inputs, model.ones, memo)
+
+        i = self.gene_i
+        present[i] = (writes & p) | (~writes & present[i])
+        active[i] = (writes & a) | (~writes & active[i])
+
+
+class BooleanModel:
+    """The Boolean abstraction of the current model.
+
+    Raises DinkumNotBoolean if any rule depends on time or tissue in a
+    way that cannot be abstracted (e.g. GeneTimecourse, Decay, Growth).
+    """
+
+    def __init__(self, *, on_level=100):
+        self.on_level = on_level
+        self.genes = [vfg.get_gene(name) for name in vfg.get_gene_names()]
+        self.gene_names = [g.name for g in self.genes]
+        self.gene_index = {name: i for i, name in enumerate(self.gene_names)}
+        self.tissues = vfn.get_tissues()
+        self.tissue_names = [t.name for t in self.tissues]
+        self.tissue_index = {name: i for i, name in enumerate(self.tissue_names)}
+
+        # for each tissue, the tissues whose ligands it can see
+        self.graph = vfn.get_neighbor_graph()
+        for g in self.genes:
+            if g.is_receptor and getattr(g, "threshold", 0) > 0:
+                raise DinkumNotBoolean(
+                    f"receptor {g.name} depends on the ligand level, not presence"
+                )
+
+        self.rules = []
+        for ix in vfg.get_rules():
+            if isinstance(ix, vfg.Interaction_IsPresent):
+                self.rules.append(_PresentRule(ix, self))
+            else:
+                self.rules.append(_TruthRule(ix, self, on_level))
+
+        # how many past timepoints each step reads
+        self.max_delay = max([r.delay for r in self.rules], default=1)
+
+    def get_settle_time(self, start):
+        "Return the time after which no rule depends on the time any more."
+        settle = start
+        for r in self.rules:
+            if isinstance(r, _PresentRule):
+                settle = max(settle, r.start)
+                if r.duration is not None:
+                    settle = max(settle, r.start + r.duration)
+        return settle
+
+    def set_width(self, n_conditions):
+        "Set the number of trajectories that 'advance' works on."
+        n_words = -(-n_conditions // 64)
+        n_tissues = len(self.tissues)
+        self.ones = np.full((n_tissues, n_words), np.iinfo(np.uint64).max, _WORD)
+        self.gene_zeros = np.zeros((len(self.genes), n_tissues, n_words), _WORD)
+
+    def ligand_on(self, ligand, prev):
+        "Per tissue, whether 'ligand' was on in any neighbor, as packed bits."
+        result = np.zeros_like(self.ones)
+        if prev is None or ligand is None or ligand.name not in self.gene_index:
+            return result
+
+        prev_present, prev_active = prev
+        i = self.gene_index[ligand.name]
+        on = prev_present[i] & prev_active[i]
+        return self.graph.signal(
+            on,
+            juxtacrine=getattr(ligand, "is_juxtacrine", False),
+            range=getattr(ligand, "range", 1),
+            attenuation=getattr(ligand, "attenuation", 1.0),
+        )
+
+    def advance(self, timepoints, history):
+        """Advance packed states through 'timepoints', in place.
+
+        'history' maps timepoint to (present, active) uint64 arrays indexed
+        by [gene, tissue, word]; missing timepoints are all off.
+        """
+        for tp in timepoints:
+            present = self.gene_zeros.copy()
+            active = self.gene_zeros.copy()
+            for rule in self.rules:
+                rule.apply(tp, self, history, present, active)
+            history[tp] = (present, active)
+
+    def run(self, start, stop, *, initial=None):
+        """Run all trajectories from 'start' to 'stop'.
+
+        'initial' optionally gives the genes that are on (present and
+        active) at time start - 1, as a bool array indexed by [condition,
+        tissue, gene]; each condition is a separate trajectory. By
+        default, there is a single trajectory starting with everything
+        off, as with Timecourse.
+
+        Returns a BooleanRun, with 'present' (level > 0) and 'active'
+        bool arrays indexed by [timepoint, condition, tissue, gene].
+        """
+        n_genes, n_tissues = len(self.genes), len(self.tissues)
+        history = {}
+        if initial is None:
+            n_conditions = 1
+        else:
+            initial = np.asarray(initial, dtype=bool)
+            assert initial.shape[1:] == (n_tissues, n_genes), initial.shape
+            n_conditions = initial.shape[0]
+            packed = pack_bits(initial.transpose(2, 1, 0))
+            history[start - 1] = (packed, packed.copy())
+
+        self.set_width(n_conditions)
+
+        timepoints = list(range(start, stop + 1))
+        self.advance(timepoints, history)
+
+        def unpack(k):
+            arr = np.array([history[tp][k] for tp in timepoints])
+            # (time, gene, tissue, condition) => (time, condition, tissue, gene)
+            return unpack_bits(arr, n_conditions).transpose(0, 3, 2, 1)
+
+        return BooleanRun(
+            timepoints=timepoints,
+            tissue_names=self.tissue_names,
+            gene_names=self.gene_names,
+            present=unpack(0),
+            active=unpack(1),
+        )
+
+
+def run_boolean(start, stop, *, initial=None, on_level=100):
+    "Build the Boolean abstraction of the current model and run it."
+    return BooleanModel(on_level=on_level).run(start, stop, initial=initial)
+
+
+def check_boolean_exact(start, stop, *, on_level=100):
+    """Compare the Boolean abstraction with the integer engine.
+
+    Returns a list of (timepoint, tissue_name, gene_name) where the two
+    disagree on whether a gene is present or active; an empty list
+    means the model is Boolean-exact over this time range.
+    """
+    brun = run_boolean(start, stop, on_level=on_level)
+
+    tc = dinkum.Timecourse(start=start, stop=stop)
+    tc.run()
+    _, level, active = tc.get_states().to_arrays(
+        timepoints=brun.timepoints,
+        tissue_names=brun.tissue_names,
+        gene_names=brun.gene_names,
+    )
+
+    differ = ((level > 0) != brun.present[:, 0]) | (active != brun.active[:, 0])
+    return [
+        (brun.timepoints[t], brun.tissue_names[j], brun.gene_names[k])
+        for t, j, k in zip(*np.nonzero(differ))
+    ]
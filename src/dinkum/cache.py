@@ -0,0 +1,391 @@
+"""an opt-in disk cache of time course results.
+
+The current model - genes, tissues, the neighbor graph, and each rule's
+class and parameters, including the source code of custom functions and
+classes and the defaults, closure variables and globals they read - is
+hashed canonically. Together with (start, stop), the hash keys a result
+kept in the cache directory as a store (see dinkum.store), which is
+reopened, memory-mapped, when the same run is asked for again.
+
+The cache is off by default. Turn it on with
+
+    dinkum.cache.enable("~/.cache/dinkum", max_bytes=2**30)
+
+or by setting the DINKUM_CACHE_DIR environment variable (and optionally
+DINKUM_CACHE_MAX_BYTES). Once the cache holds more than 'max_bytes',
+the least recently used results are evicted. Bypass it for a single run
+with run_and_display_df(..., use_cache=False), or for a block of code
+with 'with dinkum.cache.bypass(): ...'.
+
+Models whose custom functions have no retrievable source code, or read
+values that can't be hashed, are never cached.
+"""
+
+import contextlib
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import types
+
+import numpy as np
+
+import dinkum
+from dinkum import vfg, vfn, store
+from dinkum.columnar import ColumnarStateAtTime, ColumnarTissueGeneStates
+
+FORMAT_VERSION = 1
+DEFAULT_MAX_BYTES = 2**30
+
+_cache_dir = None
+_max_bytes = None
+_enabled = None  # None => follow DINKUM_CACHE_DIR
+_bypass = 0
+
+
+class _Unhashable(Exception):
+    pass
+
+
+def enable(path=None, *, max_bytes=None):
+    """Cache results in the directory 'path' (default: DINKUM_CACHE_DIR,
+    or ~/.cache/dinkum), keeping at most 'max_bytes' of them."""
+    global _cache_dir, _max_bytes, _enabled
+    if path is None:
+        path = os.environ.get("DINKUM_CACHE_DIR", "~/.cache/dinkum")
+    _cache_dir = os.path.expanduser(path)
+    _max_bytes = max_bytes
+    _enabled = True
+
+
+def disable():
+    "Stop caching results, whatever DINKUM_CACHE_DIR says."
+    global _enabled
+    _enabled = False
+
+
+def get_cache_dir():
+    "Return the cache directory, or None if the cache is not enabled."
+    if _enabled is False or _bypass:
+        return None
+    if _enabled:
+        return _cache_dir
+    path = os.environ.get("DINKUM_CACHE_DIR")
+    if path:
+        return os.path.expanduser(path)
+    return None
+
+
+def get_max_bytes():
+    if _enabled and _max_bytes is not None:
+        return _max_bytes
+    return int(os.environ.get("DINKUM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+def is_enabled():
+    return get_cache_dir() is not None
+
+
+@contextlib.contextmanager
+def bypass():
+    "Neither read nor write the cache within this block."
+    global _bypass
+    _bypass += 1
+    try:
+        yield
+    finally:
+        _bypass -= 1
+
+
+def _get_source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        raise _Unhashable(f"no source code for {obj!r}")
+
+
+def _is_dinkum(cls):
+    "Is 'cls' part of dinkum itself (and so covered by its version)?"
+    module = cls.__module__ or ""
+    return module == "dinkum" or module.startswith("dinkum.")
+
+
+def _get_global_names(code):
+    "Return the names that 'code', and the code nested in it, may read as globals."
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _get_global_names(const)
+    return names
+
+
+def _encode_function(fn, seen):
+    """Identify the function 'fn' by its source, and by the values it
+    closes over: defaults, closure cells, and the globals it reads."""
+    encoded = ["function", fn.__module__, fn.__qualname__]
+    if id(fn) in seen:
+        return encoded  # recursion; the source is already encoded
+    seen = seen + (id(fn),)
+
+    cells = []
+    for name, cell in zip(fn.__code__.co_freevars, fn.__closure__ or ()):
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            raise _Unhashable(f"{fn!r} has an unbound closure variable '{name}'")
+        cells.append([name, _encode(contents, seen)])
+
+    fn_globals = []
+    for name in sorted(_get_global_names(fn.__code__)):
+        if name in fn.__globals__:
+            fn_globals.append([name, _encode(fn.__globals__[name], seen)])
+
+    return encoded + [
+        _get_source(fn),
+        _encode(fn.__defaults__, seen),
+        _encode(fn.__kwdefaults__, seen),
+        cells,
+        fn_globals,
+    ]
+
+
+def _encode_class(cls, seen=()):
+    """Identify 'cls' by name and, unless it is a builtin or part of
+    dinkum, by its methods and class attributes."""
+    encoded = [cls.__module__, cls.__qualname__]
+    if id(cls) in seen:
+        return encoded
+    seen = seen + (id(cls),)
+
+    for base in cls.__mro__:
+        if base is object or base.__module__ == "builtins" or _is_dinkum(base):
+            continue
+        for name, attr in sorted(vars(base).items()):
+            attr = getattr(attr, "__func__", attr)  # static/class methods
+            if isinstance(attr, types.FunctionType):
+                value = _encode_function(attr, seen)
+            elif isinstance(attr, property):
+                value = [_encode(f, seen) for f in (attr.fget, attr.fset, attr.fdel)]
+            elif name.startswith("__") and name.endswith("__"):
+                continue
+            else:
+                value = _encode(attr, seen)
+            encoded.append([base.__qualname__, name, value])
+    return encoded
+
+
+def _encode(value, seen=()):
+    "Return a JSON-serializable encoding of 'value', for hashing."
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return [type(value).__name__, repr(value)]
+    if isinstance(value, np.generic):
+        return _encode(value.item(), seen)
+    if isinstance(value, vfg.Gene):
+        return ["gene", value.name]
+    if isinstance(value, vfn.Tissue):
+        return ["tissue", value.name]
+    if isinstance(value, np.ndarray):
+        return ["ndarray", value.dtype.str, list(value.shape), value.tolist()]
+    if isinstance(value, type):
+        return ["class", _encode_class(value, seen)]
+    if isinstance(value, types.ModuleType):
+        return ["module", value.__name__]
+    if isinstance(value, types.BuiltinFunctionType):
+        return ["builtin", value.__module__, value.__qualname__]
+    if isinstance(value, types.FunctionType):
+        return _encode_function(value, seen)
+
+    if id(value) in seen:
+        raise _Unhashable(f"{value!r} refers to itself")
+    seen = seen + (id(value),)
+
+    if isinstance(value, types.MethodType):
+        return ["method", _encode(value.__func__, seen), _encode(value.__self__, seen)]
+    if isinstance(value, functools.partial):
+        args = [_encode(x, seen) for x in value.args]
+        keywords = _encode(value.keywords, seen)
+        return ["partial", _encode(value.func, seen), args, keywords]
+    if isinstance(value, (list, tuple)):
+        return [type(value).__name__, [_encode(x, seen) for x in value]]
+    if isinstance(value, (set, frozenset)):
+        items = [_encode(x, seen) for x in value]
+        return [type(value).__name__, sorted(items, key=json.dumps)]
+    if isinstance(value, dict):
+        items = [[_encode(k, seen), _encode(v, seen)] for k, v in value.items()]
+        return ["dict", sorted(items, key=json.dumps)]
+    if hasattr(value, "__dict__"):
+        return ["object", _encode_class(type(value), seen), _encode(vars(value), seen)]
+
+    raise _Unhashable(f"can't hash {value!r}")
+
+
+def _encode_model():
+    from dinkum import vfg_functions
+
+    graph = vfn.get_neighbor_graph()
+    adjacency = graph.adjacency.tocsr()
+    genes = sorted(vfg._genes)
+
+    return dict(
+        genes=[[_encode_class(type(g)), _encode(vars(g))] for g in genes],
+        tissues=graph.tissue_names,
+        lattices=[repr(lattice) for lattice in vfn._lattices],
+        neighbors=[adjacency.indptr.tolist(), adjacency.indices.tolist()],
+        rules=[[_encode_class(type(r)), _encode(vars(r))] for r in vfg.get_rules()],
+        continuous=vfg_functions._continuous,
+    )
+
+
+def model_hash():
+    """Return a sha256 hex digest of the current model, or None if it
+    can't be hashed reliably (e.g. a custom function has no source)."""
+    try:
+        encoded = _encode_model()
+    except _Unhashable:
+        return None
+    data = json.dumps(encoded, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_key(start, stop):
+    "Return the cache key for running the current model from start to stop."
+    h = model_hash()
+    if h is None:
+        return None
+    ident = [FORMAT_VERSION, dinkum.__version__, h, int(start), int(stop)]
+    return hashlib.sha256(json.dumps(ident).encode("utf-8")).hexdigest()
+
+
+def _get_size(entry):
+    "Return the total size of the files in the directory 'entry'."
+    return sum(
+        os.path.getsize(os.path.join(entry, filename)) for filename in os.listdir(entry)
+    )
+
+
+def _to_memory(states):
+    "Copy stored states into an in-memory ColumnarTissueGeneStates."
+    copy = ColumnarTissueGeneStates(
+        timepoints=states.timepoints,
+        tissue_names=states.tissue_names,
+        gene_names=states.gene_names,
+        level_dtype=states.level.dtype,
+    )
+    for name in store.ARRAY_NAMES:
+        getattr(copy, name)[...] = getattr(states, name)
+    for tp in states:
+        copy.data[tp] = ColumnarStateAtTime(copy, tp, copy.time_index[tp])
+    return copy
+
+
+def _get_entries(path):
+    "Return (last used, bytes, entry path) for each cached result, oldest first."
+    entries = []
+    for name in os.listdir(path):
+        entry = os.path.join(path, name)
+        if name.endswith(".tmp") or not os.path.isdir(entry):
+            continue
+        try:
+            used = os.stat(entry).st_mtime
+            size = _get_size(entry)
+        except FileNotFoundError:
+            continue  # evicted by another process
+        entries.append((used, size, entry))
+    return sorted(entries)
+
+
+def evict(max_bytes=None):
+    "Remove the least recently used results until the cache fits 'max_bytes'."
+    path = get_cache_dir()
+    if path is None or not os.path.isdir(path):
+        return
+    if max_bytes is None:
+        max_bytes = get_max_bytes()
+
+    entries = _get_entries(path)
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def clear():
+    "Remove all cached results."
+    path = get_cache_dir()
+    if path is not None and os.path.isdir(path):
+        for name in os.listdir(path):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def get(key):
+    "Return the cached states for 'key', or None."
+    entry = os.path.join(get_cache_dir(), key)
+    try:
+        states = store.open_store(entry)
+        os.utime(entry)  # mark as recently used
+    except FileNotFoundError:
+        return None
+    return states
+
+
+def run(*, start, stop, verbose=False):
+    """Run a Timecourse from start to stop, or fetch its result from the
+    cache; the cache must be enabled. Returns the Timecourse."""
+    from dinkum import Timecourse
+
+    path = get_cache_dir()
+    assert path is not None, "the cache is not enabled"
+
+    key = get_key(start, stop)
+    if key is None:
+        if verbose:
+            print("model can't be hashed; not using the cache")
+        tc = Timecourse(start=start, stop=stop)
+        tc.run(verbose=verbose)
+        return tc
+
+    states = get(key)
+    if states is not None:
+        if verbose:
+            print(f"using cached result {key}")
+        tc = Timecourse(start=start, stop=stop)
+        tc.states_d = states
+        return tc
+
+    # run into a temporary store, and move it into place when done
+    os.makedirs(path, exist_ok=True)
+    entry = os.path.join(path, key)
+    tmp_path = f"{entry}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tc = Timecourse(start=start, stop=stop)
+    tc.store = store.create_store(
+        tmp_path,
+        timepoints=range(start, stop + 1),
+        level_dtype=np.float64,
+        params=dict(start=start, stop=stop, model_hash=model_hash()),
+    )
+    try:
+        tc.run(verbose=verbose)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    size = _get_size(tmp_path)
+    max_bytes = get_max_bytes()
+    if size <= max_bytes:
+        evict(max_bytes - size)
+        try:
+            os.replace(tmp_path, entry)
+            tc.states_d = store.open_store(entry)
+            return tc
+        except OSError:
+            pass  # cached by another process in the meantime
+
+    # not kept: load the result into memory
+    tc.states_d = _to_memory(tc.get_states())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    return tc
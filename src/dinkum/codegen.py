@@ -0,0 +1,706 @@
+"""compile the current model into a specialized simulation kernel.
+
+    model = dinkum.compile()
+    tc = model.run(start=1, stop=10)
+
+The kernel is a generated Python module, specialized to the model. Gene
+states are kept in flat lists indexed by tissue * (number of genes) +
+gene, so every input of every rule is read at a constant offset; the
+built-in rules (is_present, the logistic and linear rules, Decay, Growth
+and GeneTimecourse) and receptor checks are written out inline, with
+their parameters as literals. custom_fn functions are called directly
+with the states of their inputs, and any other rule through its
+'advance' method, with the states so far.
+
+Results are the same as from Timecourse.run, stored in a
+ColumnarTissueGeneStates with float64 levels. Trace functions and Dual
+numbers are not supported.
+
+Kernels are keyed by the model hash (see dinkum.cache.model_hash), and
+written to the directory DINKUM_KERNEL_DIR (default ~/.cache/dinkum-kernels),
+from which they are imported; compiling the same model again, in this
+process or another, reuses its kernel. Models that can't be hashed are
+compiled in memory, each time. A compiled model refuses to run once the
+model has changed; compile it again.
+"""
+
+import builtins
+import collections
+import contextlib
+import hashlib
+import importlib.util
+import json
+import keyword
+import math
+import os
+import types
+
+import numpy as np
+
+import dinkum
+from dinkum import vfg, vfn, cache
+from dinkum import vfg_functions as vf
+from dinkum.columnar import (
+    ColumnarStateAtTime,
+    ColumnarTissueGeneStates,
+    UNSET,
+    INT,
+    FLOAT,
+    get_kind,
+)
+from dinkum.exceptions import DinkumInvalidActivationResult
+
+CODEGEN_VERSION = 1
+
+_kernel_dir = None
+_kernels = {}  # key => kernel module, in this process
+
+_KINDS = {int: INT, bool: INT, float: FLOAT}
+
+
+class _NotPlain(Exception):
+    "A rule parameter that can't be written out as a literal."
+
+
+def get_kernel_dir():
+    if _kernel_dir is not None:
+        return _kernel_dir
+    path = os.environ.get("DINKUM_KERNEL_DIR", "~/.cache/dinkum-kernels")
+    return os.path.expanduser(path)
+
+
+def set_kernel_dir(path):
+    "Write and import kernels in the directory 'path' (None: the default)."
+    global _kernel_dir
+    _kernel_dir = None if path is None else os.path.expanduser(path)
+
+
+def _literal(value):
+    "Return the plain number 'value' as Python source."
+    if isinstance(value, (bool, np.bool_)):
+        return repr(bool(value))
+    if isinstance(value, (int, np.integer)):
+        return repr(int(value))
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        if math.isfinite(value):
+            return repr(value)
+        return f"float({repr(value)!r})"
+    raise _NotPlain(value)
+
+
+def _delay_name(delay):
+    return str(delay) if delay >= 0 else f"m{-delay}"
+
+
+class _Source:
+    "Lines of generated Python, with indentation."
+
+    def __init__(self, depth=0):
+        self.lines = []
+        self.depth = depth
+
+    def add(self, *lines):
+        for line in lines:
+            self.lines.append("    " * self.depth + line)
+
+    @contextlib.contextmanager
+    def block(self, line):
+        self.add(line)
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+
+    def extend(self, other):
+        self.lines.extend(other.lines)
+
+
+class _Kernel:
+    """Generate the kernel source for the current model.
+
+    Rules are written out in two places, run once per timepoint: blocks
+    for rules that apply in one tissue, at constant offsets, and a loop
+    over all tissues, with offset 'o' and tissue index 'i'. Each state
+    written records the index of its rule in 'pr', so that the last rule
+    (in model order) with an opinion wins, as in Timecourse.run.
+    """
+
+    def __init__(self, model_hash):
+        self.model_hash = model_hash
+        self.tissue_index = {n: i for i, n in enumerate(vfn.get_tissue_names())}
+        self.gene_index = {n: g for g, n in enumerate(vfg.get_gene_names())}
+        self.n_genes = len(self.gene_index)
+        self.ligands = sorted(vfg.get_ligands())
+        self.rules = vfg.get_rules()
+
+        counts = collections.Counter(r.dest.name for r in self.rules)
+        self.guarded = set(name for name, count in counts.items() if count > 1)
+
+        self.reads = set()  # delays of the states read inline
+        self.received = set()  # (delay, ligand index) of received ligand levels
+        self.bindings = []  # names bound to rule attributes before the loop
+        self.specific = _Source(depth=2)
+        self.general = _Source(depth=3)
+
+    # helpers for the emitters
+
+    def _get_index(self, gene_name):
+        vfg.get_gene(gene_name)  # unknown genes fail, as in the rule
+        return self.gene_index[gene_name]
+
+    def _k(self, at, gene_name):
+        "Return the offset of gene 'gene_name' in the tissue 'at'."
+        g = self._get_index(gene_name)
+        offset, _ = at
+        if offset == "o":
+            return f"o + {g}"
+        return str(offset + g)
+
+    def _read(self, delay):
+        "Return the (levels, actives) variable names for states 'delay' ago."
+        delay = int(delay)
+        self.reads.add(delay)
+        name = _delay_name(delay)
+        return f"l{name}", f"a{name}"
+
+    def _bind(self, name, expr):
+        self.bindings.append(f"{name} = {expr}")
+        return name
+
+    def _receives(self, gene, delay, at):
+        "Return the expression for 'the receptor gene receives its ligand'."
+        ligand = gene._set_ligand
+        if ligand is None or ligand not in self.ligands:
+            return _literal(0 > gene.threshold)
+        delay = int(delay)
+        li = self.ligands.index(ligand)
+        self.received.add((delay, li))
+        return f"r{_delay_name(delay)}_{li}[{at[1]}] > {_literal(gene.threshold)}"
+
+    def _check_gene(self, gene, delay, at):
+        "As vfg.check_ligand."
+        if gene.is_receptor:
+            return self._receives(gene, delay, at)
+        return "True"
+
+    def _check_rule(self, rule, delay, at):
+        "As Interactions.check_ligand."
+        if getattr(rule.dest, "_set_ligand", None):
+            return self._receives(rule.dest, delay, at)
+        return "True"
+
+    def _write(self, src, k, n, level, active, *, guard):
+        if k != "k":
+            src.add(f"k = {k}")
+        writes = [f"lv[k] = {level}", f"ac[k] = {active}", f"pr[k] = {n}"]
+        if guard:
+            with src.block(f"if pr[k] <= {n}:"):
+                src.add(*writes)
+        else:
+            src.add(*writes)
+
+    def _write_gene(self, src, at, gene, n, level, active):
+        k = self._k(at, gene.name)
+        guard = gene.name in self.guarded
+        self._write(src, k, n, level, active, guard=guard)
+
+    def _logistic(self, src, out, x, rate, midpoint):
+        "Write out 'out = logistic_output(...)' for the input expression 'x'."
+        _literal(rate)
+        try:
+            k = math.log(rate / 10)
+        except (ValueError, ZeroDivisionError):
+            raise _NotPlain(rate)
+        src.add(f"e = {_literal(-k)} * ({x} - {_literal(midpoint)})")
+        with src.block("if e > 50:"):
+            src.add("e = 50")
+        output = "100 / (1 + exp(e))"
+        if not vf._continuous:
+            output = f"round({output})"
+        src.add(f"{out} = {output}")
+
+    # emitters for each rule class, writing the rule's states in tissue 'at'
+
+    def _emit_is_present(self, src, group):
+        "Write out a group of is_present rules that differ only by tissue."
+        n0, rule = group[0]
+        cond = f"tp >= {_literal(rule.start)}"
+        if rule.duration is not None:
+            cond += f" and tp < {_literal(rule.start + rule.duration)}"
+
+        with src.block(f"if {cond}:"):
+            get_level = self._bind(f"gl{n0}", f"R[{n0}].get_level")
+            src.add(f"level = {get_level}(tp)")
+            if len(group) == 1:
+                at = self._tissue_at(rule.tissue)
+                active = self._check_rule(rule, 1, at)
+                self._write_gene(src, at, rule.dest, n0, "level", active)
+                return
+
+            g = self._get_index(rule.dest.name)
+            items = []
+            for n, r in group:
+                i = self.tissue_index[r.tissue.name]
+                items.append(f"({i}, {i * self.n_genes + g}, {n})")
+            with src.block(f"for i, k, n in ({', '.join(items)}):"):
+                active = self._check_rule(rule, 1, ("o", "i"))
+                guard = rule.dest.name in self.guarded
+                self._write(src, "k", "n", "level", active, guard=guard)
+
+    def _emit_custom_fn(self, src, n, rule, at):
+        rule._get_genes_for_activation_fn(rule.state_fn)  # checks the inputs
+        names = list(dict.fromkeys(rule.get_input_gene_names()))
+        l, a = self._read(rule.delay)
+
+        args = []
+        for name in names:
+            k = self._k(at, name)
+            state = f"G({l}[{k}], {a}[{k}])"
+            if name.isidentifier() and not keyword.iskeyword(name):
+                args.append(f"{name}={state}")
+            else:
+                args.append(f"**{{{name!r}: {state}}}")
+        fn = self._bind(f"f{n}", f"R[{n}].state_fn")
+
+        # custom functions have no opinion on the first timepoint
+        with src.block("if started:"):
+            src.add(f"res = {fn}({', '.join(args)})")
+            with src.block("if res is not None:"):
+                src.add(f"level, active = to_state(res, {fn})")
+                check = self._check_rule(rule, rule.delay, at)
+                if check != "True":
+                    with src.block("if active:"):
+                        src.add(f"active = {check}")
+                self._write_gene(src, at, rule.dest, n, "level", "active")
+
+    def _emit_activator(self, src, n, obj, at):
+        l, a = self._read(obj.delay)
+        k = self._k(at, obj.activator_name)
+        src.add(f"x = {l}[{k}] if {a}[{k}] else 0")
+        self._logistic(src, "level", "x", obj.rate, obj.midpoint)
+        active = self._check_gene(obj.target, obj.delay, at)
+        self._write_gene(src, at, obj.target, n, "level", active)
+
+    def _emit_multi_activator(self, src, n, obj, at):
+        l, a = self._read(obj.delay)
+        src.add("x = 0.0")
+        for name, weight in zip(obj.activator_names, obj.weights):
+            k = self._k(at, name)
+            with src.block(f"if {a}[{k}]:"):
+                src.add(f"x += {_literal(weight)} * {l}[{k}]")
+        self._logistic(src, "level", "x", obj.rate, obj.midpoint)
+        active = self._check_gene(obj.target, obj.delay, at)
+        self._write_gene(src, at, obj.target, n, "level", active)
+
+    def _emit_linear(self, src, n, obj, at):
+        if not obj.weights or len(obj.weights) != len(obj.gene_names):
+            raise _NotPlain(obj.weights)  # fails at run time, as the rule does
+        l, a = self._read(obj.delay)
+        src.add("out = 0")
+        for name, weight in zip(obj.gene_names, obj.weights):
+            k = self._k(at, name)
+            src.add(f"x = {l}[{k}]")
+            src.add(f"out += {_literal(weight)} * (x if x > 0 and {a}[{k}] else 0)")
+        active = self._check_gene(obj.target, obj.delay, at)
+        self._write_gene(src, at, obj.target, n, "out", active)
+
+    def _emit_repressor(self, src, n, obj, at):
+        l, a = self._read(obj.delay)
+        k = self._k(at, obj.activator)
+        kr = self._k(at, obj.repressor)
+        src.add(f"x = {l}[{k}]")
+        with src.block(f"if x == 0 or not {a}[{k}]:"):
+            self._write_gene(src, at, obj.target, n, "0", "False")
+        with src.block("else:"):
+            self._logistic(src, "r", f"{l}[{kr}]", obj.rate, obj.midpoint)
+            active = self._check_gene(obj.target, obj.delay, at)
+            self._write_gene(src, at, obj.target, n, "max(x - r, 0)", active)
+
+    def _emit_repressor2(self, src, n, obj, at):
+        l, a = self._read(obj.delay)
+        k = self._k(at, obj.activator)
+        kr = self._k(at, obj.repressor)
+        src.add(f"x = {l}[{k}]")
+        src.add(f"x = x if x > 0 and {a}[{k}] else 0")
+        rate, midpoint = obj.activator_rate, obj.activator_midpoint
+        self._logistic(src, "x", "x", rate, midpoint)
+        rate, midpoint = obj.repressor_rate, obj.repressor_midpoint
+        self._logistic(src, "r", f"{l}[{kr}]", rate, midpoint)
+        active = self._check_gene(obj.target, obj.delay, at)
+        self._write_gene(src, at, obj.target, n, "max(x - r, 0)", active)
+
+    def _emit_multi_repressor(self, src, n, obj, at):
+        # the rule skips repressors at missing timepoints, rather than
+        # adding weight * 0; that's only different for infinite weights.
+        for weight in obj.weights:
+            if not math.isfinite(weight):
+                raise _NotPlain(weight)
+
+        l, a = self._read(obj.delay)
+        k = self._k(at, obj.activator)
+        src.add(f"x = {l}[{k}]")
+        with src.block(f"if x == 0 or not {a}[{k}]:"):
+            self._write_gene(src, at, obj.target, n, "0", "False")
+        with src.block("else:"):
+            src.add("s = 0.0")
+            for name, weight in zip(obj.repressor_names, obj.weights):
+                src.add(f"s += {_literal(weight)} * {l}[{self._k(at, name)}]")
+            self._logistic(src, "r", "s", obj.rate, obj.midpoint)
+            # this rule is always active
+            self._write_gene(src, at, obj.target, n, "max(x - r, 0)", "True")
+
+    def _emit_decay(self, src, n, obj, at):
+        start = _literal(obj.start_time)
+        with src.block(f"if tp >= {start}:"):
+            src.add(f"level = {_literal(obj.initial_level)}")
+            with src.block(f"for _ in range(tp - {start}):"):
+                src.add(f"level /= {_literal(obj.rate)}")
+            active = self._check_gene(obj.target, obj.delay, at)
+            self._write_gene(src, at, obj.target, n, "level", active)
+
+    def _emit_growth(self, src, n, obj, at):
+        start = _literal(obj.start_time)
+        with src.block(f"if tp >= {start}:"):
+            src.add(f"level = {_literal(obj.initial_level)}")
+            with src.block(f"if tp != {start}:"):
+                with src.block(f"for _ in range(tp - {start}):"):
+                    src.add(f"level += int(100 - level) * {_literal(obj.rate)}")
+                src.add("level = int(max(min(level, 100.0), 0))")
+            active = self._check_gene(obj.target, obj.delay, at)
+            self._write_gene(src, at, obj.target, n, "level", active)
+
+    def _emit_timecourse(self, src, n, obj, at):
+        start = _literal(obj.start_time)
+        values = self._bind(f"v{n}", f"R[{n}].obj.values")
+        with src.block(f"if tp >= {start}:"):
+            with src.block(f"if tp - {start} < {len(obj.values)}:"):
+                level = f"int({values}[tp - {start}])"
+                active = self._check_gene(obj.target, obj.delay, at)
+                self._write_gene(src, at, obj.target, n, level, active)
+            with src.block("else:"):
+                self._write_gene(src, at, obj.target, n, "0", "False")
+
+    def _emit_opaque(self, src, n, rule, at):
+        "Call through the rule's advance method."
+        advance = self._bind(f"adv{n}", f"R[{n}].advance")
+        tissue = f"T[{at[1]}]"
+        call = f"{advance}(timepoint=tp, states=S, tissue={tissue})"
+        with src.block(f"for gene, gsi in {call}:"):
+            offset = "o" if at[0] == "o" else str(at[0])
+            k = f"{offset} + GI[gene.name]"
+            self._write(src, k, n, "gsi.level", "gsi.active", guard=True)
+
+    # rule classes written out inline, with those that apply in one tissue
+    OBJ_EMITTERS = {
+        vf.LogisticActivator: (_emit_activator, False),
+        vf.LogisticMultiActivator: (_emit_multi_activator, False),
+        vf.LinearCombination: (_emit_linear, False),
+        vf.LogisticRepressor: (_emit_repressor, False),
+        vf.LogisticRepressor2: (_emit_repressor2, False),
+        vf.LogisticMultiRepressor: (_emit_multi_repressor, False),
+        vf.Decay: (_emit_decay, True),
+        vf.Growth: (_emit_growth, True),
+        vf.GeneTimecourse: (_emit_timecourse, True),
+    }
+
+    def _tissue_at(self, tissue):
+        "Return 'at' for one tissue, or None if it is not in the model."
+        i = self.tissue_index.get(tissue.name)
+        if i is None:
+            return None
+        return (i * self.n_genes, str(i))
+
+    def _emit_rule(self, n, rule):
+        """Write out rule 'n', if it can be written out inline; return
+        False if not."""
+        emit = None
+        if isinstance(rule, vfg.Interaction_Custom):
+            emit, specific = _Kernel._emit_custom_fn, False
+            target = rule
+        elif isinstance(rule, vfg.Interaction_CustomObj):
+            emit, specific = self.OBJ_EMITTERS.get(type(rule.obj), (None, None))
+            target = rule.obj
+        if emit is None:
+            return False
+
+        src = _Source(depth=self.specific.depth if specific else self.general.depth)
+        state = (set(self.reads), set(self.received), list(self.bindings))
+        try:
+            if specific:
+                at = self._tissue_at(target.tissue)
+                if at is not None:
+                    emit(self, src, n, target, at)
+            else:
+                emit(self, src, n, target, ("o", "i"))
+        except _NotPlain:
+            self.reads, self.received, self.bindings = state
+            return False
+
+        (self.specific if specific else self.general).extend(src)
+        return True
+
+    def _emit_rules(self):
+        # is_present rules, grouped across tissues
+        groups = {}
+        for n, rule in enumerate(self.rules):
+            if isinstance(rule, vfg.Interaction_IsPresent):
+                try:
+                    params = (rule.start, rule.duration, rule.level, rule.decay)
+                    for value in params:
+                        if value is not None:
+                            _literal(value)
+                    key = (rule.dest.name,) + params
+                except _NotPlain:
+                    key = n
+                if rule.tissue.name in self.tissue_index:
+                    groups.setdefault(key, []).append((n, rule))
+
+        for group in groups.values():
+            try:
+                src = _Source(depth=self.specific.depth)
+                self._emit_is_present(src, group)
+                self.specific.extend(src)
+            except _NotPlain:
+                for n, rule in group:
+                    at = self._tissue_at(rule.tissue)
+                    self._emit_opaque(self.specific, n, rule, at)
+
+        for n, rule in enumerate(self.rules):
+            if isinstance(rule, vfg.Interaction_IsPresent):
+                continue
+            if not self._emit_rule(n, rule):
+                self._emit_opaque(self.general, n, rule, ("o", "i"))
+
+    def generate(self):
+        "Return the source of the kernel module."
+        self._emit_rules()
+        n_tissues = len(self.tissue_index)
+        max_delay = max([d for d in self.reads] + [1])
+
+        src = _Source()
+        src.add(
+            '"""dinkum simulation kernel, generated by dinkum.codegen; do not edit."""',
+            "",
+            "from math import exp",
+            "",
+            f"CODEGEN_VERSION = {CODEGEN_VERSION}",
+            f"MODEL_HASH = {self.model_hash!r}",
+            f"N_TISSUES = {n_tissues}",
+            f"N_GENES = {self.n_genes}",
+            "",
+            "",
+        )
+        with src.block("def run(R, S, start, stop, flush, received, to_state, G):"):
+            src.add("T = S.tissues", "GI = S.gene_index")
+            src.add(*sorted(set(self.bindings)))
+            src.add(
+                "N = N_TISSUES * N_GENES",
+                "zl = [0] * N",
+                "za = [False] * N",
+                "hist = {}",
+            )
+            with src.block("for tp in range(start, stop + 1):"):
+                src.add(
+                    "started = tp > start",
+                    "lv = [0] * N",
+                    "ac = [False] * N",
+                    "pr = [-1] * N",
+                )
+                for delay in sorted(self.reads):
+                    name = _delay_name(delay)
+                    src.add(f"h = hist.get(tp - {delay})")
+                    src.add(f"l{name}, a{name} = (zl, za) if h is None else h")
+                for delay, li in sorted(self.received):
+                    name = f"r{_delay_name(delay)}_{li}"
+                    src.add(f"{name} = received(tp - {delay}, {li})")
+
+                src.extend(self.specific)
+                with src.block("for i in range(N_TISSUES):"):
+                    src.add("o = i * N_GENES")
+                    src.extend(self.general)
+
+                src.add("hist[tp] = (lv, ac)", f"hist.pop(tp - {max_delay}, None)")
+                with src.block("if flush(tp, lv, ac, pr):"):
+                    src.add("break")
+
+        return "\n".join(src.lines) + "\n"
+
+
+def _to_state(result, state_fn):
+    "Convert the result of a custom function, as Interaction_Custom does."
+    if not isinstance(result, vfg.GeneStateInfo):
+        if len(tuple(result)) == 2:
+            result = vfg.GeneStateInfo(int(result[0]), bool(result[1]))
+
+    if not isinstance(result, vfg.GeneStateInfo):
+        raise DinkumInvalidActivationResult(
+            f"result '{result}' of custom activation function '{state_fn.__name__}' is not a GeneStateInfo tuple (and cannot be converted)"
+        )
+    return result
+
+
+def _make_flush(states, stop_fn):
+    """Return flush(tp, levels, actives, rules), which stores one
+    timepoint's states, and returns True if the run should stop."""
+    shape = (len(states.tissue_names), len(states.gene_names))
+
+    def flush(tp, lv, ac, pr):
+        row = states._get_row(tp)
+        kind = [_KINDS.get(type(level)) or get_kind(level) for level in lv]
+        kind = np.array(kind, dtype=np.uint8)
+        kind[np.array(pr) < 0] = UNSET
+
+        states.level[row] = np.array(lv, dtype=states.level.dtype).reshape(shape)
+        states.active[row] = np.array(ac, dtype=bool).reshape(shape)
+        states.kind[row] = kind.reshape(shape)
+        states.assigned[row] = True
+        states._ligand_levels.pop(row, None)
+        state = ColumnarStateAtTime(states, tp, row)
+        states.data[tp] = state
+        return stop_fn is not None and bool(stop_fn(state))
+
+    return flush
+
+
+def _make_received(states, ligands):
+    """Return received(tp, ligand index), the level of the ligand that
+    each tissue receives from the states at 'tp'."""
+    zeros = [0.0] * len(states.tissue_names)
+
+    def received(tp, li):
+        state = states.data.get(tp)
+        if state is None:
+            return zeros
+        return state.get_ligand_levels()[ligands[li]].tolist()
+
+    return received
+
+
+def _get_fingerprint():
+    return (
+        tuple(map(id, vfg._rules)),
+        tuple(vfg.get_gene_names()),
+        tuple(vfn.get_tissue_names()),
+    )
+
+
+class CompiledModel:
+    "A simulation kernel for the model as it was when compiled; see compile."
+
+    def __init__(self, module, *, model_hash, path=None):
+        self.module = module
+        self.model_hash = model_hash
+        self.path = path
+        self.rules = vfg.get_rules()
+        self.ligands = sorted(vfg.get_ligands())
+        self._fingerprint = _get_fingerprint()
+
+    def __repr__(self):
+        return f"<CompiledModel {self.model_hash} at {self.path}>"
+
+    def check(self):
+        """Raise an exception if the model has changed since it was
+        compiled. Changes to models that can't be hashed are only found
+        if genes, tissues or rules are added."""
+        changed = _get_fingerprint() != self._fingerprint
+        if not changed and self.model_hash is not None:
+            changed = cache.model_hash() != self.model_hash
+        if changed:
+            raise Exception("the model has changed since it was compiled")
+
+    def run(self, *, start, stop, stop_fn=None):
+        """Run a Timecourse from start to stop with the kernel, and return
+        it. If 'stop_fn' is given, it is called with each timepoint's new
+        state, and the run stops early if it returns True."""
+        self.check()
+        tc = dinkum.Timecourse(start=start, stop=stop)
+        states = ColumnarTissueGeneStates(
+            timepoints=range(start, stop + 1), level_dtype=np.float64
+        )
+        assert states.tissue_names == vfn.get_neighbor_graph().tissue_names
+        assert (len(states.tissue_names), len(states.gene_names)) == (
+            self.module.N_TISSUES,
+            self.module.N_GENES,
+        )
+        tc.states_d = states
+
+        self.module.run(
+            self.rules,
+            states,
+            start,
+            stop,
+            _make_flush(states, stop_fn),
+            _make_received(states, self.ligands),
+            _to_state,
+            vfg.GeneStateInfo,
+        )
+        return tc
+
+
+def get_key(model_hash):
+    "Return the kernel key for the model with hash 'model_hash'."
+    ident = [CODEGEN_VERSION, dinkum.__version__, model_hash]
+    return hashlib.sha256(json.dumps(ident).encode("utf-8")).hexdigest()
+
+
+def _exec_source(source, name):
+    "Return a module made from 'source', in memory."
+    module = types.ModuleType(name)
+    code = builtins.compile(source, f"<{name}>", "exec")
+    exec(code, module.__dict__)
+    return module
+
+
+def _import_path(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _load_kernel(key, model_hash):
+    """Return (module, path) for the kernel 'key', importing it from the
+    kernel directory, and generating it first if needed."""
+    name = f"dinkum_kernel_{key[:32]}"
+    path = os.path.join(get_kernel_dir(), f"{name}.py")
+    if os.path.exists(path):
+        try:
+            module = _import_path(path, name)
+            if module.MODEL_HASH == model_hash:
+                return module, path
+        except Exception:
+            pass  # incomplete or stale; generate it again
+
+    source = _Kernel(model_hash).generate()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            fp.write(source)
+        os.replace(tmp_path, path)
+    except OSError:
+        return _exec_source(source, name), None  # kernel dir isn't writable
+    return _import_path(path, name), path
+
+
+def compile(*, verbose=False):
+    """Compile the current model into a simulation kernel, and return it
+    as a CompiledModel; see module docs."""
+    model_hash = cache.model_hash()
+    if model_hash is None:
+        source = _Kernel(None).generate()
+        module, path = _exec_source(source, "dinkum_kernel"), None
+        if verbose:
+            print("model can't be hashed; compiled in memory")
+    else:
+        key = get_key(model_hash)
+        module, path = _kernels.get(key, (None, None))
+        if module is None:
+            module, path = _load_kernel(key, model_hash)
+            _kernels[key] = (module, path)
+        if verbose:
+            print(f"using kernel {path or key}")
+
+    return CompiledModel(module, model_hash=model_hash, path=path)
@@ -0,0 +1,372 @@
+"""columnar storage for time course states.
+
+ColumnarTissueGeneStates keeps gene levels and activity in contiguous
+arrays indexed by [time, tissue, gene], rather than in one Python object
+per gene, per tissue, per timepoint. It has the same API as
+TissueGeneStates: each timepoint, and each tissue within it, is a
+lightweight view onto the arrays, so nothing is copied on access.
+
+Levels are stored as float64 by default (10 bytes per gene per tissue
+per timepoint, with activity and a set/int/float marker), along with
+whether they were set as ints, so that they read back as the same type.
+A smaller level_dtype, such as float32, saves memory but rounds every
+level as it is stored, and so changes the results of later timepoints.
+Dual numbers cannot be stored; use the default storage to fit gradients.
+
+Use with Timecourse(..., columnar=True).
+"""
+
+import collections
+import collections.abc
+import numbers
+
+import numpy as np
+
+import dinkum
+from dinkum import vfg, vfn
+
+# how a level was set, in ColumnarTissueGeneStates.kind
+UNSET = 0
+INT = 1
+FLOAT = 2
+
+
+def get_kind(level):
+    "Return how 'level' is stored: INT or FLOAT."
+    if isinstance(level, (numbers.Integral, np.integer)):
+        return INT
+    if isinstance(level, (numbers.Real, np.floating)):
+        return FLOAT
+    raise Exception(f"columnar states store plain numbers, not '{level!r}'")
+
+
+class StoredTissue(collections.namedtuple("StoredTissue", ["name"])):
+    """Stands in for a Tissue that is not in the current model, such as
+    one in a store reopened without rebuilding the model."""
+
+
+class ColumnarGeneStates:
+    "A view of the gene states of one tissue at one timepoint; see OnlyGeneStates."
+
+    def __init__(self, store, row, col):
+        self.store = store
+        self.row = row
+        self.col = col
+
+    def __repr__(self):
+        return repr(self.genes_by_name)
+
+    def __getitem__(self, gene_name):
+        return self.get_gene_state(gene_name)
+
+    @property
+    def genes_by_name(self):
+        "A dict of the GeneStateInfo of each gene that is set (a copy)."
+        kind = self.store.kind[self.row, self.col]
+        return {
+            self.store.gene_names[g]: self.store._read(self.row, self.col, g)
+            for g in np.flatnonzero(kind)
+        }
+
+    def set_gene_state(self, *, gene=None, state_info=None):
+        assert gene is not None
+        assert state_info is not None
+        self.store._write(self.row, self.col, gene.name, state_info)
+
+    def _index(self, gene_name):
+        "Return the gene index of 'gene_name', or None if it is not set."
+        g = self.store.gene_index.get(gene_name)
+        if g is None or not self.store.kind[self.row, self.col, g]:
+            return None
+        return g
+
+    def is_present(self, gene_name):
+        g = self._index(gene_name)
+        return g is not None and self.store.level[self.row, self.col, g] != 0
+
+    def is_active(self, gene_name):
+        g = self._index(gene_name)
+        if g is None:
+            return False
+        store = self.store
+        return bool(
+            store.level[self.row, self.col, g] > 0
+            and store.active[self.row, self.col, g]
+        )
+
+    def get_level(self, gene_name):
+        return self.get_gene_state(gene_name).level
+
+    def get_gene_state(self, gene_name):
+        assert not isinstance(gene_name, vfg.Gene)
+        g = self._index(gene_name)
+        if g is None:
+            return vfg.DEFAULT_OFF
+        return self.store._read(self.row, self.col, g)
+
+    def __contains__(self, gene):
+        return self.is_active(gene.name)
+
+    def report_activity(self):
+        rl = []
+        for k, v in sorted(self.genes_by_name.items()):
+            active = 1 if v.active else 0
+            rl.append(f"{k}={v.level} ({active})")
+
+        return rl
+
+
+class _TissueViews(collections.abc.Mapping):
+    "{tissue name: ColumnarGeneStates} for the tissues set at one timepoint."
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, tissue_name):
+        col = self.store.tissue_index.get(tissue_name)
+        if col is None or not self.store.assigned[self.row, col]:
+            raise KeyError(tissue_name)
+        return ColumnarGeneStates(self.store, self.row, col)
+
+    def __iter__(self):
+        for col in np.flatnonzero(self.store.assigned[self.row]):
+            yield self.store.tissue_names[col]
+
+    def __len__(self):
+        return int(self.store.assigned[self.row].sum())
+
+
+class ColumnarStateAtTime:
+    "A view of all tissues at one timepoint; see TissueAndGeneStateAtTime."
+
+    def __init__(self, store, time, row):
+        self.store = store
+        self.time = time
+        self.row = row
+        self._tissues_by_name = _TissueViews(store, row)
+
+    def __setitem__(self, tissue, genes):
+        "set Tissue object by name."
+        self.store._write_tissue(self.row, tissue.name, genes)
+
+    def __getitem__(self, tissue):
+        "get Tissue object."
+        return self._tissues_by_name[tissue.name]
+
+    def get(self, tissue):
+        return self._tissues_by_name.get(tissue.name)
+
+    def get_by_tissue_name(self, tissue_name):
+        assert not isinstance(tissue_name, vfn.Tissue)
+        return self._tissues_by_name[tissue_name]
+
+    @property
+    def tissues(self):
+        cols = np.flatnonzero(self.store.assigned[self.row])
+        return [self.store.tissues[col] for col in cols]
+
+    def is_active(self, gene, tissue):
+        ts = self[tissue]
+        if ts and gene in ts:
+            return True
+        return False
+
+    def get_gene_state_info(self, gene, tissue):
+        ts = self[tissue]
+        return ts[gene.name]
+
+    def get_ligand_levels(self):
+        """Return a dict mapping each ligand to an array of the level of
+        it that each tissue (in neighbor graph order) receives from this
+        state; see TissueAndGeneStateAtTime.get_ligand_levels.
+        """
+        graph = vfn.get_neighbor_graph()
+        ligands = vfg.get_ligands()
+        store = self.store
+        cached = store._ligand_levels.get(self.row)
+        if cached is not None and cached[0] is graph and cached[1] == ligands:
+            return cached[2]
+
+        with dinkum._ligand_lock:
+            cols = store._get_graph_columns(graph)
+            found = cols >= 0
+            received = {}
+            for ligand in ligands:
+                levels = np.zeros(len(graph))
+                g = store.gene_index.get(ligand.name)
+                if g is not None:
+                    level = store.level[self.row, :, g].astype(float)
+                    on = store.kind[self.row, :, g].astype(bool)
+                    on &= store.active[self.row, :, g] & (level > 0)
+                    levels[found] = np.where(on, level, 0)[cols[found]]
+                received[ligand] = graph.signal(
+                    levels,
+                    juxtacrine=getattr(ligand, "is_juxtacrine", False),
+                    range=getattr(ligand, "range", 1),
+                    attenuation=getattr(ligand, "attenuation", 1.0),
+                )
+
+            store._ligand_levels[self.row] = (graph, ligands, received)
+        return received
+
+
+class ColumnarTissueGeneStates(dinkum.TissueGeneStates):
+    """
+    TissueGeneStates stored as arrays indexed by [time, tissue, gene].
+
+    'level', 'active' and 'kind' (UNSET, INT or FLOAT) hold the gene
+    states; 'assigned' marks the tissues set at each timepoint. Setting
+    a timepoint that is not in 'timepoints' extends the time axis.
+    """
+
+    def __init__(
+        self, *, timepoints, tissue_names=None, gene_names=None, level_dtype=np.float64
+    ):
+        super().__init__()
+        if tissue_names is None:
+            tissue_names = vfn.get_tissue_names()
+        if gene_names is None:
+            gene_names = vfg.get_gene_names()
+
+        self.timepoints = list(timepoints)
+        self.time_index = {tp: i for i, tp in enumerate(self.timepoints)}
+        self.tissue_names = list(tissue_names)
+        self.tissue_index = {name: i for i, name in enumerate(self.tissue_names)}
+        self.tissues = [
+            vfn.get_tissue(name) or StoredTissue(name) for name in self.tissue_names
+        ]
+        self.gene_names = list(gene_names)
+        self.gene_index = {name: i for i, name in enumerate(self.gene_names)}
+
+        shape = (len(self.timepoints), len(self.tissue_names), len(self.gene_names))
+        self._allocate(shape, level_dtype)
+
+        self._ligand_levels = {}  # row => (graph, ligands, received levels)
+        self._graph_columns = None
+
+    def _allocate(self, shape, level_dtype):
+        "Create the 'level', 'active', 'kind' and 'assigned' arrays."
+        self.level = np.zeros(shape, dtype=level_dtype)
+        self.active = np.zeros(shape, dtype=bool)
+        self.kind = np.zeros(shape, dtype=np.uint8)
+        self.assigned = np.zeros(shape[:2], dtype=bool)
+
+    def _get_axis_names(self):
+        return self.tissue_names, self.gene_names
+
+    def clear(self):
+        "Remove all states, keeping the axes."
+        self.data = {}
+        self.kind[...] = UNSET
+        self.assigned[...] = False
+        self._ligand_levels = {}
+
+    def _get_row(self, timepoint):
+        "Return the time index of 'timepoint', extending the time axis if needed."
+        timepoint = int(timepoint)
+        row = self.time_index.get(timepoint)
+        if row is None:
+            row = len(self.timepoints)
+            self.timepoints.append(timepoint)
+            self.time_index[timepoint] = row
+            for name in ("level", "active", "kind", "assigned"):
+                arr = getattr(self, name)
+                extra = np.zeros((1,) + arr.shape[1:], dtype=arr.dtype)
+                setattr(self, name, np.concatenate([arr, extra]))
+        return row
+
+    def _get_graph_columns(self, graph):
+        "Return, for each tissue in 'graph', its tissue index here (or -1)."
+        if self._graph_columns is None or self._graph_columns[0] is not graph:
+            cols = np.array(
+                [self.tissue_index.get(name, -1) for name in graph.tissue_names],
+                dtype=int,
+            )
+            self._graph_columns = (graph, cols)
+        return self._graph_columns[1]
+
+    def _read(self, row, col, g):
+        level = self.level[row, col, g].item()
+        if self.kind[row, col, g] == INT:
+            level = int(level)
+        return vfg.GeneStateInfo(level, bool(self.active[row, col, g]))
+
+    def _write(self, row, col, gene_name, state_info):
+        g = self.gene_index[gene_name]
+        level = state_info.level
+        kind = get_kind(level)
+        if kind == FLOAT:
+            if np.issubdtype(self.level.dtype, np.integer) and level != int(level):
+                raise Exception(f"cannot store level {level} as {self.level.dtype}")
+
+        self.level[row, col, g] = level
+        self.active[row, col, g] = state_info.active
+        self.kind[row, col, g] = kind
+        self.assigned[row, col] = True
+        self._ligand_levels.pop(row, None)
+
+    def _write_tissue(self, row, tissue_name, genes):
+        "Set all the gene states of one tissue at one timepoint."
+        col = self.tissue_index[tissue_name]
+        self.kind[row, col] = UNSET
+        self.assigned[row, col] = True
+        self._ligand_levels.pop(row, None)
+        for gene_name, state_info in genes.genes_by_name.items():
+            self._write(row, col, gene_name, state_info)
+
+    def __setitem__(self, timepoint, state):
+        row = self._get_row(timepoint)
+        if getattr(state, "store", None) is not self or state.row != row:
+            self.kind[row] = UNSET
+            self.assigned[row] = False
+            for tissue in state.tissues:
+                genes = state.get(tissue)
+                if genes is not None:
+                    self._write_tissue(row, tissue.name, genes)
+        self.data[int(timepoint)] = ColumnarStateAtTime(self, int(timepoint), row)
+
+    def set_gene_state(
+        self, *, timepoint=None, tissue_name=None, gene_name=None, state_info=None
+    ):
+        assert timepoint is not None
+        assert tissue_name is not None
+        assert gene_name is not None
+        assert state_info is not None
+        timepoint = int(timepoint)
+
+        row = self._get_row(timepoint)
+        col = self.tissue_index[tissue_name]
+        self._write(row, col, gene_name, state_info)
+        if timepoint not in self.data:
+            self.data[timepoint] = ColumnarStateAtTime(self, timepoint, row)
+
+    def _get_indices(self, timepoints, tissue_names):
+        "Return the time and tissue indices of the given axes, or -1 if missing."
+        rows = [
+            self.time_index.get(tp, -1) if tp in self.data else -1 for tp in timepoints
+        ]
+        cols = [self.tissue_index.get(name, -1) for name in tissue_names]
+        return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+    def _collect_arrays(self, timepoints, tissue_names, gene_names):
+        "As TissueGeneStates._collect_arrays, by indexing the stored arrays."
+        rows, cols = self._get_indices(timepoints, tissue_names)
+        genes = np.array(
+            [self.gene_index.get(name, -1) for name in gene_names], dtype=int
+        )
+
+        ix = np.ix_(np.maximum(rows, 0), np.maximum(cols, 0), np.maximum(genes, 0))
+        kind = self.kind[ix]
+        is_set = (
+            (rows >= 0)[:, None, None] & (cols >= 0)[None, :, None] & (genes >= 0)
+        ) & (kind != UNSET)
+
+        level = np.where(is_set, self.level[ix], 0).astype(float)
+        active = is_set & self.active[ix]
+        return level, active, is_set, is_set & (kind == FLOAT)
+
+    def _get_tissue_mask(self, timepoints, tissue_names):
+        rows, cols = self._get_indices(timepoints, tissue_names)
+        found = (rows >= 0)[:, None] & (cols >= 0)
+        return found & self.assigned[np.ix_(np.maximum(rows, 0), np.maximum(cols, 0))]
@@ -0,0 +1,210 @@
+"""build a model in bulk from an edge-list table.
+
+Each row of the table is one regulatory edge, with columns:
+
+- 'source', 'target' - gene names;
+- 'sign' - +1 / -1 (or '+' / '-', 'activates' / 'represses');
+- 'weight' - the weight of the input (default 1);
+- 'delay' - the delay of the target's rule (default 1);
+- 'logic' - how a target's activators combine: 'or' (default) or 'and';
+  or 'signal', for a ligand ('source') binding a receptor ('target').
+
+Genes are created as needed (reusing any that already exist), as
+Ligands and Receptors if they take part in a 'signal' edge. Each target
+gets one logistic rule, as from Gene.activated_by, activated_by_or,
+activated_by_and or and_not, built from its incoming edges. Everything
+is validated once, at the end, before any rules are added.
+
+    genes = dinkum.from_edges(df)
+    genes["X"].is_present(where=m, start=1)
+"""
+
+import collections
+
+import numpy as np
+
+from dinkum import vfg
+from dinkum.exceptions import (
+    DinkumMultipleRules,
+    DinkumNotALigand,
+    DinkumNotATranscriptionFactor,
+)
+from dinkum.vfg_functions import (
+    LogisticActivator,
+    LogisticMultiActivator,
+    LogisticMultiRepressor,
+    LogisticRepressor2,
+)
+
+EDGE_COLUMNS = ("source", "target", "sign", "weight", "delay", "logic")
+EDGE_DEFAULTS = dict(sign=1, weight=1, delay=1, logic="or")
+LOGIC_TYPES = ("or", "and", "signal")
+SIGN_NAMES = {"+": 1, "-": -1, "activates": 1, "represses": -1}
+
+Edge = collections.namedtuple("Edge", ["source", "sign", "weight", "delay", "logic"])
+
+
+def _parse_sign(sign):
+    if isinstance(sign, str):
+        value = SIGN_NAMES.get(sign.strip().lower(), 0)
+    else:
+        value = int(np.sign(sign))
+    if not value:
+        raise Exception(f"invalid sign '{sign}'; use +1/-1, '+'/'-'")
+    return value
+
+
+def _read_edges(df):
+    "Return the rows of 'df' as tuples of EDGE_COLUMNS, filling in defaults."
+    missing = [name for name in ("source", "target") if name not in df.columns]
+    if missing:
+        raise Exception(f"edge table is missing columns {missing}")
+
+    n = len(df)
+    columns = []
+    for name in EDGE_COLUMNS:
+        if name in df.columns:
+            columns.append(df[name].tolist())
+        else:
+            columns.append([EDGE_DEFAULTS[name]] * n)
+    return zip(*columns)
+
+
+def _make_rule_obj(target, edges, rate):
+    "Return the logistic rule object for 'target', given its incoming 'edges'."
+    delays = set(e.delay for e in edges)
+    if len(delays) > 1:
+        raise Exception(f"edges into '{target}' have different delays {delays}")
+    (delay,) = delays
+    logics = set(e.logic for e in edges)
+    if len(logics) > 1:
+        raise Exception(f"edges into '{target}' have different logic {logics}")
+    (logic,) = logics
+
+    activators = [e for e in edges if e.sign > 0]
+    repressors = [e for e in edges if e.sign < 0]
+    if len(activators) != 1 and repressors:
+        raise Exception(
+            f"'{target}' has repressors, so must have exactly one activator"
+        )
+    if not activators:
+        raise Exception(f"'{target}' has no activators")
+
+    if repressors:
+        activator = activators[0].source
+        if len(repressors) == 1 and repressors[0].weight == 1:
+            return LogisticRepressor2(
+                activator_name=activator,
+                repressor_name=repressors[0].source,
+                delay=delay,
+                activator_rate=rate,
+                repressor_rate=rate,
+            )
+        return LogisticMultiRepressor(
+            rate=rate,
+            activator_name=activator,
+            repressor_names=[e.source for e in repressors],
+            weights=[e.weight for e in repressors],
+            delay=delay,
+        )
+
+    if len(activators) == 1 and activators[0].weight == 1:
+        return LogisticActivator(
+            rate=rate, activator_name=activators[0].source, delay=delay
+        )
+
+    names = [e.source for e in activators]
+    weights = [e.weight for e in activators]
+    if logic == "and":
+        total = sum(weights)
+        return LogisticMultiActivator(
+            activator_names=names,
+            weights=[w / total for w in weights],
+            delay=delay,
+            rate=rate,
+            midpoint=99,
+        )
+    return LogisticMultiActivator(
+        activator_names=names, weights=weights, delay=delay, rate=rate
+    )
+
+
+def from_edges(df, *, rate=100):
+    """Build genes and rules from the edge table 'df' (a pandas DataFrame;
+    see module docs), and return {name: gene} for all genes in it.
+
+    'rate' is the logistic rate of every rule, as for the Gene methods.
+    """
+    edges = collections.defaultdict(list)  # target => [Edge]
+    ligand_of = {}  # receptor => ligand
+    names = {}  # in order of appearance
+    seen_edges = set()
+    for source, target, sign, weight, delay, logic in _read_edges(df):
+        source, target = str(source), str(target)
+        names[source] = names[target] = None
+        if (source, target) in seen_edges:
+            raise Exception(f"multiple edges from '{source}' to '{target}'")
+        seen_edges.add((source, target))
+
+        logic = str(logic).strip().lower()
+        if logic not in LOGIC_TYPES:
+            raise Exception(f"unknown logic '{logic}'; must be one of {LOGIC_TYPES}")
+        if logic == "signal":
+            if ligand_of.setdefault(target, source) != source:
+                raise Exception(f"receptor '{target}' has more than one ligand")
+            continue
+        edge = Edge(source, _parse_sign(sign), float(weight), int(delay), logic)
+        edges[target].append(edge)
+
+    ligand_names = set(ligand_of.values())
+    both = ligand_names & set(ligand_of)
+    if both:
+        raise Exception(f"genes {sorted(both)} can't be both ligand and receptor")
+
+    # validate against existing genes, and plan new ones
+    existing = {g.name: g for g in vfg._genes}
+    for name in names:
+        gene = existing.get(name)
+        if gene is None:
+            continue
+        if name in ligand_names and not gene.is_ligand:
+            raise DinkumNotALigand(f"gene {name} is not a Ligand")
+        if name in ligand_of and not gene.is_receptor:
+            raise Exception(f"gene {name} already exists, and is not a Receptor")
+
+    for target, target_edges in edges.items():
+        for e in target_edges:
+            gene = existing.get(e.source)
+            is_tf = gene.is_tf if gene is not None else e.source not in ligand_names
+            if not is_tf:
+                raise DinkumNotATranscriptionFactor(
+                    f"{e.source} is not a transcription factor"
+                )
+
+    objs = {target: _make_rule_obj(target, e, rate) for target, e in edges.items()}
+    for target in objs:
+        if vfg.has_single_rule(target):
+            raise DinkumMultipleRules(
+                f"multiple rules containing {target} are not allowed!"
+            )
+
+    # all good: make the genes (ligands first, for their receptors), and rules
+    genes = {}
+    for name in sorted(names, key=lambda name: name not in ligand_names):
+        gene = existing.get(name)
+        if gene is None:
+            if name in ligand_names:
+                gene = vfg.Ligand(name=name)
+            elif name in ligand_of:
+                gene = vfg.Receptor(name=name, ligand=genes[ligand_of[name]])
+            else:
+                gene = vfg.Gene(name=name)
+        genes[name] = gene
+
+    rules = []
+    for target, obj in objs.items():
+        obj.set_gene(genes[target])
+        rules.append(vfg.Interaction_CustomObj(dest=genes[target], obj=obj))
+    vfg.add_rules(rules)
+
+    return {name: genes[name] for name in names}
@@ -26,6 +26,10 @@ class DinkumInvalidTissue(DinkumException):
     pass
 
 
+class DinkumInvalidLattice(DinkumException):
+    pass
+
+
 class DinkumNoSuchGene(DinkumException):
     pass
 
@@ -36,3 +40,7 @@ class DinkumInvalidActivationFunction(DinkumException):
 
 class DinkumInvalidActivationResult(DinkumException):
     pass
+
+
+class DinkumNotBoolean(DinkumException):
+    pass
@@ -25,7 +25,13 @@ def reset():
 
 
 class Observation:
-    pass
+    def distance(self, state):
+        """How far 'state' is from satisfying this observation: None if not
+        applicable, else 0 (satisfied) to 1."""
+        check = self.check(state)
+        if check is None:
+            return None
+        return 0.0 if check else 1.0
 
 
 class Obs_IsPresent(Observation):
@@ -198,6 +204,16 @@ class Obs_LevelIsBetween(Observation):
             return True
         return False
 
+    def distance(self, state):
+        # not applicable
+        if state.time != self.time:
+            return None
+
+        tissue_state = state.get_by_tissue_name(self.tissue_name)
+        level = tissue_state.get_level(self.gene_name)
+        off_by = max(self.min_level - level, level - self.max_level, 0)
+        return min(off_by / 100, 1.0)
+
     def render(self):
         return f"{self.gene_name} has level NOT between {self.min_level} and {self.max_level} in tissue {self.tissue_name} at time {self.time}"
 
@@ -224,3 +240,60 @@ def test_observations(state):
             succeed = False
 
     return succeed
+
+
+class ObservationChecker:
+    """Check observations incrementally, one timepoint state at a time.
+
+    'results' holds True/False/None per observation, as for check_each;
+    'distances' holds each observation's largest distance so far.
+    """
+
+    def __init__(self, obs=None):
+        if obs is None:
+            obs = get_obs()
+        self.obs = list(obs)
+        self.results = [None] * len(self.obs)
+        self.distances = [0.0] * len(self.obs)
+        self.n_failed = 0
+
+    def check(self, state):
+        "Check all observations against 'state'; return the number failed so far."
+        for n, ob in enumerate(self.obs):
+            dist = ob.distance(state)
+            if dist is None:
+                continue
+            if dist > self.distances[n]:
+                self.distances[n] = dist
+            if dist == 0:
+                if self.results[n] is None:
+                    self.results[n] = True
+            elif self.results[n] is not False:
+                self.results[n] = False
+                self.n_failed += 1
+
+        return self.n_failed
+
+    def distance(self, *, graded=False):
+        """Return the mean distance over all observations: the fraction
+        failed, or with 'graded', the mean of per-observation distances."""
+        if not self.obs:
+            return 0.0
+        if graded:
+            return sum(self.distances) / len(self.obs)
+        return self.n_failed / len(self.obs)
+
+
+def check_each(states):
+    """Check each observation against every state in 'states', quietly.
+
+    'states' is an iterable of per-timepoint states, e.g. a Timecourse.
+    Returns a list with one entry per observation: True if it passed at
+    every timepoint it applies to, False if it failed at any, and None if
+    it never applied.
+    """
+    checker = ObservationChecker()
+    for state in states:
+        checker.check(state)
+
+    return checker.results
@@ -0,0 +1,151 @@
+"""run a function over many inputs in a pool of worker processes.
+
+Workers are forked from the current process, so each one starts with its
+own private copy of the model registry (genes, tissues, rules); changes
+that a worker makes (e.g. setting fit parameters) never leak back into
+the parent or into other workers.
+
+Where fork is not available, workers are spawned instead, and the model
+is sent to them in the format of dinkum.serialize; this needs 'fn' to be
+picklable and the model to be saveable.
+"""
+
+import os
+import multiprocessing
+import pickle
+
+_worker_fn = None
+
+
+def _call_worker_fn(item):
+    return _worker_fn(item)
+
+
+def _init_spawned_worker(model, fn):
+    "Rebuild the model, and set the worker function, in a spawned worker."
+    global _worker_fn
+    from dinkum import serialize
+
+    serialize.from_dict(model)
+    _worker_fn = fn
+
+
+def can_fork():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def get_num_processes(processes=None):
+    if processes is None:
+        processes = os.cpu_count() or 1
+    return max(int(processes), 1)
+
+
+class WorkerPool:
+    """A persistent pool of forked workers that each run 'fn'.
+
+    Use as a context manager, and call 'map' as often as needed; the
+    workers are forked once, on entry. Falls back to running serially in
+    this process under the same conditions as 'map_processes'.
+
+    'start_method' may be "fork" or "spawn"; by default, workers are
+    forked if the platform supports it, and spawned otherwise.
+    """
+
+    def __init__(self, fn, *, processes=None, start_method=None):
+        self.fn = fn
+        self.processes = get_num_processes(processes)
+        self.start_method = start_method
+        self.pool = None
+
+    def __enter__(self):
+        global _worker_fn
+
+        in_worker = multiprocessing.current_process().daemon
+        if self.processes <= 1 or in_worker:
+            return self
+
+        start_method = self.start_method
+        if start_method is None:
+            start_method = "fork" if can_fork() else "spawn"
+
+        if start_method == "fork":
+            saved_fn = _worker_fn
+            _worker_fn = self.fn
+            try:
+                ctx = multiprocessing.get_context("fork")
+                self.pool = ctx.Pool(self.processes)
+            finally:
+                _worker_fn = saved_fn
+        else:
+            self.pool = self._spawn_pool()
+        return self
+
+    def _spawn_pool(self):
+        "Spawn workers with a copy of the model, or return None if we can't."
+        from dinkum import serialize
+
+        try:
+            model = serialize.to_dict()
+            pickle.dumps(self.fn)
+        except Exception:
+            return None
+
+        ctx = multiprocessing.get_context("spawn")
+        return ctx.Pool(
+            self.processes,
+            initializer=_init_spawned_worker,
+            initargs=(model, self.fn),
+        )
+
+    def __exit__(self, *args):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def map(self, items, *, chunksize=1):
+        items = list(items)
+        if self.pool is None or len(items) <= 1:
+            return [self.fn(item) for item in items]
+        return self.pool.map(_call_worker_fn, items, chunksize=chunksize)
+
+
+def map_processes(fn, items, *, processes=None, chunksize=1):
+    """Return [fn(item) for item in items], computed in worker processes.
+
+    'fn' may be a closure or lambda; it is inherited by the forked
+    workers rather than pickled. Items and results must be picklable.
+
+    Runs serially in this process if 'processes' is 1, if there is only
+    one item, or if we are already inside a worker. Where the platform
+    does not support fork, 'fn' must be picklable and the model saveable
+    (see dinkum.serialize) to run in spawned workers; otherwise, it also
+    runs serially.
+    """
+    items = list(items)
+    processes = min(get_num_processes(processes), max(len(items), 1))
+    with WorkerPool(fn, processes=processes) as pool:
+        return pool.map(items, chunksize=chunksize)
+
+
+def map_batches(fn, items, *, processes=None, batch_size=None):
+    """Like map_processes, but send 'items' to the workers in batches.
+
+    Batching amortizes the per-task overhead when there are many cheap
+    items (e.g. tens of thousands of parameter sets). By default, items
+    are split into about four batches per process.
+    """
+    items = list(items)
+    processes = get_num_processes(processes)
+    if batch_size is None:
+        batch_size = max(1, -(-len(items) // (processes * 4)))
+
+    batches = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+
+    def run_batch(batch):
+        return [fn(item) for item in batch]
+
+    results = []
+    for batch_results in map_processes(run_batch, batches, processes=processes):
+        results.extend(batch_results)
+    return results
@@ -0,0 +1,295 @@
+"""run a time course with tissues partitioned across worker processes.
+
+Tissues are split into contiguous blocks of a neighbor-graph ordering
+chosen to cut few neighbor edges. Each block is advanced by a forked
+worker, which writes its tissues' gene states into arrays in
+multiprocessing.shared_memory. All processes synchronize on a barrier
+once per timepoint; each worker then reads back only the ligand states
+of its halo - the tissues outside its block that its tissues can
+receive ligands from.
+
+Rules in a tissue only read that tissue's own earlier states and the
+ligands it receives, so the results are identical to a serial run.
+"""
+
+import concurrent.futures
+import multiprocessing
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy.sparse import csgraph
+
+from dinkum import vfg, vfn, parallel
+
+# how a level is stored in _SharedStates.kind; 0 means not set
+_INT = 1
+_FLOAT = 2
+
+
+def count_cut_edges(parts, graph=None):
+    "Count the neighbor edges between tissues in different 'parts'."
+    if graph is None:
+        graph = vfn.get_neighbor_graph()
+    owner = np.empty(len(graph), dtype=int)
+    for k, part in enumerate(parts):
+        owner[part] = k
+    rows, cols = graph.adjacency.nonzero()
+    return int((owner[rows] != owner[cols]).sum())
+
+
+def partition_tissues(n_parts, graph=None):
+    """Split the tissues into 'n_parts' blocks of (nearly) equal size, as
+    arrays of indices in neighbor graph order.
+
+    Tries the graph's own order (row-major for lattices) and a reverse
+    Cuthill-McKee ordering, and keeps whichever cuts fewer edges.
+    """
+    if graph is None:
+        graph = vfn.get_neighbor_graph()
+    n = len(graph)
+    n_parts = max(min(n_parts, n), 1)
+
+    symmetric = ((graph.adjacency + graph.adjacency.T) > 0).astype(np.int32)
+    orders = [np.arange(n), csgraph.reverse_cuthill_mckee(symmetric.tocsr(), True)]
+
+    best = None
+    for order in orders:
+        parts = [np.sort(part) for part in np.array_split(order, n_parts)]
+        cut = count_cut_edges(parts, graph)
+        if best is None or cut < best[0]:
+            best = (cut, parts)
+    return best[1]
+
+
+def get_halo(part, graph=None):
+    """Return the indices of the tissues outside 'part' that tissues in
+    'part' can receive a ligand from, given the ligands' ranges."""
+    if graph is None:
+        graph = vfn.get_neighbor_graph()
+    max_range = max((getattr(g, "range", 1) for g in vfg.get_ligands()), default=0)
+    if max_range == 0:
+        return np.zeros(0, dtype=int)
+
+    reach = graph.get_weights(range=max_range)[part]
+    return np.setdiff1d(np.unique(reach.indices), part)
+
+
+class _SharedStates:
+    """Gene levels and activity, indexed by [timepoint, tissue, gene], in
+    shared memory.
+
+    Levels are stored as floats, along with whether each was an int, so
+    that states read back compare equal to the ones written.
+    """
+
+    def __init__(self, n_timepoints, n_tissues, gene_names):
+        self.gene_names = list(gene_names)
+        self.gene_index = {name: i for i, name in enumerate(self.gene_names)}
+        shape = (n_timepoints, n_tissues, len(self.gene_names))
+
+        self._shm = []
+        self.level = self._make_array(shape, np.float64)
+        self.active = self._make_array(shape, bool)
+        self.kind = self._make_array(shape, np.uint8)
+
+    def _make_array(self, shape, dtype):
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._shm.append(shm)
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        arr[...] = 0
+        return arr
+
+    def close(self):
+        "Release the shared memory; call in the parent only, once done."
+        del self.level, self.active, self.kind
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
+
+    def write(self, k, i, gene_states):
+        "Store the OnlyGeneStates of tissue 'i' at timepoint index 'k'."
+        for name, gsi in gene_states.genes_by_name.items():
+            g = self.gene_index[name]
+            level = gsi.level
+            if isinstance(level, (int, np.integer)):
+                self.kind[k, i, g] = _INT
+            else:
+                self.kind[k, i, g] = _FLOAT
+            self.level[k, i, g] = level
+            self.active[k, i, g] = gsi.active
+
+    def read(self, k, i, gene_idx=None):
+        "Return the OnlyGeneStates of tissue 'i' at timepoint index 'k'."
+        from dinkum import OnlyGeneStates
+
+        gene_states = OnlyGeneStates()
+        kind = self.kind[k, i]
+        if gene_idx is None:
+            gene_idx = np.flatnonzero(kind)
+        for g in gene_idx:
+            if not kind[g]:
+                continue
+            level = self.level[k, i, g].item()
+            if kind[g] == _INT:
+                level = int(level)
+            gsi = vfg.GeneStateInfo(level, bool(self.active[k, i, g]))
+            gene_states.genes_by_name[self.gene_names[g]] = gsi
+        return gene_states
+
+    def read_state(self, k, tp, tissues):
+        "Return the TissueAndGeneStateAtTime for all 'tissues' at index 'k'."
+        from dinkum import TissueAndGeneStateAtTime
+
+        state = TissueAndGeneStateAtTime(tissues=tissues, time=tp)
+        for i, tissue in enumerate(tissues):
+            state[tissue] = self.read(k, i)
+        return state
+
+
+def _run_worker(tc, part, halo, shared, timepoints, barrier, stop_flag, errors, args):
+    "Advance the tissues in 'part' through 'timepoints'; runs in a worker."
+    from dinkum import TissueAndGeneStateAtTime, TissueGeneStates
+
+    verbose, check_stop, threads = args
+    tissues = vfn.get_tissues()
+    own = [tissues[i] for i in part]
+    halo_tissues = [tissues[i] for i in halo]
+
+    # only the tissues in this block (and their halo) are kept here,
+    # starting from any states (e.g. initial conditions) set before the run
+    initial_states = tc.states_d
+    tc.states_d = TissueGeneStates()
+    for tp, state in initial_states.items():
+        kept = TissueAndGeneStateAtTime(tissues=own + halo_tissues, time=tp)
+        for tissue in own + halo_tissues:
+            gene_states = state.get(tissue)
+            if gene_states is not None:
+                kept[tissue] = gene_states
+        tc.states_d[tp] = kept
+    ligand_idx = [shared.gene_index[g.name] for g in vfg.get_ligands()]
+    rules_by_tissue = tc._get_rules_by_tissue(own)
+
+    pool = None
+    if threads > 1:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+    try:
+        for k, tp in enumerate(timepoints):
+            next_state = TissueAndGeneStateAtTime(tissues=own + halo_tissues, time=tp)
+            results = tc._advance_tissues(
+                tp, own, rules_by_tissue, pool=pool, threads=threads
+            )
+            for i, tissue, gene_states in zip(part, own, results):
+                next_state[tissue] = gene_states
+                shared.write(k, i, gene_states)
+                if verbose:
+                    print(tp, tissue.name, gene_states)
+
+            # everyone has written timepoint tp => exchange halo ligands
+            barrier.wait()
+            for i, tissue in zip(halo, halo_tissues):
+                next_state[tissue] = shared.read(k, i, ligand_idx)
+            tc.states_d[tp] = next_state
+
+            if check_stop:
+                barrier.wait()
+                if stop_flag.value:
+                    break
+    except threading.BrokenBarrierError:
+        pass  # another process failed
+    except BaseException as e:
+        errors.put(e)
+        barrier.abort()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def run_partitioned(tc, *, processes=None, verbose=False, stop_fn=None, threads=1):
+    """Run the Timecourse 'tc' with its tissues partitioned across
+    'processes' forked workers; see Timecourse.run.
+
+    Falls back to a serial run under the same conditions as
+    parallel.map_processes.
+    """
+    tissues = vfn.get_tissues()
+    processes = min(parallel.get_num_processes(processes), len(tissues))
+    in_worker = multiprocessing.current_process().daemon
+    if processes <= 1 or in_worker or not parallel.can_fork():
+        return tc._run_in_process(verbose=verbose, stop_fn=stop_fn, threads=threads)
+
+    graph = vfn.get_neighbor_graph()
+    assert graph.tissue_names == [t.name for t in tissues]
+    parts = partition_tissues(processes, graph)
+    if verbose:
+        cut = count_cut_edges(parts, graph)
+        print(f"partitioned {len(tissues)} tissues {len(parts)} ways; {cut} cut edges")
+
+    timepoints = list(range(tc.start, tc.stop + 1))
+    shared = _SharedStates(len(timepoints), len(tissues), vfg.get_gene_names())
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Barrier(len(parts) + 1)
+    stop_flag = ctx.Value("b", 0)
+    errors = ctx.Queue()
+    args = (verbose, stop_fn is not None, threads)
+
+    workers = []
+    try:
+        for part in parts:
+            halo = get_halo(part, graph)
+            w = ctx.Process(
+                target=_run_worker,
+                args=(
+                    tc,
+                    part,
+                    halo,
+                    shared,
+                    timepoints,
+                    barrier,
+                    stop_flag,
+                    errors,
+                    args,
+                ),
+                daemon=True,
+            )
+            w.start()
+            workers.append(w)
+
+        n_done = 0
+        read = set()  # timepoints already read back, for stop_fn
+        try:
+            for k, tp in enumerate(timepoints):
+                barrier.wait()
+                n_done = k + 1
+                if stop_fn is not None:
+                    next_state = shared.read_state(k, tp, tissues)
+                    tc.states_d[tp] = next_state
+                    read.add(tp)
+                    stop = bool(stop_fn(next_state))
+                    stop_flag.value = stop
+                    barrier.wait()
+                    if stop:
+                        break
+        except threading.BrokenBarrierError:
+            try:
+                error = errors.get(timeout=10)
+            except queue.Empty:
+                error = Exception("a partitioned run worker exited unexpectedly")
+            raise error
+
+        for w in workers:
+            w.join()
+
+        for k, tp in enumerate(timepoints[:n_done]):
+            if tp not in read:
+                tc.states_d[tp] = shared.read_state(k, tp, tissues)
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+                w.join()
+        shared.close()
@@ -0,0 +1,312 @@
+"""global sensitivity analysis over rule parameters.
+
+Morris elementary effects and Sobol first/total-order indices, over the
+parameter space exposed by get_params of the given fit genes. Model
+evaluations are batched across worker processes.
+"""
+
+import numpy as np
+import pandas as pd
+
+import dinkum
+from dinkum import vfg, vfn, observations, parallel
+from dinkum.vfg_functions import ParameterMap
+
+
+def get_param_bounds(pmap, bounds=None):
+    """Return (names, lower, upper) for the varied parameters in 'pmap'.
+
+    'bounds' optionally overrides bounds, as {name: (min, max)}; every
+    varied parameter must end up with finite bounds.
+    """
+    bounds = dict(bounds or {})
+    names, lower, upper = [], [], []
+    for name, p in pmap.params.items():
+        if not p.vary:
+            continue
+        lo, hi = bounds.pop(name, (p.min, p.max))
+        names.append(name)
+        lower.append(lo)
+        upper.append(hi)
+
+    if bounds:
+        raise Exception(f"unknown parameters in bounds: {sorted(bounds)}")
+
+    lower = np.array(lower, dtype=float)
+    upper = np.array(upper, dtype=float)
+    unbounded = [
+        n for n, lo, hi in zip(names, lower, upper) if not np.isfinite(hi - lo)
+    ]
+    if unbounded:
+        raise Exception(f"parameters need finite bounds: {unbounded}")
+
+    return names, lower, upper
+
+
+def morris_samples(n_trajectories, n_params, *, num_levels=4, seed=None):
+    """Generate Morris one-at-a-time trajectories in the unit hypercube.
+
+    Returns an array of shape (n_trajectories * (n_params + 1), n_params);
+    within each trajectory, consecutive rows differ in exactly one
+    parameter, by +/- delta = num_levels / (2 * (num_levels - 1)).
+    'num_levels' must be even, so that every grid level can move by delta
+    and stay within [0, 1].
+    """
+    if num_levels < 2 or num_levels % 2:
+        raise Exception(f"num_levels must be even and >= 2, not {num_levels}")
+    rng = np.random.default_rng(seed)
+    delta = num_levels / (2 * (num_levels - 1))
+    grid = np.arange(num_levels) / (num_levels - 1)
+
+    rows = []
+    for r in range(n_trajectories):
+        x = rng.choice(grid, size=n_params)
+        rows.append(x.copy())
+        for i in rng.permutation(n_params):
+            can_up = x[i] + delta <= 1 + 1e-12
+            can_down = x[i] - delta >= -1e-12
+            if can_up and (not can_down or rng.random() < 0.5):
+                x[i] += delta
+            else:
+                x[i] -= delta
+            rows.append(x.copy())
+
+    return np.array(rows)
+
+
+def saltelli_samples(n_samples, n_params, *, seed=None):
+    """Generate Saltelli samples in the unit hypercube.
+
+    Returns an array of shape (n_samples * (n_params + 2), n_params):
+    matrices A, B, then AB_i for each parameter i (A with column i
+    taken from B).
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.random((n_samples, n_params))
+    b = rng.random((n_samples, n_params))
+
+    blocks = [a, b]
+    for i in range(n_params):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        blocks.append(ab)
+
+    return np.vstack(blocks)
+
+
+def _make_output_fn(
+    start, stop, *, pmap, vary_index, outputs, gene_names, tissue_names
+):
+    "Return (labels, fn) where fn(values) runs the model and returns outputs."
+    tc = dinkum.Timecourse(start=start, stop=stop)
+    base_values = pmap.values.copy()
+    timepoints = list(range(start, stop + 1))
+
+    if outputs == "levels":
+        if gene_names is None:
+            gene_names = vfg.get_gene_names()
+        if tissue_names is None:
+            tissue_names = vfn.get_tissue_names()
+        labels = pd.MultiIndex.from_product(
+            [gene_names, tissue_names, timepoints], names=["gene", "tissue", "time"]
+        )
+    elif outputs == "observations":
+        labels = pd.Index(
+            [ob.render() for ob in observations.get_obs()], name="observation"
+        )
+    else:
+        raise Exception(f"unknown outputs '{outputs}'; use 'levels' or 'observations'")
+
+    def run_model(values):
+        params = base_values.copy()
+        params[vary_index] = values
+        pmap.set_values(params)
+        tc.reset()
+        tc.run()
+
+        if outputs == "levels":
+            _, level, _ = tc.get_states().to_arrays(
+                timepoints=timepoints, tissue_names=tissue_names, gene_names=gene_names
+            )
+            # (time, tissue, gene) => (gene, tissue, time), to match labels
+            return level.transpose(2, 1, 0).reshape(-1)
+        else:
+            results = observations.check_each(tc)
+            return np.array([1.0 if r else 0.0 for r in results])
+
+    return labels, run_model
+
+
+def _evaluate(
+    start,
+    stop,
+    make_samples,
+    *,
+    fit_genes,
+    bounds,
+    outputs,
+    gene_names,
+    tissue_names,
+    processes,
+    batch_size,
+):
+    """Evaluate the model on unit-hypercube samples from 'make_samples(k)',
+    scaled to the parameter bounds."""
+    pmap = ParameterMap(fit_genes)
+    initial_values = pmap.values.copy()
+    names, lower, upper = get_param_bounds(pmap, bounds)
+    vary_index = np.array([pmap.index[name] for name in names], dtype=int)
+
+    labels, run_model = _make_output_fn(
+        start,
+        stop,
+        pmap=pmap,
+        vary_index=vary_index,
+        outputs=outputs,
+        gene_names=gene_names,
+        tissue_names=tissue_names,
+    )
+
+    unit = make_samples(len(names))
+    samples = lower + unit * (upper - lower)
+    print(f"evaluating {len(samples)} parameter sets over {len(names)} parameters")
+    try:
+        results = parallel.map_batches(
+            run_model, samples, processes=processes, batch_size=batch_size
+        )
+    finally:
+        pmap.set_values(initial_values)
+
+    return names, unit, labels, np.array(results)
+
+
+def morris(
+    start,
+    stop,
+    *,
+    fit_genes,
+    n_trajectories=10,
+    num_levels=4,
+    bounds=None,
+    outputs="levels",
+    gene_names=None,
+    tissue_names=None,
+    seed=None,
+    processes=None,
+    batch_size=None,
+):
+    """Morris screening of the fit genes' parameters.
+
+    'outputs' is "levels", to analyze every (gene, tissue, time) level
+    (optionally restricted by 'gene_names'/'tissue_names'), or
+    "observations", to analyze whether each observation is satisfied
+    (1) or not (0).
+
+    Returns a dictionary of DataFrames 'mu', 'mu_star' and 'sigma' of
+    elementary effect statistics, indexed by output, with one column per
+    parameter. Effects are per unit of each parameter's range.
+    'num_levels', the number of grid levels per parameter, must be even.
+    """
+
+    def make_samples(k):
+        return morris_samples(n_trajectories, k, num_levels=num_levels, seed=seed)
+
+    names, unit, labels, y = _evaluate(
+        start,
+        stop,
+        make_samples,
+        fit_genes=fit_genes,
+        bounds=bounds,
+        outputs=outputs,
+        gene_names=gene_names,
+        tissue_names=tissue_names,
+        processes=processes,
+        batch_size=batch_size,
+    )
+
+    # elementary effects: one per parameter per trajectory
+    k = len(names)
+    effects = np.zeros((n_trajectories, k, y.shape[1]))
+    for r in range(n_trajectories):
+        rows = slice(r * (k + 1), (r + 1) * (k + 1))
+        x_traj = unit[rows]
+        y_traj = y[rows]
+        for j in range(k):
+            dx = x_traj[j + 1] - x_traj[j]
+            i = int(np.flatnonzero(dx)[0])
+            effects[r, i] = (y_traj[j + 1] - y_traj[j]) / dx[i]
+
+    def to_df(arr):
+        return pd.DataFrame(arr.T, index=labels, columns=names)
+
+    if n_trajectories > 1:
+        sigma = effects.std(axis=0, ddof=1)
+    else:
+        sigma = np.full(effects.shape[1:], np.nan)
+    return dict(
+        mu=to_df(effects.mean(axis=0)),
+        mu_star=to_df(np.abs(effects).mean(axis=0)),
+        sigma=to_df(sigma),
+    )
+
+
+def sobol(
+    start,
+    stop,
+    *,
+    fit_genes,
+    n_samples=256,
+    bounds=None,
+    outputs="levels",
+    gene_names=None,
+    tissue_names=None,
+    seed=None,
+    processes=None,
+    batch_size=None,
+):
+    """Sobol first-order and total-order indices of the fit genes' parameters.
+
+    Uses n_samples * (n_params + 2) model evaluations, with the Saltelli
+    (first order) and Jansen (total order) estimators. 'outputs' is as
+    for 'morris'.
+
+    Returns a dictionary of DataFrames 'S1' and 'ST', indexed by output,
+    with one column per parameter. Outputs that never vary are NaN.
+    """
+
+    def make_samples(k):
+        return saltelli_samples(n_samples, k, seed=seed)
+
+    names, unit, labels, y = _evaluate(
+        start,
+        stop,
+        make_samples,
+        fit_genes=fit_genes,
+        bounds=bounds,
+        outputs=outputs,
+        gene_names=gene_names,
+        tissue_names=tissue_names,
+        processes=processes,
+        batch_size=batch_size,
+    )
+
+    k = len(names)
+    n = n_samples
+    y_a = y[:n]
+    y_b = y[n : 2 * n]
+    variance = np.var(np.concatenate([y_a, y_b]), axis=0)
+
+    s1 = np.zeros((k, y.shape[1]))
+    st = np.zeros((k, y.shape[1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(k):
+            y_ab = y[(2 + i) * n : (3 + i) * n]
+            s1[i] = np.mean(y_b * (y_ab - y_a), axis=0) / variance
+            st[i] = 0.5 * np.mean(np.square(y_a - y_ab), axis=0) / variance
+    s1[:, variance == 0] = np.nan
+    st[:, variance == 0] = np.nan
+
+    def to_df(arr):
+        return pd.DataFrame(arr.T, index=labels, columns=names)
+
+    return dict(S1=to_df(s1), ST=to_df(st))
@@ -0,0 +1,305 @@
+"""save and load models as versioned JSON.
+
+A saved model holds the genes (with their ligand and receptor settings),
+tissues, lattices, neighbor links, and rules, in order:
+
+    dinkum.save_model("model.json")    # or "model.json.gz"
+    ...
+    dinkum.load_model("model.json")
+
+Rule parameters are stored as JSON values, with genes and tissues by
+name. Custom functions and classes are stored by importable reference,
+'module:qualname', so they must be defined at the top level of an
+importable module (not in a notebook or a closure) for a model to be
+saved.
+
+Loading is done in bulk: tissues are linked, and rules are checked for
+duplicates, once at the end. The same dict representation, from to_dict
+and from_dict, is used to send models to spawned worker processes (see
+dinkum.parallel).
+"""
+
+import gzip
+import importlib
+import json
+
+import numpy as np
+
+from dinkum import vfg, vfn, observations
+from dinkum.exceptions import DinkumInvalidTissue
+
+FORMAT = "dinkum-model"
+FORMAT_VERSION = 1
+
+GENE_CLASSES = {"gene": vfg.Gene, "ligand": vfg.Ligand, "receptor": vfg.Receptor}
+
+
+def get_ref(obj):
+    "Return the importable reference 'module:qualname' of a function or class."
+    ref = f"{obj.__module__}:{obj.__qualname__}"
+    try:
+        found = resolve_ref(ref)
+    except (ImportError, AttributeError):
+        found = None
+    if found is not obj:
+        raise Exception(f"cannot save {obj!r}: it is not importable as '{ref}'")
+    return ref
+
+
+def resolve_ref(ref):
+    "Return the function or class named by 'module:qualname'."
+    module_name, qualname = ref.split(":")
+    obj = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _encode(value):
+    "Encode a rule parameter as a JSON value."
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, vfg.Gene):
+        return {"gene": value.name}
+    if isinstance(value, vfn.Tissue):
+        return {"tissue": value.name}
+    if isinstance(value, list):
+        return [_encode(x) for x in value]
+    if isinstance(value, tuple):
+        return {"tuple": [_encode(x) for x in value]}
+    if isinstance(value, dict):
+        return {"dict": [[_encode(k), _encode(v)] for k, v in value.items()]}
+    if isinstance(value, np.ndarray):
+        return {"ndarray": value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, vfg.CustomActivation):
+        return {"object": get_ref(type(value)), "attrs": _encode(vars(value))}
+    if isinstance(value, type) or callable(value) and hasattr(value, "__qualname__"):
+        return {"ref": get_ref(value)}
+    raise Exception(f"cannot save rule parameter {value!r}")
+
+
+def _decode(value, genes):
+    "Decode a JSON value from _encode."
+    if isinstance(value, list):
+        return [_decode(x, genes) for x in value]
+    if not isinstance(value, dict):
+        return value
+    if "gene" in value:
+        return genes[value["gene"]]
+    if "tissue" in value:
+        return vfn.get_tissue(value["tissue"])
+    if "tuple" in value:
+        return tuple(_decode(x, genes) for x in value["tuple"])
+    if "dict" in value:
+        return {_decode(k, genes): _decode(v, genes) for k, v in value["dict"]}
+    if "ndarray" in value:
+        return np.array(value["ndarray"], dtype=value["dtype"])
+    if "ref" in value:
+        return resolve_ref(value["ref"])
+    if "object" in value:
+        return _new_object(resolve_ref(value["object"]), _decode(value["attrs"], genes))
+    raise Exception(f"cannot load rule parameter {value!r}")
+
+
+def _new_object(cls, attrs):
+    "Recreate an object from its attributes, without calling __init__."
+    obj = cls.__new__(cls)
+    obj.__dict__.update(attrs)
+    return obj
+
+
+def _gene_to_dict(gene):
+    for kind, cls in GENE_CLASSES.items():
+        if type(gene) is cls:
+            break
+    else:
+        raise Exception(f"cannot save gene {gene.name} of class {type(gene)}")
+
+    d = dict(name=gene.name, kind=kind)
+    if kind == "ligand":
+        d.update(
+            is_juxtacrine=gene.is_juxtacrine,
+            range=gene.range,
+            attenuation=_encode(gene.attenuation),
+        )
+    elif kind == "receptor":
+        ligand = gene._set_ligand
+        d.update(ligand=ligand.name if ligand else None, threshold=gene.threshold)
+    return d
+
+
+def _rule_to_dict(rule):
+    if isinstance(rule, vfg.Interaction_IsPresent):
+        return dict(
+            type="is_present",
+            dest=rule.dest.name,
+            tissue=rule.tissue.name,
+            start=rule.start,
+            duration=rule.duration,
+            level=_encode(rule.level),
+            decay=_encode(rule.decay),
+        )
+    elif isinstance(rule, vfg.Interaction_Custom):
+        return dict(
+            type="custom_fn",
+            dest=rule.dest.name,
+            delay=rule.delay,
+            state_fn=_encode(rule.state_fn),
+        )
+    elif isinstance(rule, vfg.Interaction_CustomObj):
+        attrs = {k: v for k, v in vars(rule.obj).items() if k != "target"}
+        return dict(
+            type="custom_obj",
+            dest=rule.dest.name,
+            cls=get_ref(type(rule.obj)),
+            params=_encode(attrs),
+        )
+    raise Exception(f"cannot save rule {rule!r} of class {type(rule)}")
+
+
+def _rule_from_dict(d, genes):
+    dest = genes[d["dest"]]
+    kind = d["type"]
+    if kind == "is_present":
+        tissue = vfn.get_tissue(d["tissue"])
+        if tissue is None:
+            raise DinkumInvalidTissue(f"{d['tissue']} is an invalid tissue")
+        return vfg.Interaction_IsPresent(
+            dest=dest,
+            tissue=tissue,
+            start=d["start"],
+            duration=d["duration"],
+            level=_decode(d["level"], genes),
+            decay=_decode(d["decay"], genes),
+        )
+    elif kind == "custom_fn":
+        state_fn = _decode(d["state_fn"], genes)
+        return vfg.Interaction_Custom(dest=dest, state_fn=state_fn, delay=d["delay"])
+    elif kind == "custom_obj":
+        obj = _new_object(resolve_ref(d["cls"]), _decode(d["params"], genes))
+        obj.set_gene(dest)
+        return vfg.Interaction_CustomObj(dest=dest, obj=obj)
+    raise Exception(f"unknown rule type '{kind}'")
+
+
+def to_dict():
+    "Return the current model as a JSON-serializable dict."
+    import dinkum
+
+    lattice_cells = set()
+    lattice_edges = set()
+    lattices = []
+    for lattice in vfn._lattices:
+        lattices.append(
+            dict(
+                name=lattice.name,
+                shape=list(lattice.shape),
+                neighborhood=lattice.neighborhood,
+                periodic=list(lattice.periodic),
+            )
+        )
+        names = lattice.tissue_names
+        lattice_cells.update(names)
+        lattice_edges.update((names[i], names[j]) for i, j in zip(*lattice.edges))
+
+    tissues = []
+    neighbors = []
+    for t in vfn._tissues:
+        if t.name not in lattice_cells:
+            tissues.append(t.name)
+        for n in sorted(t.neighbors):
+            if n.name != t.name and (t.name, n.name) not in lattice_edges:
+                neighbors.append([t.name, n.name])
+    neighbors.sort()
+
+    return dict(
+        format=FORMAT,
+        format_version=FORMAT_VERSION,
+        dinkum_version=dinkum.__version__,
+        genes=[_gene_to_dict(g) for g in vfg._genes],
+        tissues=tissues,
+        lattices=lattices,
+        neighbors=neighbors,
+        rules=[_rule_to_dict(r) for r in vfg.get_rules()],
+    )
+
+
+def from_dict(d, *, reset=True):
+    """Build the model in 'd', from to_dict. By default, the current
+    model is reset first."""
+    if d.get("format") != FORMAT:
+        raise Exception("not a saved dinkum model")
+    version = d.get("format_version")
+    if version != FORMAT_VERSION:
+        raise Exception(f"unsupported model format version '{version}'")
+
+    if reset:
+        vfg.reset()
+        vfn.reset()
+        observations.reset()
+
+    # tissues, linked all at once
+    for name in d["tissues"]:
+        vfn.Tissue(name=name)
+    for ld in d["lattices"]:
+        vfn.Lattice(
+            ld["shape"],
+            name=ld["name"],
+            neighborhood=ld["neighborhood"],
+            periodic=tuple(ld["periodic"]),
+        )
+    for name, neighbor_name in d["neighbors"]:
+        t = vfn.get_tissue(name)
+        neighbor = vfn.get_tissue(neighbor_name)
+        if t is None or neighbor is None:
+            raise DinkumInvalidTissue(f"unknown neighbors {name}, {neighbor_name}")
+        t.neighbors.add(neighbor)
+    vfn._invalidate_neighbor_graph()
+
+    # genes; ligands are always created before their receptors
+    genes = {}
+    for gd in d["genes"]:
+        kind = gd["kind"]
+        if kind == "ligand":
+            gene = vfg.Ligand(
+                name=gd["name"],
+                is_juxtacrine=gd["is_juxtacrine"],
+                range=gd["range"],
+                attenuation=_decode(gd["attenuation"], genes),
+            )
+        elif kind == "receptor":
+            ligand = genes[gd["ligand"]] if gd["ligand"] else None
+            gene = vfg.Receptor(
+                name=gd["name"], ligand=ligand, threshold=gd["threshold"]
+            )
+        else:
+            gene = GENE_CLASSES[kind](name=gd["name"])
+        genes[gene.name] = gene
+
+    # rules, checked once
+    rules = [_rule_from_dict(rd, genes) for rd in d["rules"]]
+    vfg.add_rules(rules)
+
+
+def _open(path, mode):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def save_model(path):
+    """Save the current model to 'path', as JSON; gzipped if 'path' ends
+    in '.gz'."""
+    d = to_dict()
+    with _open(path, "w") as fp:
+        json.dump(d, fp, separators=(",", ":"))
+
+
+def load_model(path, *, reset=True):
+    """Load a model saved by save_model. By default, the current model is
+    reset first."""
+    with _open(path, "r") as fp:
+        d = json.load(fp)
+    from_dict(d, reset=reset)
@@ -0,0 +1,174 @@
+"""an on-disk, memory-mapped store for time course states.
+
+A store is a directory holding the arrays of a ColumnarTissueGeneStates
+as .npy files - level, active, kind and assigned - plus metadata.json,
+with the time, tissue and gene axes, the level dtype, which timepoints
+have been set, and the run parameters.
+
+The arrays are numpy memmaps, so a run can write states straight to
+disk, and a store can be reopened instantly and analyzed out-of-core,
+or shared read-only between processes without copying.
+
+    tc = Timecourse(start=1, stop=100, store="run1")
+    tc.run()
+    ...
+    states = dinkum.store.open_store("run1")
+"""
+
+import json
+import os
+
+import numpy as np
+
+from dinkum.columnar import ColumnarStateAtTime, ColumnarTissueGeneStates
+
+FORMAT_VERSION = 1
+METADATA_FILE = "metadata.json"
+ARRAY_NAMES = ("level", "active", "kind", "assigned")
+
+
+def _write_metadata(path, metadata):
+    "Write metadata.json in 'path', atomically."
+    filename = os.path.join(path, METADATA_FILE)
+    tmp_path = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fp:
+        json.dump(metadata, fp, indent=2)
+    os.replace(tmp_path, filename)
+
+
+class StoredTissueGeneStates(ColumnarTissueGeneStates):
+    """
+    ColumnarTissueGeneStates backed by memory-mapped files in 'path'.
+
+    Open with open_store, or create with create_store. Unlike in-memory
+    columnar states, the time axis is fixed. Call 'flush' to make sure
+    that everything written so far is on disk; Timecourse.run does so.
+    """
+
+    def __init__(self, path, *, mode="r"):
+        assert mode in ("r", "r+", "c"), "mode must be 'r', 'r+' or 'c'"
+        self.path = path
+        self.mode = mode
+
+        with open(os.path.join(path, METADATA_FILE)) as fp:
+            self.metadata = json.load(fp)
+        version = self.metadata.get("format_version")
+        if version != FORMAT_VERSION:
+            raise Exception(f"unsupported store format version '{version}' in {path}")
+        self.params = self.metadata["params"]
+
+        super().__init__(
+            timepoints=self.metadata["timepoints"],
+            tissue_names=self.metadata["tissue_names"],
+            gene_names=self.metadata["gene_names"],
+            level_dtype=np.dtype(self.metadata["level_dtype"]),
+        )
+        for tp in self.metadata["set_timepoints"]:
+            self.data[tp] = ColumnarStateAtTime(self, tp, self.time_index[tp])
+
+    def __repr__(self):
+        return f"StoredTissueGeneStates('{self.path}', mode='{self.mode}')"
+
+    def _allocate(self, shape, level_dtype):
+        for name in ARRAY_NAMES:
+            filename = os.path.join(self.path, f"{name}.npy")
+            arr = np.load(filename, mmap_mode=self.mode)
+            setattr(self, name, arr)
+
+        if self.level.shape != shape or self.assigned.shape != shape[:2]:
+            raise Exception(f"store arrays in {self.path} do not match its axes")
+        if self.level.dtype != level_dtype:
+            raise Exception(f"store levels in {self.path} are not {level_dtype}")
+
+    def _get_row(self, timepoint):
+        row = self.time_index.get(int(timepoint))
+        if row is None:
+            raise Exception(f"timepoint {timepoint} is not in the store {self.path}")
+        return row
+
+    def check_run(self, timepoints):
+        """Raise an exception, before anything is simulated, unless a run
+        of the current model over 'timepoints' can be written here."""
+        from dinkum import vfg, vfn
+
+        if self.mode != "r+":
+            raise Exception(f"the store {self.path} is not open for writing")
+        if any(tp not in self.time_index for tp in timepoints):
+            raise Exception(
+                f"the store {self.path} holds timepoints {self.timepoints[0]} to"
+                f" {self.timepoints[-1]}, not {timepoints[0]} to {timepoints[-1]}"
+            )
+        if self.tissue_names != vfn.get_tissue_names():
+            raise Exception(f"the store {self.path} was made for other tissues")
+        if self.gene_names != vfg.get_gene_names():
+            raise Exception(f"the store {self.path} was made for other genes")
+
+    def flush(self):
+        "Write the arrays and metadata to disk."
+        if self.mode != "r+":
+            return
+        for name in ARRAY_NAMES:
+            getattr(self, name).flush()
+        self.metadata["set_timepoints"] = sorted(self.data)
+        _write_metadata(self.path, self.metadata)
+
+
+def create_store(
+    path,
+    *,
+    timepoints,
+    tissue_names=None,
+    gene_names=None,
+    level_dtype=np.float64,
+    params=None,
+):
+    """Create a new store in the directory 'path', and return it open for
+    writing, as a StoredTissueGeneStates.
+
+    Axes default to the current model's tissues and genes. Levels are
+    float64 by default, as in a run; a smaller 'level_dtype' rounds them
+    (see dinkum.columnar). 'params' is a JSON-serializable dict of run
+    parameters to keep with the results.
+    """
+    from dinkum import vfg, vfn
+
+    if os.path.exists(os.path.join(path, METADATA_FILE)):
+        raise Exception(f"a store already exists in {path}")
+    if tissue_names is None:
+        tissue_names = vfn.get_tissue_names()
+    if gene_names is None:
+        gene_names = vfg.get_gene_names()
+
+    timepoints = [int(tp) for tp in timepoints]
+    level_dtype = np.dtype(level_dtype)
+    shape = (len(timepoints), len(tissue_names), len(gene_names))
+
+    os.makedirs(path, exist_ok=True)
+    dtypes = dict(level=level_dtype, active=bool, kind=np.uint8, assigned=bool)
+    for name in ARRAY_NAMES:
+        arr_shape = shape[:2] if name == "assigned" else shape
+        filename = os.path.join(path, f"{name}.npy")
+        arr = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=dtypes[name], shape=arr_shape
+        )
+        arr.flush()
+        del arr
+
+    metadata = dict(
+        format_version=FORMAT_VERSION,
+        timepoints=timepoints,
+        tissue_names=list(tissue_names),
+        gene_names=list(gene_names),
+        level_dtype=level_dtype.str,
+        set_timepoints=[],
+        params=dict(params or {}),
+    )
+    _write_metadata(path, metadata)
+
+    return StoredTissueGeneStates(path, mode="r+")
+
+
+def open_store(path, *, mode="r"):
+    """Open the store in 'path'. By default it is read-only; use mode="r+"
+    to write to it, or "c" for copy-on-write."""
+    return StoredTissueGeneStates(path, mode=mode)
@@ -0,0 +1,283 @@
+"""search over circuit wirings for those that satisfy the observations.
+
+A topology assigns at most one rule to each target gene, as a
+(target, logic, sources) triple, where 'logic' is the name of the Gene
+method that builds the rule: 'activated_by', 'activated_by_or',
+'activated_by_and' or 'and_not'. Topologies are kept in a canonical form
+(a sorted tuple of triples), so that equivalent wirings share a hash.
+
+The fixed part of the model - genes, tissues, maternal inputs and
+observations - is built by a user-supplied 'setup_fn', which is called
+after dinkum.reset() for every candidate.
+"""
+
+import collections
+import hashlib
+import math
+
+import dinkum
+from dinkum import vfg, observations, parallel
+from dinkum.exceptions import DinkumException
+
+LOGIC_TYPES = ("activated_by", "activated_by_or", "activated_by_and", "and_not")
+
+TopologyScore = collections.namedtuple(
+    "TopologyScore", ["topology", "n_failed", "n_edges", "key"]
+)
+
+
+def canonical_topology(wiring):
+    """Return the canonical form of 'wiring', an iterable of
+    (target, logic, sources) triples."""
+    rules = {}
+    for target, logic, sources in wiring:
+        if logic not in LOGIC_TYPES:
+            raise Exception(f"unknown logic '{logic}'; must be one of {LOGIC_TYPES}")
+        if target in rules:
+            raise Exception(f"multiple rules for target '{target}'")
+        sources = tuple(sources)
+        if logic == "activated_by":
+            assert len(sources) == 1
+        elif logic == "and_not":
+            assert len(sources) == 2  # (activator, repressor): order matters
+        else:
+            sources = tuple(sorted(sources))
+        rules[target] = (target, logic, sources)
+
+    return tuple(rules[target] for target in sorted(rules))
+
+
+def topology_hash(topology):
+    "Return a stable hash of a canonical topology."
+    return hashlib.sha256(repr(topology).encode("utf-8")).hexdigest()
+
+
+def count_edges(topology):
+    return sum(len(sources) for _, _, sources in topology)
+
+
+def apply_topology(topology):
+    "Add the rules for 'topology' to the current model."
+    for target, logic, sources in topology:
+        gene = vfg.get_gene(target)
+        src = [vfg.get_gene(name) for name in sources]
+        if logic == "activated_by":
+            gene.activated_by(source=src[0])
+        elif logic == "activated_by_or":
+            gene.activated_by_or(sources=src)
+        elif logic == "activated_by_and":
+            gene.activated_by_and(sources=src)
+        elif logic == "and_not":
+            gene.and_not(activator=src[0], repressor=src[1])
+
+
+def neighbor_topologies(topology, *, targets, sources, logic=LOGIC_TYPES, max_inputs=2):
+    """Return the set of topologies one edit away from 'topology': adding,
+    removing or replacing one input, or changing the logic of one rule."""
+    rules = {target: (logic_, srcs) for target, logic_, srcs in topology}
+    logic = set(logic)
+
+    def options(target):
+        "Yield every (logic, sources) one edit away, or None to remove the rule."
+        if target not in rules:
+            if "activated_by" in logic:
+                for s in sources:
+                    yield "activated_by", (s,)
+            return
+
+        yield None
+        kind, srcs = rules[target]
+        others = [s for s in sources if s not in srcs]
+
+        if kind == "activated_by":
+            (a,) = srcs
+            for b in others:
+                yield "activated_by", (b,)
+                if max_inputs >= 2:
+                    yield "activated_by_or", (a, b)
+                    yield "activated_by_and", (a, b)
+                    yield "and_not", (a, b)
+        elif kind == "and_not":
+            a, r = srcs
+            yield "activated_by", (a,)
+            for b in others:
+                yield "and_not", (a, b)
+        else:
+            other_kind = (
+                "activated_by_and" if kind == "activated_by_or" else "activated_by_or"
+            )
+            yield other_kind, srcs
+            if len(srcs) < max_inputs:
+                for b in others:
+                    yield kind, srcs + (b,)
+            for s in srcs:
+                fewer = tuple(x for x in srcs if x != s)
+                yield (kind if len(fewer) > 1 else "activated_by"), fewer
+
+    neighbors = set()
+    for target in targets:
+        for option in options(target):
+            if option is not None and option[0] not in logic:
+                continue
+            new_rules = dict(rules)
+            if option is None:
+                del new_rules[target]
+            else:
+                new_rules[target] = option
+            neighbors.add(
+                canonical_topology(
+                    (t, kind, srcs) for t, (kind, srcs) in new_rules.items()
+                )
+            )
+
+    neighbors.discard(topology)
+    return neighbors
+
+
+def _make_score_fn(setup_fn, start, stop):
+    """Return fn((topology, max_failures)) => (n_failed, complete), which
+    builds and runs the model, stopping once more than max_failures
+    observations have failed."""
+    tc = dinkum.Timecourse(start=start, stop=stop)
+
+    def score(item):
+        topology, max_failures = item
+        dinkum.reset(verbose=False)
+        setup_fn()
+        checker = observations.ObservationChecker()
+        try:
+            apply_topology(topology)
+            tc.reset()
+            tc.run(stop_fn=lambda state: checker.check(state) > max_failures)
+        except DinkumException:
+            return math.inf, True
+
+        return checker.n_failed, checker.n_failed <= max_failures
+
+    return score
+
+
+def search_topologies(
+    setup_fn,
+    *,
+    start,
+    stop,
+    targets,
+    sources=None,
+    logic=LOGIC_TYPES,
+    max_inputs=2,
+    beam_width=20,
+    max_steps=10,
+    initial=(),
+    cache=None,
+    processes=None,
+):
+    """Beam search over wirings of the 'targets' genes.
+
+    'setup_fn' builds everything but the target genes' rules, including
+    the observations to satisfy. Inputs are drawn from 'sources'
+    (default: every transcription factor). Starting from 'initial'
+    (default: no rules), each step scores every unseen topology one edit
+    away from the beam, and keeps the 'beam_width' best by (number of
+    failed observations, number of edges).
+
+    Candidates are scored across worker processes; a run stops as soon
+    as it fails more observations than the worst member of a full beam.
+    Scores are kept in 'cache', a dict keyed by topology_hash, which can
+    be passed in again to reuse them across searches with the same
+    setup_fn.
+
+    Returns the Pareto set of scored topologies over (n_failed, n_edges),
+    as a list of TopologyScore sorted by increasing number of edges; the
+    last entry has the fewest failures. The model is left as built by
+    setup_fn alone.
+    """
+    if cache is None:
+        cache = {}
+
+    dinkum.reset(verbose=False)
+    setup_fn()
+    gene_names = vfg.get_gene_names()
+    for name in targets:
+        if name not in gene_names:
+            raise Exception(f"unknown target gene '{name}'")
+    if sources is None:
+        sources = [name for name in gene_names if vfg.get_gene(name).is_tf]
+    n_obs = len(observations.get_obs())
+
+    scores = {}  # topology => (n_failed, complete)
+
+    def score_all(pool, topologies, max_failures):
+        todo = []
+        for topology in topologies:
+            cached = cache.get(topology_hash(topology))
+            if cached is not None:
+                n_failed, complete = cached
+                if complete or n_failed > max_failures:
+                    scores[topology] = cached
+                    continue
+            todo.append(topology)
+
+        results = pool.map([(topology, max_failures) for topology in todo])
+        for topology, result in zip(todo, results):
+            cache[topology_hash(topology)] = result
+            scores[topology] = result
+
+    def sort_key(topology):
+        n_failed, complete = scores[topology]
+        return (n_failed, count_edges(topology), topology)
+
+    score_fn = _make_score_fn(setup_fn, start, stop)
+    try:
+        with parallel.WorkerPool(score_fn, processes=processes) as pool:
+            beam = [canonical_topology(initial)]
+            score_all(pool, beam, n_obs)
+
+            for step in range(max_steps):
+                candidates = set()
+                for topology in beam:
+                    candidates.update(
+                        neighbor_topologies(
+                            topology,
+                            targets=targets,
+                            sources=sources,
+                            logic=logic,
+                            max_inputs=max_inputs,
+                        )
+                    )
+                candidates -= set(scores)
+                if not candidates:
+                    break
+
+                max_failures = n_obs
+                if len(beam) >= beam_width:
+                    max_failures = scores[beam[-1]][0]
+                score_all(pool, sorted(candidates), max_failures)
+
+                complete = [t for t in set(beam) | candidates if scores[t][1]]
+                beam = sorted(complete, key=sort_key)[:beam_width]
+                print(
+                    f"topology search step {step}: {len(candidates)} candidates, "
+                    f"best has {scores[beam[0]][0]} failed observations"
+                )
+    finally:
+        dinkum.reset(verbose=False)
+        setup_fn()
+
+    pareto = []
+    best_failed = math.inf
+    complete = [t for t in scores if scores[t][1]]
+    for topology in sorted(complete, key=lambda t: (count_edges(t), sort_key(t))):
+        n_failed = scores[topology][0]
+        if n_failed < best_failed:
+            best_failed = n_failed
+            pareto.append(
+                TopologyScore(
+                    topology=topology,
+                    n_failed=n_failed,
+                    n_edges=count_edges(topology),
+                    key=topology_hash(topology),
+                )
+            )
+
+    return pareto
@@ -1,91 +1,245 @@
+import collections
 import csv
 
-from . import vfg, vfn
+import pandas as pd
 
+from . import vfg, vfn, observations
+from .edges import from_edges
 
-def output_biotapestry_csv(output_filename):
-    def fill_ten(ls):
-        return list(ls) + [""] * (10 - len(ls))
+BASE_MODEL_NAME = "double neg"
+SIGNS = ("positive", "negative", "neutral")
 
-    fp = open(output_filename, "w", newline="")
-    w = csv.writer(fp)
+LINK_HEADER = [
+    "# Command Type",
+    "Model Name",
+    "Source Type",
+    "Source Name",
+    "Target Type",
+    "Target Name",
+    "Sign",
+    "Source Region Abbrev",
+    "Target Region Abbrev",
+]
+
+
+def _fill_ten(ls):
+    return list(ls) + [""] * (10 - len(ls))
+
+
+def _get_rule_tissue(rule):
+    "Return the one tissue 'rule' applies in, or None if it applies anywhere."
+    tissue = getattr(rule, "tissue", None)
+    if tissue is None:
+        tissue = getattr(getattr(rule, "obj", None), "tissue", None)
+    return tissue
+
+
+def _get_rule_links():
+    """Return the (autonomous links, signal links) of each rule that has
+    any, as a list for rules that apply anywhere, and a dict of lists by
+    tissue name for those that apply in one tissue."""
+    anywhere = []
+    by_tissue = collections.defaultdict(list)
+    for ix in vfg.get_rules():
+        links = ix.btp_autonomous_links()
+        signal_links = ix.btp_signal_links()
+        for _, _, sign in links + signal_links:
+            assert sign in SIGNS, sign
+        if links or signal_links:
+            tissue = _get_rule_tissue(ix)
+            if tissue is None:
+                anywhere.append((links, signal_links))
+            else:
+                by_tissue[tissue.name].append((links, signal_links))
+    return anywhere, by_tissue
 
-    w.writerow(fill_ten(["# Model Commands"]))
-    w.writerow(fill_ten(["# Command Type", "Model Name", "Parent Model"]))
-    w.writerow(fill_ten(["model", "root"]))
 
-    base_name = "double neg"
-    w.writerow(fill_ten(["model", base_name, "root"]))
+def iter_biotapestry_rows(model_name=BASE_MODEL_NAME):
+    """Yield the rows of a BioTapestry CSV file for the current model.
 
-    for tissue in vfn._tissues:
-        w.writerow(fill_ten(["model", tissue.name, base_name]))
+    Each tissue is a region of the model 'model_name', and a submodel of
+    its own. The links into each gene are written for every region its
+    rules apply in; ligand => receptor signals are written from each
+    tissue the ligand reaches to the receptor's tissue.
+    """
+    tissues = list(vfn._tissues)
+    region = {t.name: f"a{n}" for n, t in enumerate(tissues)}
+    anywhere, by_tissue = _get_rule_links()
 
-    w.writerow(fill_ten(["# Region Commands"]))
-    w.writerow(
-        fill_ten(["# Command Type", "Model Name", "Region Name", "Region Abbreviation"])
+    def get_rule_links(tissue):
+        return anywhere + by_tissue.get(tissue.name, [])
+
+    yield _fill_ten(["# Model Commands"])
+    yield _fill_ten(["# Command Type", "Model Name", "Parent Model"])
+    yield _fill_ten(["model", "root"])
+    yield _fill_ten(["model", model_name, "root"])
+    for tissue in tissues:
+        yield _fill_ten(["model", tissue.name, model_name])
+
+    yield _fill_ten(["# Region Commands"])
+    yield _fill_ten(
+        ["# Command Type", "Model Name", "Region Name", "Region Abbreviation"]
     )
+    for tissue in tissues:
+        r = region[tissue.name]
+        yield _fill_ten(["region", model_name, r, r])
+    for tissue in tissues:
+        r = region[tissue.name]
+        yield _fill_ten(["region", tissue.name, r, r])
+
+    def general_rows(tissue, model):
+        r = region[tissue.name]
+        seen = set()
+        for links, _ in get_rule_links(tissue):
+            for target, source, sign in links:
+                key = (source.name, target.name, sign)
+                if key not in seen:
+                    seen.add(key)
+                    row = ["general", model, "gene", source.name, "gene"]
+                    yield row + [target.name, sign, r, r]
+
+    yield _fill_ten(["# Standard Interactions"])
+    yield _fill_ten(LINK_HEADER)
+    for tissue in tissues:
+        yield from general_rows(tissue, model_name)
 
-    for n, tissue in enumerate(vfn._tissues):
-        w.writerow(fill_ten(["region", base_name, f"a{n}", f"a{n}"]))
-
-    for n, tissue in enumerate(vfn._tissues):
-        w.writerow(fill_ten(["region", tissue.name, f"a{n}", f"a{n}"]))
-
-    w.writerow(fill_ten(["# Standard Interactions"]))
-    w.writerow(
-        fill_ten(
-            [
-                "# Command Type",
-                "Model Name",
-                "Source Type",
-                "Source Name",
-                "Target Type",
-                "Target Name",
-                "Sign",
-                "Source Region Abbrev",
-                "Target Region Abbrev",
-            ]
-        )
+    yield _fill_ten(["# Signals"])
+    yield _fill_ten(LINK_HEADER)
+    graph = vfn.get_neighbor_graph()
+    for i, tissue in enumerate(graph.tissues):
+        r = region[tissue.name]
+        seen = set()
+        for _, signal_links in get_rule_links(tissue):
+            for receptor, ligand, sign in signal_links:
+                if (ligand.name, receptor.name) in seen:
+                    continue
+                seen.add((ligand.name, receptor.name))
+
+                weights = graph.get_weights(
+                    range=ligand.range, juxtacrine=ligand.is_juxtacrine
+                )
+                start, end = weights.indptr[i], weights.indptr[i + 1]
+                for j, w in zip(weights.indices[start:end], weights.data[start:end]):
+                    if w > 0:
+                        row = ["signal", model_name, "gene", ligand.name, "gene"]
+                        source_region = region[graph.tissue_names[j]]
+                        yield row + [receptor.name, sign, source_region, r]
+
+    yield _fill_ten(["# Standalone nodes"])
+    yield _fill_ten(
+        ["# Command Type", "Model Name", "Node Type", "Node Name", "Region Abbrev"]
     )
+    linked = set()
+    all_links = anywhere + [x for links in by_tissue.values() for x in links]
+    for links, signal_links in all_links:
+        for target, source, _ in links + signal_links:
+            linked.update([target.name, source.name])
+    first_region = "a0" if tissues else ""
+    for name in vfg.get_gene_names():
+        if name not in linked:
+            yield _fill_ten(["standalone", model_name, "gene", name, first_region])
+
+    yield _fill_ten(["# Interactions for Submodels"])
+    yield LINK_HEADER
+    for tissue in tissues:
+        yield from general_rows(tissue, tissue.name)
+
+
+def write_biotapestry_csv(fp, *, model_name=BASE_MODEL_NAME):
+    "Write the current model to the open file 'fp' as BioTapestry CSV."
+    w = csv.writer(fp)
+    for row in iter_biotapestry_rows(model_name):
+        w.writerow(row)
+
+
+def output_biotapestry_csv(output_filename, *, model_name=BASE_MODEL_NAME):
+    with open(output_filename, "w", newline="") as fp:
+        write_biotapestry_csv(fp, model_name=model_name)
+
+
+def read_biotapestry_csv(filename, *, reset=True):
+    """Build a model from a BioTapestry CSV file, and return {name: gene}.
+
+    Tissues are the submodels of the top model (or its regions, if it has
+    no submodels); 'signal' links make ligands, receptors, and neighbors
+    between the regions they connect. Links in the top model become
+    rules as in dinkum.from_edges: positive (or neutral) links activate,
+    with OR logic, and negative links repress. Maternal inputs are not
+    part of the network, so add them with is_present afterwards.
+
+    By default, the current model is reset first.
+    """
+    parents = {}
+    regions = collections.defaultdict(dict)  # model => {abbrev: region name}
+    link_rows = []
+    standalone = []
+    with open(filename, newline="") as fp:
+        for row in csv.reader(fp):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            row = [x.strip() for x in row]
+            command = row[0]
+            if command == "model":
+                parents[row[1]] = row[2] if len(row) > 2 else ""
+            elif command == "region":
+                regions[row[1]][row[3]] = row[2]
+            elif command in ("general", "signal"):
+                if row[6] not in SIGNS:
+                    raise Exception(f"unknown sign '{row[6]}' in {row}")
+                link_rows.append(row[:9])
+            elif command == "standalone":
+                standalone.append(row[3])
+            else:
+                raise Exception(f"unknown BioTapestry CSV command '{command}'")
+
+    top = [name for name, parent in parents.items() if parent == "root"]
+    if len(top) != 1:
+        raise Exception(f"expected one top model (under 'root'), not {top}")
+    (model_name,) = top
+
+    # region abbreviation => tissue name
+    submodels = [name for name, parent in parents.items() if parent == model_name]
+    if submodels:
+        tissue_of = {}
+        for name in submodels:
+            for abbrev in regions[name]:
+                tissue_of[abbrev] = name
+    else:
+        tissue_of = dict(regions[model_name])
+
+    edges = {}
+    neighbors = set()
+    for command, model, _, source, _, target, sign, src, dest in link_rows:
+        if model != model_name:
+            continue
+        if command == "signal":
+            edge = (source, target, 1, "signal")
+            if src != dest:
+                neighbors.add((tissue_of[dest], tissue_of[src]))
+        else:
+            edge = (source, target, -1 if sign == "negative" else 1, "or")
+        if edges.setdefault((source, target), edge) != edge:
+            raise Exception(f"conflicting links from '{source}' to '{target}'")
+
+    if reset:
+        vfg.reset()
+        vfn.reset()
+        observations.reset()
+
+    for name in dict.fromkeys(tissue_of.values()):
+        if vfn.get_tissue(name) is None:
+            vfn.Tissue(name=name)
+    for name, neighbor_name in neighbors:
+        vfn.get_tissue(name).neighbors.add(vfn.get_tissue(neighbor_name))
+    vfn._invalidate_neighbor_graph()
 
-    for ix in vfg._rules:
-        model_name = base_name
-        source_type = "gene"
-        source_region = "a0"
-        target_region = "a0"
-        for target, source, sign in ix.btp_autonomous_links():
-            source_name = source.name
-            target_name = target.name
-            assert sign in ["positive", "negative"]
-
-            w.writerow(
-                [
-                    "general",
-                    model_name,
-                    source_type,
-                    source_name,
-                    "gene",
-                    target_name,
-                    sign,
-                    source_region,
-                    target_region,
-                ]
-            )
-
-    w.writerow(fill_ten(["# Signals"]))
-    w.writerow(fill_ten(["# Standalone nodes"]))
-    w.writerow(fill_ten(["# Interactions for Submodels"]))
-    w.writerow(
-        [
-            "# Command Type",
-            "Model Name",
-            "Source Type",
-            "Source Name",
-            "Target Type",
-            "Target Name",
-            "Sign",
-            "Source Region Abbrev",
-            "Target Region Abbrev",
-        ]
+    df = pd.DataFrame(
+        list(edges.values()), columns=["source", "target", "sign", "logic"]
     )
-    fp.close()
+    genes = from_edges(df)
+    existing = {g.name: g for g in vfg._genes}
+    for name in standalone:
+        if name not in existing:
+            existing[name] = vfg.Gene(name=name)
+        genes[name] = existing[name]
+    return genes
@@ -5,6 +5,7 @@ import inspect
 import collections
 
 from .exceptions import *
+from . import vfn
 from .vfn import check_is_valid_tissue
 from .vfg_functions import *
 
@@ -28,20 +29,46 @@ DEFAULT_OFF = GeneStateInfo(level=0, active=False)
 
 _rules = []
 _genes = []
+_rule_counts = collections.Counter()  # dest name => # of single rules
+
+
+def _check_rule(ix, counts):
+    "Raise DinkumMultipleRules if 'ix' would be a second rule for its gene."
+    if not ix.multiple_allowed and counts[ix.dest.name]:
+        raise DinkumMultipleRules(
+            f"multiple rules containing {ix.dest} are not allowed!"
+        )
 
 
 def _add_rule(ix):
+    _check_rule(ix, _rule_counts)
     _rules.append(ix)
+    if not ix.multiple_allowed:
+        _rule_counts[ix.dest.name] += 1
+
+
+def add_rules(rules):
+    """Add several rules at once. The whole batch is checked for multiple
+    rules per gene before any are added."""
+    rules = list(rules)
+    counts = collections.Counter()
+    for ix in rules:
+        _check_rule(ix, _rule_counts)
+        _check_rule(ix, counts)
+        if not ix.multiple_allowed:
+            counts[ix.dest.name] += 1
+
+    _rules.extend(rules)
+    _rule_counts.update(counts)
+
+
+def has_single_rule(gene_name):
+    "Does the gene 'gene_name' already have a rule that allows no others?"
+    return _rule_counts[gene_name] > 0
 
-    # check!
-    seen = set()
-    for r in _rules:
-        if r.dest in seen and not r.multiple_allowed:
-            raise DinkumMultipleRules(
-                f"multiple rules containing {r.dest} are not allowed!"
-            )
-        if not r.multiple_allowed:
-            seen.add(r.dest)
+
+def get_ligands():
+    return [g for g in _genes if g._is_ligand]
 
 
 def get_rules():
@@ -62,8 +89,10 @@ def get_gene(name):
 def reset():
     global _rules
     global _genes
+    global _rule_counts
     _rules = []
     _genes = []
+    _rule_counts = collections.Counter()
 
 
 def check_is_valid_gene(g):
@@ -77,25 +106,30 @@ def check_is_tf(g):
         raise DinkumNotATranscriptionFactor(f"{g.name} is not a transcription factor")
 
 
+def _get_received_ligands(timepoint, states, tissue, delay):
+    "Return {ligand: received level} for this tissue at the given timepoint/delay"
+    time_state = states.get(timepoint - int(delay))
+    if time_state is None:
+        return {}
+
+    # ligand levels are computed once per timepoint, across all tissues
+    i = vfn.get_neighbor_graph().index.get(tissue.name)
+    if i is None:
+        return {}
+    levels = time_state.get_ligand_levels()
+    return {ligand: received[i] for ligand, received in levels.items()}
+
+
 def _retrieve_ligands(timepoint, states, tissue, delay):
     "Retrieve all ligands in neighboring tissues for the given timepoint/delay"
-    # assert isinstance(tissue, Tissue)
-
-    ligands = set()
-    for gene in _genes:
-        if gene._is_ligand:
-            for neighbor in tissue.neighbors:
-                if states.is_active(timepoint, delay, gene, neighbor):
-                    is_juxtacrine = getattr(gene, "is_juxtacrine", False)
-
-                    # if it's juxtacrine, it only activates other, not self.
-                    if is_juxtacrine:
-                        if neighbor != tissue:
-                            ligands.add(gene)
-                    else:
-                        ligands.add(gene)
+    received = _get_received_ligands(timepoint, states, tissue, delay)
+    return set(ligand for ligand, level in received.items() if level > 0)
+
 
-    return ligands
+def _receives_ligand(dest, timepoint, states, tissue, delay):
+    "Does receptor 'dest' receive more than its threshold level of its ligand?"
+    received = _get_received_ligands(timepoint, states, tissue, delay)
+    return received.get(dest._set_ligand, 0) > dest.threshold
 
 
 def check_ligand(*, dest, timepoint, states, tissue, delay):
@@ -105,10 +139,7 @@ def check_ligand(*, dest, timepoint, states, tissue, delay):
     Otherwise, return True.
     """
     if dest.is_receptor:
-        ligands_in_neighbors = _retrieve_ligands(timepoint, states, tissue, delay)
-        if dest._set_ligand in ligands_in_neighbors:
-            return True
-        return False
+        return _receives_ligand(dest, timepoint, states, tissue, delay)
     else:
         return True  # by default, not ligand => is active
 
@@ -137,18 +168,30 @@ class CustomActivation:
 class Interactions:
     multiple_allowed = False
 
-    def btp_autonomus_links(self):
-        raise Unimplemented
+    def btp_autonomous_links(self):
+        """Return the BioTapestry links into this rule's gene, as
+        (target, source, sign) triples: by default, a 'neutral' link from
+        each input gene."""
+        return [
+            (self.dest, get_gene(name), "neutral")
+            for name in self.get_input_gene_names()
+        ]
 
     def btp_signal_links(self):
-        raise Unimplemented
+        """Return the ligand => receptor links into this rule's gene, as
+        (receptor, ligand, sign) triples."""
+        ligand = getattr(self.dest, "_set_ligand", None)
+        if ligand:
+            return [(self.dest, ligand, "positive")]
+        return []
+
+    def get_input_gene_names(self):
+        "Return the names of the genes this rule reads."
+        return []
 
     def check_ligand(self, timepoint, states, tissue, delay):
         if getattr(self.dest, "_set_ligand", None):
-            ligands_in_neighbors = _retrieve_ligands(timepoint, states, tissue, delay)
-            if self.dest._set_ligand in ligands_in_neighbors:
-                return True
-            return False
+            return _receives_ligand(self.dest, timepoint, states, tissue, delay)
         else:
             return True  # by default, not ligand => is active
 
@@ -181,11 +224,19 @@ class Interaction_IsPresent(Interactions):
         self.level = level
         self.decay = decay
 
-    def btp_autonomous_links(self):
-        return []
+    def get_level(self, timepoint):
+        """Return the level at 'timepoint', decayed once per tick since start.
 
-    def btp_signal_links(self):
-        return []
+        This depends only on the timepoint, so that tissues can be advanced
+        in any order (or in parallel).
+        """
+        level = self.level
+        for _ in range(timepoint - self.start):
+            next_level = round(level / self.decay + 0.5)
+            if next_level == level:
+                break
+            level = next_level
+        return level
 
     def advance(self, *, timepoint=None, states=None, tissue=None):
         # ignore states
@@ -194,14 +245,13 @@ class Interaction_IsPresent(Interactions):
                 if (
                     self.duration is None or timepoint < self.start + self.duration
                 ):  # active!
+                    level = self.get_level(timepoint)
                     if self.check_ligand(timepoint, states, tissue, delay=1):
-                        yield self.dest, GeneStateInfo(level=self.level, active=True)
+                        yield self.dest, GeneStateInfo(level=level, active=True)
                     else:
-                        yield self.dest, GeneStateInfo(level=self.level, active=False)
+                        yield self.dest, GeneStateInfo(level=level, active=False)
         # we have no opinion on activity outside our tissue!
 
-        self.level = round(self.level / self.decay + 0.5)
-
 
 class Interaction_Custom(Interactions):
     """
@@ -217,11 +267,8 @@ class Interaction_Custom(Interactions):
         self.state_fn = state_fn
         self.delay = delay
 
-    def btp_autonomous_links(self):
-        return []
-
-    def btp_signal_links(self):
-        return []
+    def get_input_gene_names(self):
+        return list(self._get_gene_names(self.state_fn))
 
     def _get_gene_names(self, state_fn):
         # get the names of the genes on the function
@@ -313,10 +360,16 @@ class Interaction_CustomObj(Interactions):
         self.obj = obj
 
     def btp_autonomous_links(self):
-        return []
+        get_links = getattr(self.obj, "btp_autonomous_links", None)
+        if get_links is None:
+            return super().btp_autonomous_links()
+        return get_links()
 
-    def btp_signal_links(self):
-        return []
+    def get_input_gene_names(self):
+        get_names = getattr(self.obj, "get_input_gene_names", None)
+        if get_names is None:
+            return []
+        return get_names()
 
     def advance(self, *, timepoint=None, states=None, tissue=None):
         assert tissue
@@ -447,9 +500,21 @@ class Ligand(Gene):
     is_tf = False
     is_ligand = True
 
-    def __init__(self, *, name=None, is_juxtacrine=False):
+    def __init__(self, *, name=None, is_juxtacrine=False, range=1, attenuation=1.0):
+        """A signaling gene, received by receptors in neighboring tissues.
+
+        By default, ligands reach direct neighbors only. With 'range', a
+        ligand diffuses up to that many hops through the neighbor graph,
+        with its level scaled by 'attenuation' per hop ('attenuation' may
+        also be a function of the number of hops).
+        """
         super().__init__(name=name)
+        assert int(range) == range and range >= 1, "range must be a positive integer"
+        if not callable(attenuation):
+            assert 0 < attenuation <= 1, "attenuation must be in (0, 1]"
         self.is_juxtacrine = is_juxtacrine
+        self.range = int(range)
+        self.attenuation = attenuation
         self._is_ligand = True
 
     def __repr__(self):
@@ -459,10 +524,16 @@ class Ligand(Gene):
 class Receptor(Gene):
     is_receptor = True
 
-    def __init__(self, *, name=None, ligand=None):
+    def __init__(self, *, name=None, ligand=None, threshold=0):
+        """A gene that is only active when it receives its ligand.
+
+        The receptor is active when the level of ligand it receives, summed
+        over neighboring tissues, is above 'threshold'.
+        """
         super().__init__(name=name)
         assert name
         self._set_ligand = ligand
+        self.threshold = threshold
         if ligand and not isinstance(ligand, Ligand):
             raise DinkumNotALigand(f"gene {ligand.name} is not a Ligand")
 
@@ -1,9 +1,20 @@
 import numpy as np
 from lmfit import minimize, Parameters
 import math
+import os
+import hashlib
+import json
+import collections
+import collections.abc
+import contextlib
+import pickle
+
+import emcee
 
 import dinkum
 from dinkum import vfg, vfn
+from dinkum import parallel
+from dinkum.exceptions import *
 
 # from dinkum import vfg, Timecourse, TissueGeneStates, get_tissue, get_gene
 # from dinkum.vfg import GeneStateInfo, check_ligand
@@ -12,24 +23,165 @@ from itertools import chain
 # @CTB prevent set_gene from being called multiple times
 
 
+# when True, logistic_output skips rounding; see continuous_relaxation.
+_continuous = False
+
+
+@contextlib.contextmanager
+def continuous_relaxation():
+    """Run the logistic functions without rounding their output.
+
+    This makes the logistic rule classes smooth functions of their
+    parameters, so that Dual numbers can carry derivatives through them.
+    """
+    global _continuous
+    saved = _continuous
+    _continuous = True
+    try:
+        yield
+    finally:
+        _continuous = saved
+
+
+class Dual:
+    """A number carrying forward-mode derivatives.
+
+    'value' is the number, 'grad' a numpy array of its derivatives with
+    respect to each parameter. Comparisons use only the value.
+    """
+
+    __slots__ = ("value", "grad")
+
+    def __init__(self, value, grad):
+        self.value = float(value)
+        self.grad = grad
+
+    def __repr__(self):
+        return f"Dual({self.value}, {self.grad})"
+
+    def __add__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value + other.value, self.grad + other.grad)
+        return Dual(self.value + other, self.grad)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value - other.value, self.grad - other.grad)
+        return Dual(self.value - other, self.grad)
+
+    def __rsub__(self, other):
+        return Dual(other - self.value, -self.grad)
+
+    def __mul__(self, other):
+        if isinstance(other, Dual):
+            return Dual(
+                self.value * other.value,
+                self.grad * other.value + other.grad * self.value,
+            )
+        return Dual(self.value * other, self.grad * other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, Dual):
+            value = self.value / other.value
+            grad = (self.grad - value * other.grad) / other.value
+            return Dual(value, grad)
+        return Dual(self.value / other, self.grad / other)
+
+    def __rtruediv__(self, other):
+        value = other / self.value
+        return Dual(value, -value / self.value * self.grad)
+
+    def __neg__(self):
+        return Dual(-self.value, -self.grad)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return self if self.value >= 0 else -self
+
+    def __float__(self):
+        return self.value
+
+    def __int__(self):
+        # truncation is a step function, so drop the derivative.
+        return int(self.value)
+
+    def __bool__(self):
+        return self.value != 0
+
+    def __eq__(self, other):
+        return self.value == float(other)
+
+    def __ne__(self, other):
+        return self.value != float(other)
+
+    def __lt__(self, other):
+        return self.value < float(other)
+
+    def __le__(self, other):
+        return self.value <= float(other)
+
+    def __gt__(self, other):
+        return self.value > float(other)
+
+    def __ge__(self, other):
+        return self.value >= float(other)
+
+    __hash__ = None
+
+    def exp(self):
+        value = math.exp(self.value)
+        return Dual(value, value * self.grad)
+
+    def log(self):
+        return Dual(math.log(self.value), self.grad / self.value)
+
+
+def _exp(x):
+    if isinstance(x, Dual):
+        return x.exp()
+    return math.exp(x)
+
+
+def _log(x):
+    if isinstance(x, Dual):
+        return x.log()
+    return math.log(x)
+
+
 def logistic_output(*, rate, input_level, midpoint):
     "calc logistic function, centered at midpoint, with k = log(rate/10)"
-    rate = math.log(rate / 10)
+    rate = _log(rate / 10)
     expon = -rate * (input_level - midpoint)
     expon = min(expon, 50)
-    denom = 1 + math.exp(expon)
-    output = round(100 / denom)
+    denom = 1 + _exp(expon)
+    output = 100 / denom
+    if not _continuous:
+        output = round(output)
 
     return output
 
 
+def _btp_links(target, inputs):
+    """Return the BioTapestry links [(target, source gene, sign)] for
+    (gene name, weight) inputs; negative weights repress."""
+    return [
+        (target, vfg.get_gene(name), "positive" if weight >= 0 else "negative")
+        for name, weight in inputs
+    ]
+
+
 class Decay:
     def __init__(self, *, start_time=1, rate, initial_level=100, tissue, delay=1):
         self.start_time = start_time
         self.rate = rate
         self.initial_level = initial_level
         self.tissue = tissue
-        self.level = None
         self.delay = delay  # 'delay' is only for checking for ligands
 
     def get_params(self, params_obj):
@@ -48,9 +200,24 @@ class Decay:
         self.rate = params_obj[decay_name].value
         self.initial_level = params_obj[initial_name].value
 
+    def get_param_slots(self):
+        """Return (param name, attribute, list index or None) for each
+        parameter in get_params; used by ParameterMap."""
+        target_name = self.target.name
+        return [
+            (f"{target_name}_decay", "rate", None),
+            (f"{target_name}_initial", "initial_level", None),
+        ]
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return []
+
+    def btp_autonomous_links(self):
+        return []
+
     def advance(self, timepoint, states, tissue):
         # not right tissue, or not started yet? no opinion.
         if tissue != self.tissue or timepoint < self.start_time:
@@ -63,13 +230,11 @@ class Decay:
             tissue=tissue,
             delay=self.delay,
         )
-        if timepoint == self.start_time:
-            # start!!
-            self.level = self.initial_level
-            return self.target, vfg.GeneStateInfo(self.level, active)
-        else:
-            self.level /= self.rate
-            return self.target, vfg.GeneStateInfo(self.level, active)
+        # computed from the start each time, so no state is kept between calls
+        level = self.initial_level
+        for _ in range(timepoint - self.start_time):
+            level /= self.rate
+        return self.target, vfg.GeneStateInfo(level, active)
 
 
 class Growth:
@@ -78,7 +243,6 @@ class Growth:
         self.rate = rate
         self.initial_level = initial_level
         self.tissue = tissue
-        self.level = None
         self.delay = delay
 
     def get_params(self, params_obj):
@@ -97,9 +261,22 @@ class Growth:
         initial_name = f"{target_name}_initial"
         self.initial_level = params_obj[initial_name].value
 
+    def get_param_slots(self):
+        target_name = self.target.name
+        return [
+            (f"{target_name}_growth", "rate", None),
+            (f"{target_name}_initial", "initial_level", None),
+        ]
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return []
+
+    def btp_autonomous_links(self):
+        return []
+
     def advance(self, timepoint, states, tissue):
         # not right tissue, or not started yet? no opinion.
         if tissue != self.tissue or timepoint < self.start_time:
@@ -112,15 +289,16 @@ class Growth:
             tissue=tissue,
             delay=self.delay,
         )
+        # computed from the start each time, so no state is kept between calls
+        level = self.initial_level
         if timepoint == self.start_time:
-            # start!!
-            self.level = self.initial_level
-            return self.target, vfg.GeneStateInfo(self.level, active)
-        else:
-            self.level += int(100 - self.level) * self.rate
-            level = min(self.level, 100.0)
-            level = max(level, 0)
-            return self.target, vfg.GeneStateInfo(int(level), active)
+            return self.target, vfg.GeneStateInfo(level, active)
+
+        for _ in range(timepoint - self.start_time):
+            level += int(100 - level) * self.rate
+        level = min(level, 100.0)
+        level = max(level, 0)
+        return self.target, vfg.GeneStateInfo(int(level), active)
 
 
 class GeneTimecourse:
@@ -141,6 +319,12 @@ class GeneTimecourse:
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return []
+
+    def btp_autonomous_links(self):
+        return []
+
     def advance(self, timepoint, states, tissue):
         # not right tissue, or not started yet? no opinion.
         if tissue != self.tissue or timepoint < self.start_time:
@@ -196,9 +380,22 @@ class LinearCombination:
 
         self.weights = weights
 
+    def get_param_slots(self):
+        target_name = self.target.name
+        return [
+            (f"{target_name}_w{n}", "weights", i) for i, n in enumerate(self.gene_names)
+        ]
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return list(self.gene_names)
+
+    def btp_autonomous_links(self):
+        weights = self.weights or [1] * len(self.gene_names)
+        return _btp_links(self.target, zip(self.gene_names, weights))
+
     def advance(self, timepoint, states, tissue):
         if not self.weights:
             raise Exception("need weights")
@@ -259,9 +456,22 @@ class LogisticActivator:
         param_name = f"{target_name}_midpoint"
         self.midpoint = params_obj[param_name].value
 
+    def get_param_slots(self):
+        target_name = self.target.name
+        return [
+            (f"{target_name}_rate", "rate", None),
+            (f"{target_name}_midpoint", "midpoint", None),
+        ]
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return [self.activator_name]
+
+    def btp_autonomous_links(self):
+        return _btp_links(self.target, [(self.activator_name, 1)])
+
     def advance(self, timepoint, states, tissue):
         delay = self.delay
 
@@ -356,9 +566,22 @@ class LogisticMultiActivator:
             weights.append(val)
         self.weights = weights
 
+    def get_param_slots(self):
+        target_name = self.target.name
+        slots = [(f"{target_name}_rate", "rate", None)]
+        for i, n in enumerate(self.activator_names):
+            slots.append((f"{target_name}_w{n}", "weights", i))
+        return slots
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return list(self.activator_names)
+
+    def btp_autonomous_links(self):
+        return _btp_links(self.target, zip(self.activator_names, self.weights))
+
     def advance(self, timepoint, states, tissue):
         delay = self.delay
 
@@ -421,9 +644,23 @@ class LogisticRepressor:
         param_name = f"{target_name}_midpoint"
         self.midpoint = params_obj[param_name].value
 
+    def get_param_slots(self):
+        target_name = self.target.name
+        return [
+            (f"{target_name}_rate", "rate", None),
+            (f"{target_name}_midpoint", "midpoint", None),
+        ]
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return [self.activator, self.repressor]
+
+    def btp_autonomous_links(self):
+        inputs = [(self.activator, 1), (self.repressor, -1)]
+        return _btp_links(self.target, inputs)
+
     def advance(self, timepoint, states, tissue):
         delay = self.delay
 
@@ -539,9 +776,25 @@ class LogisticRepressor2:
         param_name = f"{target_name}_repressor_midpoint"
         self.repressor_midpoint = params_obj[param_name].value
 
+    def get_param_slots(self):
+        target_name = self.target.name
+        return [
+            (f"{target_name}_activator_rate", "activator_rate", None),
+            (f"{target_name}_activator_midpoint", "activator_midpoint", None),
+            (f"{target_name}_repressor_rate", "repressor_rate", None),
+            (f"{target_name}_repressor_midpoint", "repressor_midpoint", None),
+        ]
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return [self.activator, self.repressor]
+
+    def btp_autonomous_links(self):
+        inputs = [(self.activator, 1), (self.repressor, -1)]
+        return _btp_links(self.target, inputs)
+
     def advance(self, timepoint, states, tissue):
         delay = self.delay
 
@@ -655,9 +908,23 @@ class LogisticMultiRepressor:
             weights.append(val)
         self.weights = weights
 
+    def get_param_slots(self):
+        target_name = self.target.name
+        slots = [(f"{target_name}_rate", "rate", None)]
+        for i, n in enumerate(self.repressor_names):
+            slots.append((f"{target_name}_w{n}", "weights", i))
+        return slots
+
     def set_gene(self, gene):
         self.target = gene
 
+    def get_input_gene_names(self):
+        return [self.activator] + list(self.repressor_names)
+
+    def btp_autonomous_links(self):
+        inputs = [(name, -w) for name, w in zip(self.repressor_names, self.weights)]
+        return _btp_links(self.target, [(self.activator, 1)] + inputs)
+
     def advance(self, timepoint, states, tissue):
         delay = self.delay
 
@@ -710,50 +977,178 @@ def get_ix2_for_gene_name(gene_name):
             yield ix
 
 
-def run_lmfit(start, stop, *, fit_values, fit_genes, debug=False, method="leastsq"):
-    for g in fit_genes:
-        assert isinstance(g, vfg.Gene)
+def get_fit_params(fit_genes):
+    "Extract initial fit parameters from all genes."
+    p = Parameters()
+    found = set()
 
-    def get_fit_params():
-        "Extract initial fit parameters from all genes."
-        p = Parameters()
-        found = set()
-
-        for fit_gene in fit_genes:
-            for ix in get_ix2_for_gene_name(fit_gene.name):
-                found.add(fit_gene.name)
-                obj = ix.obj
-                obj.get_params(p)
-
-        # track genes we were supposed to find (but didn't) & complain.
-        if len(found) != len(fit_genes):
-            missing = set([g.name for g in fit_genes]) - found
-            raise Exception(f"missing: {missing}")
-        return p
+    for fit_gene in fit_genes:
+        for ix in get_ix2_for_gene_name(fit_gene.name):
+            found.add(fit_gene.name)
+            obj = ix.obj
+            obj.get_params(p)
 
-    def set_fit_params(p):
-        "Set fit parameters on all the genes."
-        for ix in vfg._rules:
-            if ix.dest in fit_genes:
-                if not isinstance(ix, vfg.Interaction_CustomObj):
-                    raise Exception(f"ix {ix} must be a CustomObj ix")
-                obj = ix.obj
-                obj.set_params(p)
+    # track genes we were supposed to find (but didn't) & complain.
+    if len(found) != len(fit_genes):
+        missing = set([g.name for g in fit_genes]) - found
+        raise Exception(f"missing: {missing}")
+    return p
 
-    tc = dinkum.Timecourse(start=start, stop=stop)
 
-    times = list(range(start, stop + 1))
+def set_fit_params(fit_genes, p):
+    "Set fit parameters on all the genes."
+    for ix in vfg._rules:
+        if ix.dest in fit_genes:
+            if not isinstance(ix, vfg.Interaction_CustomObj):
+                raise Exception(f"ix {ix} must be a CustomObj ix")
+            obj = ix.obj
+            obj.set_params(p)
 
-    def residual(params, xvals, data):
-        assert xvals == times
-        assert data == fit_values
 
-        if debug:
-            print("RUNNING RESIDUAL:", xvals)
-            params.pretty_print()
+class _ParameterValue:
+    "A single entry of a ParameterView; looks like an lmfit Parameter."
 
-        # now, run the time course!
-        set_fit_params(params)
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    @property
+    def value(self):
+        return float(self._values[self._index])
+
+
+class ParameterView(collections.abc.Mapping):
+    """A zero-copy, read-only stand-in for lmfit Parameters over a
+    vector of values: view[name].value reads straight from the vector."""
+
+    def __init__(self, names, values, *, index=None):
+        self.names = names
+        self.values = values
+        if index is None:
+            index = {name: i for i, name in enumerate(names)}
+        self.index = index
+
+    def __getitem__(self, name):
+        return _ParameterValue(self.values, self.index[name])
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+_DualParameter = collections.namedtuple("_DualParameter", ["value"])
+
+
+class ParameterMap:
+    """
+    A compiled mapping from a flat vector of parameter values onto the
+    parameter slots of the fit genes' rule objects.
+
+    Built once per fit. Setting parameters is then a single write of the
+    vector, plus a precomputed list of attribute stores - no rule scans,
+    gene membership tests or formatted parameter names.
+
+    Rule objects that provide get_param_slots are written directly;
+    others have set_params called with a ParameterView of the vector.
+    """
+
+    def __init__(self, fit_genes):
+        for g in fit_genes:
+            assert isinstance(g, vfg.Gene)
+
+        self.params = get_fit_params(fit_genes)
+        self.names = list(self.params)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.values = np.array([p.value for p in self.params.values()], dtype=float)
+        self.lower = np.array([p.min for p in self.params.values()], dtype=float)
+        self.upper = np.array([p.max for p in self.params.values()], dtype=float)
+        self.view = ParameterView(self.names, self.values, index=self.index)
+
+        self._attr_slots = []  # (obj, attr, vector index)
+        self._item_slots = []  # (obj, list attr, list index, vector index)
+        self._other_objs = []  # objects without get_param_slots
+
+        fit_names = set(g.name for g in fit_genes)
+        converted = set()
+        for ix in vfg._rules:
+            if ix.dest.name not in fit_names:
+                continue
+            if not isinstance(ix, vfg.Interaction_CustomObj):
+                raise Exception(f"ix {ix} must be a CustomObj ix")
+            obj = ix.obj
+            get_slots = getattr(obj, "get_param_slots", None)
+            if get_slots is None:
+                self._other_objs.append(obj)
+                continue
+
+            for name, attr, list_index in get_slots():
+                i = self.index[name]
+                if list_index is None:
+                    self._attr_slots.append((obj, attr, i))
+                else:
+                    # make sure the attribute is a list we can write into.
+                    if (id(obj), attr) not in converted:
+                        items = list(getattr(obj, attr) or [])
+                        setattr(obj, attr, items)
+                        converted.add((id(obj), attr))
+                    items = getattr(obj, attr)
+                    while len(items) <= list_index:
+                        items.append(None)
+                    self._item_slots.append((obj, attr, list_index, i))
+
+        self.set_values(self.values)
+
+    def set_values(self, values):
+        "Set all parameters from a vector of values, in 'names' order."
+        vals = self.values
+        if values is not vals:
+            vals[:] = values
+        for obj, attr, i in self._attr_slots:
+            setattr(obj, attr, float(vals[i]))
+        for obj, attr, list_index, i in self._item_slots:
+            getattr(obj, attr)[list_index] = float(vals[i])
+        for obj in self._other_objs:
+            obj.set_params(self.view)
+
+    def set_dual_values(self, values):
+        """Set all parameters to Dual numbers holding 'values', each seeded
+        with a unit derivative in its own position in 'names' order."""
+        self.set_values(values)
+
+        n = len(self.names)
+        duals = [Dual(v, np.eye(1, n, i)[0]) for i, v in enumerate(self.values)]
+        for obj, attr, i in self._attr_slots:
+            setattr(obj, attr, duals[i])
+        for obj, attr, list_index, i in self._item_slots:
+            getattr(obj, attr)[list_index] = duals[i]
+
+        dual_params = {name: _DualParameter(d) for name, d in zip(self.names, duals)}
+        for obj in self._other_objs:
+            obj.set_params(dual_params)
+
+    def set_params(self, params):
+        "Set all parameters from an lmfit Parameters object."
+        self.set_values([params[name].value for name in self.names])
+
+    def to_params(self, values=None):
+        "Return an lmfit Parameters object holding 'values' (default: current)."
+        p = self.params.copy()
+        if values is None:
+            values = self.values
+        for name, value in zip(self.names, values):
+            p[name].value = float(value)
+        return p
+
+
+def _make_simulate_fn(start, stop, *, fit_genes):
+    "Build a function that runs the time course and returns the fit values."
+    tc = dinkum.Timecourse(start=start, stop=stop)
+
+    def simulate():
         tc.reset()
         tc.run()
 
@@ -763,15 +1158,48 @@ def run_lmfit(start, stop, *, fit_values, fit_genes, debug=False, method="leasts
             for gene in fit_genes:
                 gs = ga.get_by_tissue_name("M").get_gene_state(gene.name)
                 vals.append(gs.level)
+        return np.array(vals)
+
+    return simulate
+
+
+def _make_residual_fn(start, stop, *, fit_values, fit_genes, pmap, debug=False):
+    "Build the residual function used by lmfit.minimize."
+    simulate = _make_simulate_fn(start, stop, fit_genes=fit_genes)
+
+    times = list(range(start, stop + 1))
+    data_arr = np.array(fit_values)
+
+    def residual(params, xvals, data):
+        assert xvals == times
+        assert data == fit_values
 
-        residuals = np.array(vals) - np.array(data)
+        if debug:
+            print("RUNNING RESIDUAL:", xvals)
+            params.pretty_print()
+
+        # now, run the time course!
+        pmap.set_params(params)
+        residuals = simulate() - data_arr
         if debug:
             print("results:", residuals)
         return residuals
 
-    params = get_fit_params()
+    return residual, times
+
+
+def run_lmfit(start, stop, *, fit_values, fit_genes, debug=False, method="leastsq"):
+    for g in fit_genes:
+        assert isinstance(g, vfg.Gene)
+
+    pmap = ParameterMap(fit_genes)
+    residual, times = _make_residual_fn(
+        start, stop, fit_values=fit_values, fit_genes=fit_genes, pmap=pmap, debug=debug
+    )
+
+    params = pmap.params
     res = minimize(residual, params, args=(times, fit_values), method=method)
-    set_fit_params(res.params)
+    pmap.set_params(res.params)
 
     if hasattr(res, "message"):
         print("fit message:", res.message)
@@ -783,6 +1211,287 @@ def run_lmfit(start, stop, *, fit_values, fit_genes, debug=False, method="leasts
     return res
 
 
+MultiStartFit = collections.namedtuple(
+    "MultiStartFit", ["params", "init_values", "chisqr", "success", "message", "count"]
+)
+
+
+def sample_start_values(params, n, *, seed=None):
+    """Sample 'n' sets of starting values uniformly within each parameter's
+    min/max bounds.
+
+    The first set is always the current parameter values. Parameters
+    without finite bounds, or that are not varied, keep their current value.
+
+    Returns a list of {name: value} dictionaries.
+    """
+    rng = np.random.default_rng(seed)
+
+    starts = [{name: p.value for name, p in params.items()}]
+    for i in range(n - 1):
+        values = {}
+        for name, p in params.items():
+            if p.vary and np.isfinite(p.min) and np.isfinite(p.max):
+                values[name] = float(rng.uniform(p.min, p.max))
+            else:
+                values[name] = p.value
+        starts.append(values)
+
+    return starts[:n]
+
+
+def _dedup_fits(fits, params, tol):
+    "Merge fits whose parameter values agree to within 'tol' (scaled)."
+    scales = {}
+    for name, p in params.items():
+        if np.isfinite(p.min) and np.isfinite(p.max) and p.max > p.min:
+            scales[name] = p.max - p.min
+        else:
+            scales[name] = None
+
+    unique = []
+    for fit in sorted(fits, key=lambda f: f.chisqr):
+        for n, kept in enumerate(unique):
+            same = True
+            for name, scale in scales.items():
+                a = fit.params[name].value
+                b = kept.params[name].value
+                if scale is None:
+                    scale = max(abs(a), abs(b), 1.0)
+                if abs(a - b) / scale > tol:
+                    same = False
+                    break
+            if same:
+                unique[n] = kept._replace(count=kept.count + fit.count)
+                break
+        else:
+            unique.append(fit)
+
+    return unique
+
+
+def run_lmfit_multistart(
+    start,
+    stop,
+    *,
+    fit_values,
+    fit_genes,
+    n_starts=10,
+    seed=None,
+    processes=None,
+    dedup_tol=0.01,
+    debug=False,
+    method="leastsq",
+):
+    """Run 'n_starts' independent fits from different starting points.
+
+    Starting values are sampled within each parameter's min/max, as
+    declared by the get_params of the fit genes; see 'sample_start_values'.
+    Fits run in parallel in worker processes, each with its own copy of
+    the model.
+
+    Returns a list of MultiStartFit tuples ranked by chisqr (best first),
+    with converged solutions that agree to within 'dedup_tol' (as a
+    fraction of each parameter's range) merged; 'count' is the number of
+    starts that reached each solution. The best parameters are set on
+    the model.
+    """
+    for g in fit_genes:
+        assert isinstance(g, vfg.Gene)
+    assert n_starts >= 1
+
+    pmap = ParameterMap(fit_genes)
+    params = pmap.params
+    starts = sample_start_values(params, n_starts, seed=seed)
+
+    def fit_one(start_values):
+        residual, times = _make_residual_fn(
+            start,
+            stop,
+            fit_values=fit_values,
+            fit_genes=fit_genes,
+            pmap=pmap,
+            debug=debug,
+        )
+        p = params.copy()
+        for name, value in start_values.items():
+            p[name].value = value
+
+        res = minimize(residual, p, args=(times, fit_values), method=method)
+        chisqr = float(res.chisqr)
+        message = getattr(res, "message", "")
+        return MultiStartFit(
+            res.params, dict(start_values), chisqr, bool(res.success), message, 1
+        )
+
+    fits = parallel.map_processes(fit_one, starts, processes=processes)
+    fits = _dedup_fits(fits, params, dedup_tol)
+
+    best = fits[0]
+    pmap.set_params(best.params)
+
+    print(f"{len(fits)} distinct solutions from {n_starts} starts.")
+    print(f"best fit values (chisqr={best.chisqr}):")
+    for k in best.params:
+        print(f"\t{k}: fit={best.params[k].value} (was: {best.init_values[k]})")
+
+    return fits
+
+
+def _save_emcee_checkpoint(filename, sampler, param_names):
+    """Atomically write the sampler's backend and random state, and the
+    parameter names, to 'filename'."""
+    tmp_filename = f"{filename}.tmp"
+    d = dict(
+        param_names=list(param_names),
+        backend=sampler.backend,
+        random_state=sampler.random_state,
+    )
+    with open(tmp_filename, "wb") as fp:
+        pickle.dump(d, fp)
+    os.replace(tmp_filename, filename)
+
+
+def _load_emcee_checkpoint(filename, param_names):
+    with open(filename, "rb") as fp:
+        d = pickle.load(fp)
+    if d["param_names"] != list(param_names):
+        raise Exception(
+            f"checkpoint '{filename}' is for parameters {d['param_names']}, not {list(param_names)}"
+        )
+    return d["backend"], d.get("random_state")
+
+
+def run_emcee(
+    start,
+    stop,
+    *,
+    fit_values,
+    fit_genes,
+    nwalkers=None,
+    nsteps=1000,
+    sigma=1.0,
+    seed=None,
+    processes=None,
+    checkpoint=None,
+    checkpoint_every=50,
+    resume=True,
+    debug=False,
+):
+    """Sample the posterior of the fit gene parameters with emcee.
+
+    The likelihood is Gaussian in the residuals (as for run_lmfit), with
+    noise 'sigma'; priors are uniform within each parameter's min/max, as
+    declared by get_params.
+
+    The sampler runs in vectorized mode: each ensemble step hands every
+    walker position to the log probability function at once, and those
+    are evaluated as one batch across 'processes' worker processes.
+
+    If 'checkpoint' is a filename, the chain is saved there every
+    'checkpoint_every' steps and at the end; with 'resume', an existing
+    checkpoint is loaded and sampling continues, with the same random
+    number stream, until 'nsteps' total.
+
+    Returns the emcee.EnsembleSampler. The maximum posterior parameters
+    are set on the model.
+    """
+    for g in fit_genes:
+        assert isinstance(g, vfg.Gene)
+
+    pmap = ParameterMap(fit_genes)
+    params = pmap.params
+    names = [name for name, p in params.items() if p.vary]
+    vary_index = np.array([pmap.index[name] for name in names], dtype=int)
+    ndim = len(names)
+    assert ndim, "no parameters to sample"
+
+    if nwalkers is None:
+        nwalkers = max(2 * ndim + 2, 8)
+    assert nwalkers >= 2 * ndim, "emcee needs at least 2 walkers per parameter"
+
+    lower = np.array([params[name].min for name in names])
+    upper = np.array([params[name].max for name in names])
+
+    simulate = _make_simulate_fn(start, stop, fit_genes=fit_genes)
+    data_arr = np.array(fit_values)
+    initial_values = pmap.values.copy()
+
+    def log_likelihood(theta):
+        values = initial_values.copy()
+        values[vary_index] = theta
+        pmap.set_values(values)
+        resid = simulate() - data_arr
+        if debug:
+            print("RUNNING LOG LIKELIHOOD:", dict(zip(names, theta)))
+            print("results:", resid)
+        return -0.5 * float(np.sum(np.square(resid / sigma)))
+
+    def log_prob(thetas):
+        thetas = np.atleast_2d(thetas)
+        in_bounds = np.all((thetas >= lower) & (thetas <= upper), axis=1)
+        lp = np.full(len(thetas), -np.inf)
+        todo = np.flatnonzero(in_bounds)
+        if len(todo):
+            lp[todo] = pool.map([thetas[i] for i in todo])
+        return lp
+
+    backend = random_state = None
+    if checkpoint and resume and os.path.exists(checkpoint):
+        backend, random_state = _load_emcee_checkpoint(checkpoint, names)
+        print(f"resuming from '{checkpoint}' at step {backend.iteration}")
+    if backend is None:
+        backend = emcee.backends.Backend()
+        backend.reset(nwalkers, ndim)
+
+    with parallel.WorkerPool(log_likelihood, processes=processes) as pool:
+        sampler = emcee.EnsembleSampler(
+            backend.nwalkers, ndim, log_prob, vectorize=True, backend=backend
+        )
+
+        if backend.iteration:
+            # continue the chain, and its random number stream
+            initial_state = backend.get_last_sample()
+            if random_state is not None:
+                sampler.random_state = random_state
+        else:
+            # start walkers in a small ball around the current values.
+            rng = np.random.default_rng(seed)
+            if seed is not None:
+                sampler.random_state = np.random.RandomState(seed).get_state()
+            center = np.array([params[name].value for name in names], dtype=float)
+            scale = np.where(
+                np.isfinite(upper - lower), (upper - lower) * 0.01, 0.01 * abs(center)
+            )
+            scale = np.where(scale > 0, scale, 1e-3)
+            initial_state = center + scale * rng.standard_normal((nwalkers, ndim))
+            initial_state = np.clip(initial_state, lower, upper)
+
+        remaining = nsteps - backend.iteration
+        if remaining > 0:
+            for state in sampler.sample(initial_state, iterations=remaining):
+                if checkpoint and backend.iteration % checkpoint_every == 0:
+                    _save_emcee_checkpoint(checkpoint, sampler, names)
+
+    if checkpoint:
+        _save_emcee_checkpoint(checkpoint, sampler, names)
+
+    # set the maximum posterior parameters
+    log_probs = sampler.get_log_prob(flat=True)
+    best = sampler.get_chain(flat=True)[np.argmax(log_probs)]
+    best_values = initial_values.copy()
+    best_values[vary_index] = best
+    best_params = pmap.to_params(best_values)
+    pmap.set_values(best_values)
+
+    print(f"mean acceptance fraction: {np.mean(sampler.acceptance_fraction):.3f}")
+    print("max posterior values:")
+    for name in names:
+        print(f"\t{name}: {best_params[name].value} (was: {params[name].value})")
+
+    return sampler
+
+
 def run_lmfit2(start, stop, *, debug=False, method="leastsq", **kwargs):
     fit_genes = {}
     for gene_name in vfg.get_gene_names():
@@ -813,6 +1522,211 @@ def run_lmfit2(start, stop, *, debug=False, method="leastsq", **kwargs):
     )
 
 
+FitData = collections.namedtuple(
+    "FitData", ["tissue_names", "gene_names", "index", "values", "weights"]
+)
+
+
+def prepare_fit_data(data, start, stop):
+    """Precompute an index into the state array for a long-format DataFrame.
+
+    'data' must have 'tissue', 'gene', 'time' and 'value' columns, plus
+    an optional 'weight' column (default 1). Returns a FitData tuple;
+    'index' is a (time, tissue, gene) tuple of integer arrays into the
+    arrays returned by TissueGeneStates.to_arrays(timepoints=range(start,
+    stop + 1), tissue_names=..., gene_names=...).
+    """
+    for col in ("tissue", "gene", "time", "value"):
+        if col not in data.columns:
+            raise Exception(f"fit data is missing column '{col}'")
+    if not len(data):
+        raise Exception("error! no data to fit!?")
+
+    tissue_names = sorted(set(data["tissue"]))
+    gene_names = sorted(set(data["gene"]))
+    for name in tissue_names:
+        if vfn.get_tissue(name) is None:
+            raise DinkumInvalidTissue(f"unknown tissue name: '{name}'")
+    for name in gene_names:
+        vfg.get_gene(name)  # raises DinkumInvalidGene
+
+    times = data["time"].to_numpy(dtype=int)
+    if times.min() < start or times.max() > stop:
+        raise Exception(f"fit data times must be between {start} and {stop}")
+
+    tissue_ix = {name: i for i, name in enumerate(tissue_names)}
+    gene_ix = {name: i for i, name in enumerate(gene_names)}
+    index = (
+        times - start,
+        data["tissue"].map(tissue_ix).to_numpy(dtype=int),
+        data["gene"].map(gene_ix).to_numpy(dtype=int),
+    )
+
+    values = data["value"].to_numpy(dtype=float)
+    if "weight" in data.columns:
+        weights = data["weight"].to_numpy(dtype=float)
+    else:
+        weights = np.ones(len(values))
+
+    return FitData(tissue_names, gene_names, index, values, weights)
+
+
+def _get_observed(states, fit_data, start, n_params):
+    """Return the levels, and their derivatives, at each observed point.
+
+    Levels that are not Dual numbers have zero derivatives."""
+    time_ix, tissue_ix, gene_ix = fit_data.index
+    values = np.zeros(len(time_ix))
+    grads = np.zeros((len(time_ix), n_params))
+
+    for n, (i, j, k) in enumerate(zip(time_ix, tissue_ix, gene_ix)):
+        time_state = states.get(start + int(i))
+        if time_state is None:
+            continue
+        gene_states = time_state._tissues_by_name.get(fit_data.tissue_names[j])
+        if gene_states is None:
+            continue
+        level = gene_states.get_level(fit_data.gene_names[k])
+        if isinstance(level, Dual):
+            values[n] = level.value
+            grads[n] = level.grad
+        else:
+            values[n] = level
+
+    return values, grads
+
+
+def calc_jacobian(start, stop, *, data, fit_genes, pmap=None, values=None):
+    """Compute levels and their parameter derivatives at observed points.
+
+    Runs one time course under continuous_relaxation, with every fit
+    parameter seeded as a Dual number, and returns (levels, jacobian):
+    'jacobian' has one row per row of 'data' and one column per
+    parameter (in pmap.names order).
+
+    'data' is as for run_lmfit_df. Parameters are taken from 'values', or
+    from the model's current values.
+    """
+    if pmap is None:
+        pmap = ParameterMap(fit_genes)
+    if values is None:
+        values = pmap.values.copy()
+    if not isinstance(data, FitData):
+        data = prepare_fit_data(data, start, stop)
+
+    tc = dinkum.Timecourse(start=start, stop=stop)
+    try:
+        with continuous_relaxation():
+            pmap.set_dual_values(values)
+            tc.run()
+        return _get_observed(tc.get_states(), data, start, len(pmap.names))
+    finally:
+        pmap.set_values(values)
+
+
+def run_lmfit_df(
+    start,
+    stop,
+    *,
+    data,
+    fit_genes,
+    debug=False,
+    method="leastsq",
+    jacobian=False,
+):
+    """Fit parameters of 'fit_genes' to observations in a DataFrame.
+
+    'data' is long-format, with one row per observation: columns
+    'tissue', 'gene', 'time', 'value' and (optional) 'weight'. Any
+    tissues and genes may be observed, at any subset of timepoints;
+    residuals are computed only at the observed points, scaled by weight.
+
+    With 'jacobian=True' (leastsq only), the model is fit under
+    continuous_relaxation, and forward-mode derivatives from one
+    augmented run per step are handed to the optimizer as Dfun, instead
+    of finite differences.
+    """
+    for g in fit_genes:
+        assert isinstance(g, vfg.Gene)
+    if jacobian and method != "leastsq":
+        raise Exception("jacobian=True is only supported with method='leastsq'")
+
+    fit_data = prepare_fit_data(data, start, stop)
+    print(
+        f"fitting {len(fit_data.values)} observations of {len(fit_data.gene_names)} genes in {len(fit_data.tissue_names)} tissues"
+    )
+
+    pmap = ParameterMap(fit_genes)
+    tc = dinkum.Timecourse(start=start, stop=stop)
+    timepoints = list(range(start, stop + 1))
+    weights = fit_data.weights
+
+    def simulate(params):
+        pmap.set_params(params)
+        tc.reset()
+        tc.run()
+
+        _, level, _ = tc.get_states().to_arrays(
+            timepoints=timepoints,
+            tissue_names=fit_data.tissue_names,
+            gene_names=fit_data.gene_names,
+        )
+        return level[fit_data.index]
+
+    # cache the most recent augmented run, which computes both residual
+    # and jacobian for the same parameter values.
+    last_run = {}
+
+    def simulate_with_jacobian(params):
+        values = np.array([params[name].value for name in pmap.names])
+        key = values.tobytes()
+        if key not in last_run:
+            last_run.clear()
+            last_run[key] = calc_jacobian(
+                start,
+                stop,
+                data=fit_data,
+                fit_genes=fit_genes,
+                pmap=pmap,
+                values=values,
+            )
+        return last_run[key]
+
+    def residual(params):
+        if debug:
+            print("RUNNING RESIDUAL")
+            params.pretty_print()
+
+        if jacobian:
+            levels, _ = simulate_with_jacobian(params)
+        else:
+            levels = simulate(params)
+        residuals = (levels - fit_data.values) * weights
+        if debug:
+            print("results:", residuals)
+        return residuals
+
+    def dfun(params):
+        _, grads = simulate_with_jacobian(params)
+        vary_cols = [i for i, name in enumerate(pmap.names) if params[name].vary]
+        return grads[:, vary_cols] * weights[:, None]
+
+    kw = {}
+    if jacobian:
+        kw["Dfun"] = dfun
+    res = minimize(residual, pmap.params, method=method, **kw)
+    pmap.set_params(res.params)
+
+    if hasattr(res, "message"):
+        print("fit message:", res.message)
+
+    print("fit values:")
+    for k in res.init_values:
+        print(f"\t{k}: fit={res.params[k].value} (was: {res.init_values[k]})")
+
+    return res
+
+
 def calc_response_1d(
     *,
     timepoint=1,
@@ -942,3 +1856,197 @@ def calc_response_2d(
             arr[y_activity, x_activity] = out_gsi.level
 
     return arr
+
+
+ResponseSurface = collections.namedtuple(
+    "ResponseSurface", ["target_name", "input_gene_names", "levels", "response"]
+)
+
+
+def _rule_fingerprint(ix):
+    """Return a string identifying this rule's class and parameters, or
+    None if the rule can't be identified reliably (e.g. no source code,
+    or values that can't be hashed); see dinkum.cache."""
+    from dinkum import cache
+
+    try:
+        if isinstance(ix, vfg.Interaction_CustomObj):
+            obj = ix.obj
+            attrs = {k: v for k, v in vars(obj).items() if k not in ("target", "level")}
+            ident = [cache._encode_class(type(obj)), ix.dest.name, cache._encode(attrs)]
+        elif isinstance(ix, vfg.Interaction_Custom):
+            ident = [ix.dest.name, ix.delay, cache._encode(ix.state_fn)]
+        else:
+            return None
+    except cache._Unhashable:
+        return None
+    return json.dumps(ident, sort_keys=True)
+
+
+def _calc_rule_response(
+    ix, *, input_names, levels, timepoint, tissue, fixed_gene_states, chunk_size, out
+):
+    "Fill 'out' with the response of 'ix' over the grid of input levels."
+    delay = getattr(ix, "delay", None)
+    if delay is None:
+        delay = getattr(ix.obj, "delay", 1)
+    set_tp = timepoint - delay
+
+    states_d = dinkum.TissueGeneStates()
+    for gene_name, gsi in fixed_gene_states.items():
+        assert isinstance(gsi, vfg.GeneStateInfo)
+        states_d.set_gene_state(
+            timepoint=set_tp,
+            tissue_name=tissue.name,
+            gene_name=gene_name,
+            state_info=gsi,
+        )
+
+    # walk the flattened grid in chunks, writing each chunk's levels to
+    # 'out' (and flushing them, if it is memory-mapped) before the next,
+    # so that only 'chunk_size' coordinates and levels are held at once.
+    flat_out = out.reshape(-1)
+    for chunk_start in range(0, flat_out.size, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, flat_out.size)
+        coords = np.unravel_index(np.arange(chunk_start, chunk_stop), out.shape)
+        values = np.empty(chunk_stop - chunk_start)
+        for i in range(len(values)):
+            for gene_name, axis_coords in zip(input_names, coords):
+                gsi = vfg.GeneStateInfo(levels[axis_coords[i]], True)
+                states_d.set_gene_state(
+                    timepoint=set_tp,
+                    tissue_name=tissue.name,
+                    gene_name=gene_name,
+                    state_info=gsi,
+                )
+            results = list(
+                ix.advance(timepoint=timepoint, states=states_d, tissue=tissue)
+            )
+            if results:
+                _, out_gsi = results[-1]
+                values[i] = out_gsi.level
+            else:
+                values[i] = np.nan
+
+        flat_out[chunk_start:chunk_stop] = values
+        if isinstance(out, np.memmap):
+            out.flush()
+
+
+def response_atlas(
+    *,
+    target_gene_names=None,
+    levels=range(0, 101, 10),
+    timepoint=1,
+    tissue_name=None,
+    fixed_gene_states={},
+    chunk_size=10000,
+    processes=None,
+    cache_dir=None,
+):
+    """
+    Compute the input -> output response surface for every rule at once.
+
+    Returns a dictionary mapping target gene names to ResponseSurface
+    tuples. 'response' is an N-dimensional array, with one axis per input
+    gene (in 'input_gene_names' order), giving the target's level as each
+    input varies across 'levels'. Entries where the rule has no opinion
+    are NaN.
+
+    Rules with no input genes (is_present, Decay, Growth, ...) are
+    skipped. Each rule is run at 'timepoint' with its own delay, in
+    'tissue_name' (default: first tissue); other genes can be fixed
+    with 'fixed_gene_states'.
+
+    Rules are computed in parallel across 'processes' worker processes,
+    each evaluating its grid of input levels 'chunk_size' points at a
+    time. If 'cache_dir' is set, surfaces are written there chunk by
+    chunk, as memory-mapped .npy files keyed by rule parameters, so a
+    worker holds only one chunk in memory; they are reloaded
+    (memory-mapped) on later calls. Otherwise, each surface is built,
+    and returned, in memory.
+    """
+    levels = list(levels)
+    assert levels, "must provide at least one level"
+    assert chunk_size > 0
+
+    if tissue_name is None:
+        tissues = vfn.get_tissues()
+        assert tissues, "must define at least one tissue"
+        tissue = tissues[0]
+    else:
+        tissue = vfn.get_tissue(tissue_name)
+        if tissue is None:
+            raise DinkumInvalidTissue(f"unknown tissue name: '{tissue_name}'")
+
+    if target_gene_names is not None:
+        target_gene_names = set(target_gene_names)
+
+    # find the rules to compute
+    todo = []
+    for ix in vfg.get_rules():
+        if target_gene_names is not None and ix.dest.name not in target_gene_names:
+            continue
+        input_names = ix.get_input_gene_names()
+        if not input_names:
+            continue
+        todo.append((ix, input_names))
+
+    cache_keys = [None] * len(todo)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for n, (ix, input_names) in enumerate(todo):
+            fingerprint = _rule_fingerprint(ix)
+            if fingerprint is None:
+                continue
+            ident = [
+                fingerprint,
+                repr(input_names),
+                repr(levels),
+                str(timepoint),
+                tissue.name,
+                repr(sorted((k, tuple(v)) for k, v in fixed_gene_states.items())),
+            ]
+            h = hashlib.sha256("\n".join(ident).encode("utf-8"))
+            cache_keys[n] = os.path.join(cache_dir, f"response-{h.hexdigest()}.npy")
+
+    def compute(n):
+        ix, input_names = todo[n]
+        cache_path = cache_keys[n]
+        if cache_path and os.path.exists(cache_path):
+            return cache_path
+
+        shape = (len(levels),) * len(input_names)
+        kw = dict(
+            input_names=input_names,
+            levels=levels,
+            timepoint=timepoint,
+            tissue=tissue,
+            fixed_gene_states=fixed_gene_states,
+            chunk_size=chunk_size,
+        )
+        if cache_path is None:
+            out = np.zeros(shape)
+            _calc_rule_response(ix, out=out, **kw)
+            return out
+
+        # write directly to disk, then move into place once complete.
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=float, shape=shape)
+        _calc_rule_response(ix, out=out, **kw)
+        out.flush()
+        del out
+        os.replace(tmp_path, cache_path)
+        return cache_path
+
+    results = parallel.map_processes(compute, range(len(todo)), processes=processes)
+
+    atlas = {}
+    for (ix, input_names), response in zip(todo, results):
+        if isinstance(response, str):
+            response = np.load(response, mmap_mode="r")
+        atlas[ix.dest.name] = ResponseSurface(
+            ix.dest.name, list(input_names), levels, response
+        )
+
+    return atlas
@@ -3,17 +3,31 @@
 X is-present in celltype/tissue/compartment M at time T
 """
 
+import builtins
 from functools import total_ordering
 
+import numpy as np
+from scipy import sparse
+
 from . import vfg
 from .exceptions import *
 
 _tissues = []
+_tissues_by_name = {}
+_lattices = []
+_neighbor_graph = None
 
 
 def _add_tissue(t):
     global _tissues
     _tissues.append(t)
+    _tissues_by_name[t.name] = t
+    _invalidate_neighbor_graph()
+
+
+def _invalidate_neighbor_graph():
+    global _neighbor_graph
+    _neighbor_graph = None
 
 
 def get_tissues():
@@ -25,18 +39,158 @@ def get_tissue_names():
 
 
 def get_tissue(name):
-    for t in _tissues:
-        if t.name == name:
-            return t
+    return _tissues_by_name.get(name)
 
 
 def reset():
-    global _tissues
+    global _tissues, _tissues_by_name, _lattices
     _tissues = []
+    _tissues_by_name = {}
+    _lattices = []
+    _invalidate_neighbor_graph()
+
+
+class NeighborGraph:
+    """Sparse (CSR) adjacency matrix of the tissue neighbor graph.
+
+    Row i of 'adjacency' marks the tissues whose ligands tissue i sees,
+    including itself; 'juxtacrine' is the same with the diagonal masked
+    out. Tissues are in sorted order, as from get_tissues().
+    """
+
+    def __init__(self, tissues):
+        self.tissues = list(tissues)
+        self.tissue_names = [t.name for t in self.tissues]
+        self.index = {name: i for i, name in enumerate(self.tissue_names)}
+
+        rows, cols = [], []
+        for i, t in enumerate(self.tissues):
+            for neighbor in t.neighbors:
+                j = self.index.get(neighbor.name)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+
+        n = len(self.tissues)
+        self.adjacency = self._to_csr(rows, cols, n)
+        self.juxtacrine = self._mask_diagonal(self.adjacency)
+
+        # edges within lattices are handled by stencils; the rest are 'extra'
+        self.lattices = []
+        stencil_rows, stencil_cols = [], []
+        for lattice in _lattices:
+            idx = np.array([self.index[name] for name in lattice.tissue_names])
+            src, dst = lattice.edges
+            stencil_rows.append(idx[src])
+            stencil_cols.append(idx[dst])
+            self.lattices.append((lattice, idx))
+
+        if self.lattices:
+            stencil = self._to_csr(
+                np.concatenate(stencil_rows), np.concatenate(stencil_cols), n
+            )
+            self.extra = self._to_csr(*(self.adjacency > stencil).nonzero(), n)
+        else:
+            self.extra = self.adjacency
+        self.juxtacrine_extra = self._mask_diagonal(self.extra)
+        self._weights = {}
+
+    @staticmethod
+    def _to_csr(rows, cols, n):
+        data = np.ones(len(rows), dtype=np.int32)
+        matrix = sparse.csr_matrix((data, (rows, cols)), shape=(n, n))
+        matrix.data[:] = 1  # collapse duplicate edges
+        return matrix
+
+    @staticmethod
+    def _mask_diagonal(matrix):
+        matrix = matrix.copy()
+        matrix.setdiag(0)
+        matrix.eliminate_zeros()
+        return matrix
+
+    def __len__(self):
+        return len(self.tissues)
+
+    def get_weights(self, *, range=1, attenuation=1.0, juxtacrine=False):
+        """Return a sparse matrix W, where W[i, j] is the weight with which
+        tissue i receives a ligand made in tissue j, up to 'range' hops
+        away: attenuation ** hops, or attenuation(hops) if callable.
+
+        Computed once per graph for each set of arguments.
+        """
+        key = (range, attenuation, juxtacrine)
+        weights = self._weights.get(key)
+        if weights is not None:
+            return weights
+
+        n = len(self.tissues)
+        reached = sparse.identity(n, dtype=np.int32, format="csr")
+        frontier = reached
+        weights = sparse.identity(n, dtype=float, format="csr")
+        for hops in builtins.range(1, range + 1):
+            frontier = ((frontier @ self.adjacency) > 0).astype(np.int32)
+            new = (frontier - reached) > 0
+            if callable(attenuation):
+                w = attenuation(hops)
+            else:
+                w = attenuation**hops
+            weights = weights + new.astype(float) * w
+            reached = ((reached + new) > 0).astype(np.int32)
+
+        weights = weights.tocsr()
+        if juxtacrine:
+            weights = self._mask_diagonal(weights)
+        self._weights[key] = weights
+        return weights
+
+    def signal(self, on, *, juxtacrine=False, range=1, attenuation=1.0):
+        """Given an array of where a ligand is active, indexed by tissue
+        (along the first axis), return where it is received.
+
+        'on' may be bool, uint64 bitsets (see dinkum.boolean), or ligand
+        levels; levels are summed over the tissues in 'range', weighted
+        as in get_weights.
+        """
+        on = np.asarray(on)
+        is_bits = on.dtype == bool or on.dtype == np.uint64
+        if range == 1 and attenuation == 1:
+            matrix = self.juxtacrine_extra if juxtacrine else self.extra
+            lattices = self.lattices
+        else:
+            matrix = self.get_weights(
+                range=range, attenuation=attenuation, juxtacrine=juxtacrine
+            )
+            lattices = []
+
+        if on.dtype == bool:
+            seen = (matrix @ on.astype(np.int32)) > 0
+        elif is_bits:
+            seen = np.zeros_like(on)
+            for t in np.flatnonzero(np.diff(matrix.indptr)):
+                neighbors = matrix.indices[matrix.indptr[t] : matrix.indptr[t + 1]]
+                seen[t] = np.bitwise_or.reduce(on[neighbors], axis=0)
+        else:
+            seen = matrix @ on.astype(float)
+
+        for lattice, idx in lattices:
+            if is_bits:
+                seen[idx] |= lattice.signal(on[idx], juxtacrine=juxtacrine)
+            else:
+                seen[idx] += lattice.signal(on[idx], juxtacrine=juxtacrine)
+        return seen
+
+
+def get_neighbor_graph():
+    "Return the NeighborGraph of all tissues, building it if needed."
+    global _neighbor_graph
+    if _neighbor_graph is None:
+        _neighbor_graph = NeighborGraph(get_tissues())
+    return _neighbor_graph
 
 
 def check_is_valid_tissue(t):
-    if not t in _tissues:
+    if t.name not in _tissues_by_name:
         raise DinkumInvalidTissue(f"{t.name} is an invalid tissue")
 
 
@@ -75,3 +229,162 @@ class Tissue:
         self.neighbors.add(neighbor)
         if bidirectional:
             neighbor.neighbors.add(self)  # make it bidirectional by default
+        _invalidate_neighbor_graph()
+
+
+NEIGHBORHOODS = ("von_neumann", "moore")
+
+
+class Lattice:
+    """A regular 2D or 3D grid of tissues ("cells"), created in bulk.
+
+    Cells are named '{name}_{i}_{j}' (or '{name}_{i}_{j}_{k}'), with
+    coordinates zero-padded so that sorted names are in row-major order,
+    and are addressable as lattice[i, j]. Each cell neighbors the cells
+    in its 'neighborhood': "von_neumann" (sharing a face) or "moore"
+    (sharing a face, edge or corner). 'periodic' wraps the grid around,
+    either along every axis or per axis, as a tuple of bools.
+
+    Ligand signaling within the lattice is computed with array shifts
+    (stencils) rather than through the sparse neighbor graph.
+    """
+
+    def __init__(
+        self, shape, *, name="cell", neighborhood="von_neumann", periodic=False
+    ):
+        shape = tuple(int(s) for s in shape)
+        if len(shape) not in (2, 3):
+            raise DinkumInvalidLattice(f"lattice shape must be 2D or 3D, not {shape}")
+        if neighborhood not in NEIGHBORHOODS:
+            raise DinkumInvalidLattice(
+                f"unknown neighborhood '{neighborhood}'; use one of {NEIGHBORHOODS}"
+            )
+        if isinstance(periodic, bool):
+            periodic = (periodic,) * len(shape)
+        assert len(periodic) == len(shape)
+
+        self.shape = shape
+        self.name = name
+        self.neighborhood = neighborhood
+        self.periodic = tuple(bool(p) for p in periodic)
+
+        if neighborhood == "von_neumann":
+            offsets = []
+            for axis in range(len(shape)):
+                for step in (-1, 1):
+                    offset = [0] * len(shape)
+                    offset[axis] = step
+                    offsets.append(tuple(offset))
+        else:
+            offsets = [
+                tuple(o - 1 for o in off) for off in np.ndindex(*(3,) * len(shape))
+            ]
+
+        # on a periodic axis of length 1 or 2, steps of -1 and +1 reach the
+        # same cell (or the cell itself), which must be counted only once
+        self.offsets = []
+        for offset in offsets:
+            offset = tuple(
+                step % size if wraps else step
+                for step, size, wraps in zip(offset, shape, self.periodic)
+            )
+            if any(offset) and offset not in self.offsets:
+                self.offsets.append(offset)
+
+        # create cells
+        widths = [len(str(s - 1)) for s in shape]
+        self.cells = np.empty(shape, dtype=object)
+        for coord in np.ndindex(*shape):
+            suffix = "".join(f"_{c:0{w}}" for c, w in zip(coord, widths))
+            self.cells[coord] = Tissue(name=f"{name}{suffix}")
+        self.tissue_names = [t.name for t in self.cells.flat]
+
+        # connect neighbors, as (src, dst) edges between flat cell indices
+        src, dst = [], []
+        grid = np.arange(self.cells.size).reshape(shape)
+        for offset in [(0,) * len(shape)] + self.offsets:
+            neighbor = self._shift(grid, offset, fill=-1)
+            ok = neighbor >= 0
+            src.append(grid[ok])
+            dst.append(neighbor[ok])
+        self.edges = (np.concatenate(src), np.concatenate(dst))
+
+        flat = self.cells.reshape(-1)
+        for i, j in zip(*self.edges):
+            flat[i].neighbors.add(flat[j])
+
+        _lattices.append(self)
+        _invalidate_neighbor_graph()
+
+    def __repr__(self):
+        return f"Lattice({self.shape}, name='{self.name}')"
+
+    def __getitem__(self, coord):
+        return self.cells[coord]
+
+    def __iter__(self):
+        return iter(self.cells.flat)
+
+    def __len__(self):
+        return self.cells.size
+
+    def _shift(self, arr, offset, *, fill=0):
+        """Return an array where each cell holds the value of 'arr' at
+        cell + offset, or 'fill' off the edge of a non-periodic axis."""
+        for axis, step in enumerate(offset):
+            if step == 0:
+                continue
+            if self.periodic[axis]:
+                arr = np.roll(arr, -step, axis=axis)
+                continue
+
+            shifted = np.full_like(arr, fill)
+            src = [slice(None)] * arr.ndim
+            dst = [slice(None)] * arr.ndim
+            if step > 0:
+                src[axis], dst[axis] = slice(step, None), slice(None, -step)
+            else:
+                src[axis], dst[axis] = slice(None, step), slice(-step, None)
+            shifted[tuple(dst)] = arr[tuple(src)]
+            arr = shifted
+        return arr
+
+    def signal(self, on, *, juxtacrine=False):
+        """Given an array of where a ligand is active, indexed by cell in
+        row-major order (along the first axis), return where it is seen;
+        as for NeighborGraph.signal, ligand levels are summed. Juxtacrine
+        ligands are not seen by the cell that makes them."""
+        on = np.asarray(on)
+        img = on.reshape(self.shape + on.shape[1:])
+        seen = np.zeros_like(img) if juxtacrine else img.copy()
+        is_bits = on.dtype == bool or on.dtype == np.uint64
+        for offset in self.offsets:
+            if is_bits:
+                seen |= self._shift(img, offset)
+            else:
+                seen += self._shift(img, offset)
+        return seen.reshape(on.shape)
+
+    def add_gene(self, *, gene=None, start=None, duration=None, mask=None):
+        "Make 'gene' present in every cell, or in the cells where 'mask' is True."
+        if mask is None:
+            mask = np.ones(self.shape, dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+        assert mask.shape == self.shape
+        for cell in self.cells[mask]:
+            cell.add_gene(gene=gene, start=start, duration=duration)
+
+    def to_images(self, states, *, timepoints=None, gene_names=None):
+        """Return gene states as image-like arrays.
+
+        Returns (timepoints, level, active), where 'level' and 'active' are
+        indexed by [timepoint, gene, *cell coordinates]; see
+        TissueGeneStates.to_arrays.
+        """
+        timepoints, level, active = states.to_arrays(
+            timepoints=timepoints, tissue_names=self.tissue_names, gene_names=gene_names
+        )
+        new_shape = (len(timepoints), -1) + self.shape
+        level = np.moveaxis(level, 2, 1).reshape(new_shape)
+        active = np.moveaxis(active, 2, 1).reshape(new_shape)
+        return timepoints, level, active
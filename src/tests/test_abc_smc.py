@@ -0,0 +1,132 @@
+import numpy as np
+
+import dinkum
+from dinkum.vfg import Gene
+from dinkum.vfn import Tissue
+from dinkum import observations
+from dinkum.abc_smc import run_abc_smc
+from dinkum.vfg_functions import LinearCombination
+
+
+def define_model():
+    # out = wX * X + wY * Y, with X at 100 and Y at 10
+    dinkum.reset()
+    m = Tissue(name="M")
+    Gene(name="X").is_present(where=m, start=1, level=100)
+    Gene(name="Y").is_present(where=m, start=1, level=10)
+    out = Gene(name="out")
+    lc = LinearCombination(weights=[0.5, 0.5], gene_names=["X", "Y"])
+    out.custom_obj(lc)
+    return out, lc
+
+
+def test_observation_checker():
+    define_model()
+    observations.check_level_is_between(
+        gene="out", time=2, tissue="M", min_level=80, max_level=100
+    )
+    observations.check_is_present(gene="X", time=2, tissue="M")
+
+    tc = dinkum.Timecourse(start=1, stop=3)
+    tc.run()
+    checker = observations.ObservationChecker()
+    for state in tc:
+        checker.check(state)
+
+    # out is 55 at time 2 => fails, 25 below the range
+    assert checker.results == [False, True]
+    assert checker.n_failed == 1
+    assert checker.distance() == 0.5
+    assert abs(checker.distance(graded=True) - 0.125) < 1e-9
+    assert observations.check_each(tc) == checker.results
+
+
+def test_run_stop_fn():
+    define_model()
+
+    tc = dinkum.Timecourse(start=1, stop=5)
+    tc.run(stop_fn=lambda state: state.time >= 3)
+    assert list(tc.states_d) == [1, 2, 3]
+
+
+def test_abc_smc():
+    out, lc = define_model()
+    observations.check_level_is_between(
+        gene="out", time=2, tissue="M", min_level=50, max_level=70
+    )
+    bounds = {"out_wX": (0, 1), "out_wY": (0, 1)}
+
+    pops = run_abc_smc(
+        1,
+        3,
+        fit_genes=[out],
+        bounds=bounds,
+        n_particles=50,
+        n_generations=3,
+        graded=True,
+        seed=1,
+        processes=2,
+    )
+    assert len(pops) == 3
+    last = pops[-1]
+    assert list(last.particles.columns) == ["out_wX", "out_wY"]
+    assert len(last.particles) == 50
+    assert abs(last.weights.sum() - 1) < 1e-9
+
+    # tolerances shrink, and every accepted particle is within tolerance
+    assert pops[0].epsilon == np.inf
+    assert pops[2].epsilon <= pops[1].epsilon
+    assert (last.distances <= last.epsilon).all()
+
+    # out = 100 * wX + 10 * wY needs to be ~50-70 => wX ~0.5-0.7
+    mean_wx = last.weights @ last.particles["out_wX"].values
+    assert 0.4 < mean_wx < 0.75
+    assert abs(lc.weights[0] - mean_wx) < 1e-9
+
+
+def test_abc_smc_zero_tolerance():
+    out, lc = define_model()
+    observations.check_level_is_between(
+        gene="out", time=2, tissue="M", min_level=50, max_level=70
+    )
+    bounds = {"out_wX": (0, 1), "out_wY": (0, 1)}
+
+    pops = run_abc_smc(
+        1,
+        3,
+        fit_genes=[out],
+        bounds=bounds,
+        n_particles=20,
+        n_generations=5,
+        seed=2,
+        processes=1,
+    )
+
+    # fraction-failed distance with one observation hits zero immediately
+    assert pops[-1].epsilon == 0
+    assert (pops[-1].distances == 0).all()
+    assert len(pops) == 2
+
+
+def test_abc_smc_out_of_bounds_proposals(monkeypatch):
+    out, lc = define_model()
+    observations.check_level_is_between(
+        gene="out", time=2, tissue="M", min_level=50, max_level=70
+    )
+    bounds = {"out_wX": (0, 1), "out_wY": (0, 1)}
+
+    # a huge perturbation kernel => every later proposal is out of bounds
+    monkeypatch.setattr(np.linalg, "cholesky", lambda cov: np.eye(len(cov)) * 1e6)
+    pops = run_abc_smc(
+        1,
+        3,
+        fit_genes=[out],
+        bounds=bounds,
+        n_particles=20,
+        n_generations=3,
+        graded=True,
+        max_simulations=500,
+        seed=1,
+        processes=1,
+    )
+    assert len(pops) == 1
@@ -0,0 +1,98 @@
+import numpy as np
+
+import dinkum
+from dinkum.vfg import Gene
+from dinkum.vfn import Tissue
+from dinkum import attractors
+from dinkum.attractors import find_attractors, tissue_basins
+from dinkum.boolean import BooleanModel
+
+
+def define_toggle_switch():
+    # X and Y repress each other, in the presence of maternal A
+    dinkum.reset()
+    a = Gene(name="A")
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    m = Tissue(name="M")
+    a.is_present(where=m, start=1)
+    x.and_not(activator=a, repressor=y)
+    y.and_not(activator=a, repressor=x)
+
+
+def test_initial_conditions():
+    define_toggle_switch()
+    model = BooleanModel()
+    assert attractors.get_maternal_gene_names() == ["A"]
+
+    initial = attractors.make_initial_conditions(model)
+    assert initial.shape == (4, 1, 3)
+    assert not initial[:, :, 0].any()  # A is maternal
+    assert len(set(map(bytes, initial.reshape(4, -1)))) == 4
+
+    initial = attractors.make_initial_conditions(
+        model, max_exhaustive=2, n_samples=10, seed=1
+    )
+    assert initial.shape == (10, 1, 3)
+
+
+def test_toggle_switch():
+    define_toggle_switch()
+    report = find_attractors(processes=2)
+
+    assert report.gene_names == ["A", "X", "Y"]
+    assert len(report.attractors) == 3
+    assert (report.basin >= 0).all()
+
+    # both on or both off => synchronous oscillation
+    cycle = report.attractors[0]
+    assert cycle.period == 2
+    assert cycle.basin_size == 2
+    on = cycle.states[:, 0, 1:].tolist()
+    assert sorted(on) == [[False, False], [True, True]]
+
+    # one on => stays that way
+    fixed = report.attractors[1:]
+    assert [a.period for a in fixed] == [1, 1]
+    assert sorted(a.states[0, 0].tolist() for a in fixed) == [
+        [True, False, True],
+        [True, True, False],
+    ]
+
+    # each initial condition maps to the attractor it starts in
+    for init, b in zip(report.initial, report.basin):
+        x_on, y_on = init[0, 1:]
+        if x_on != y_on:
+            assert report.attractors[b].period == 1
+            assert report.attractors[b].states[0, 0, 1] == x_on
+
+
+def test_tissue_basins():
+    define_toggle_switch()
+    b = Tissue(name="B")  # no maternal input
+    report = find_attractors(processes=1)
+
+    df = tissue_basins(report, "M")
+    assert list(df.columns) == ["states", "period", "basin_size", "fraction"]
+    assert df["basin_size"].sum() == 16
+    assert df.iloc[0]["period"] == 2
+
+    # nothing is ever on in B
+    df = tissue_basins(report, "B")
+    assert len(df) == 1
+    assert df.iloc[0]["states"] == ((),)
+    assert df.iloc[0]["fraction"] == 1
+
+
+def test_delayed_maternal_input():
+    # attractors are found after the maternal input turns off
+    dinkum.reset()
+    a = Gene(name="A")
+    x = Gene(name="X")
+    m = Tissue(name="M")
+    a.is_present(where=m, start=1, duration=3)
+    x.activated_by(source=a, delay=2)
+
+    report = find_attractors(processes=1)
+    assert len(report.attractors) == 1
+    assert not report.attractors[0].states.any()
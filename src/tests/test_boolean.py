@@ -0,0 +1,121 @@
+import pytest
+import numpy as np
+
+import dinkum
+from dinkum.vfg import Gene, Ligand, Receptor
+from dinkum.vfn import Tissue
+from dinkum import boolean
+from dinkum.boolean import BooleanModel, run_boolean, check_boolean_exact
+from dinkum.exceptions import DinkumNotBoolean
+from dinkum.vfg_functions import GeneTimecourse, LinearCombination, LogisticActivator
+
+
+def define_model():
+    dinkum.reset()
+
+    a = Gene(name="A")
+    b = Gene(name="B")
+    out = Gene(name="out")
+    c = Gene(name="C")
+    d = Gene(name="D")
+    lig = Ligand(name="L")
+    rec = Receptor(name="R", ligand=lig)
+
+    t1 = Tissue(name="T1")
+    t2 = Tissue(name="T2")
+    t3 = Tissue(name="T3")
+    t1.add_neighbor(neighbor=t2)
+
+    a.is_present(where=t1, start=1)
+    a.is_present(where=t2, start=1, duration=3)
+    b.is_present(where=t2, start=2)
+
+    out.and_not(activator=a, repressor=b)
+    c.activated_by_or(sources=[out, b])
+    d.activated_by_and(sources=[a, c])
+    lig.activated_by(source=out)
+    rec.activated_by(source=c)
+
+
+def test_pack_bits():
+    bits = np.random.default_rng(1).random((3, 130)) > 0.5
+    words = boolean.pack_bits(bits)
+    assert words.shape == (3, 3)
+    assert words.dtype == np.uint64
+    assert (boolean.unpack_bits(words, 130) == bits).all()
+
+
+def test_boolean_exact():
+    define_model()
+    assert check_boolean_exact(1, 8) == []
+
+
+def test_run_boolean():
+    define_model()
+    brun = run_boolean(1, 5)
+    assert brun.present.shape == (5, 1, 3, 7)
+
+    def is_on(tp, tissue, gene):
+        t = brun.timepoints.index(tp)
+        j = brun.tissue_names.index(tissue)
+        k = brun.gene_names.index(gene)
+        return brun.present[t, 0, j, k] and brun.active[t, 0, j, k]
+
+    assert is_on(2, "T1", "out")
+    assert not is_on(3, "T2", "out")  # repressed by B
+    assert is_on(3, "T1", "L")
+    # R is on in T2 via C, and L is signaled from neighboring T1
+    assert is_on(5, "T2", "R")
+    assert not is_on(5, "T3", "R")
+
+
+def test_initial_conditions():
+    # many random initial conditions agree with the integer engine
+    define_model()
+    model = BooleanModel()
+    rng = np.random.default_rng(2)
+    initial = rng.random((70, 3, 7)) > 0.5
+    brun = model.run(1, 4, initial=initial)
+
+    tissues = dinkum.vfn.get_tissues()
+    for n in [0, 1, 33, 69]:
+        tc = dinkum.Timecourse(start=1, stop=4)
+        init_state = dinkum.TissueAndGeneStateAtTime(tissues=tissues, time=0)
+        for j, tissue in enumerate(tissues):
+            genes = dinkum.OnlyGeneStates()
+            for k, name in enumerate(model.gene_names):
+                if initial[n, j, k]:
+                    gsi = dinkum.GeneStateInfo(level=100, active=True)
+                    genes.set_gene_state(gene=dinkum.get_gene(name), state_info=gsi)
+            init_state[tissue] = genes
+        tc.states_d[0] = init_state
+        tc.run()
+
+        _, level, active = tc.get_states().to_arrays(timepoints=brun.timepoints)
+        assert ((level > 0) == brun.present[:, n]).all()
+        assert (active == brun.active[:, n]).all()
+
+
+def test_not_boolean_exact():
+    dinkum.reset()
+    a = Gene(name="A")
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    t = Tissue(name="T")
+    a.is_present(where=t, start=1)
+
+    # X is at level 50, which is below Y's threshold
+    x.custom_obj(LinearCombination(weights=[0.5], gene_names=["A"]))
+    y.custom_obj(LogisticActivator(rate=100, midpoint=75, activator_name="X"))
+
+    assert check_boolean_exact(1, 4) == [(3, "T", "Y"), (4, "T", "Y")]
+
+
+def test_not_boolean():
+    dinkum.reset()
+    x = Gene(name="X")
+    m = Tissue(name="M")
+    x.custom_obj(GeneTimecourse(start_time=1, tissue=m, values=[100] * 5))
+
+    with pytest.raises(DinkumNotBoolean):
+        BooleanModel()
@@ -0,0 +1,214 @@
+import os
+
+import pytest
+
+import dinkum
+from dinkum import cache, store
+from dinkum.vfg import Gene
+from dinkum.vfn import Tissue
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # restore the cache settings afterwards
+    for name in ("_cache_dir", "_max_bytes", "_enabled"):
+        monkeypatch.setattr(cache, name, getattr(cache, name))
+    path = str(tmp_path / "cache")
+    cache.enable(path)
+    return path
+
+
+def build_model():
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    m.add_neighbor(neighbor=n)
+    x.is_present(where=m, start=1, duration=3)
+    y.activated_by(source=x)
+
+    def state_fn(*, X):
+        return X
+
+    z = Gene(name="Z")
+    z.custom_fn(state_fn=state_fn, delay=1)
+
+
+def test_model_hash():
+    dinkum.reset()
+    build_model()
+    h = cache.model_hash()
+    assert h is not None
+
+    # same model, rebuilt => same hash
+    dinkum.reset()
+    build_model()
+    assert cache.model_hash() == h
+
+    # any change => different hash
+    Tissue(name="O")
+    assert cache.model_hash() != h
+
+    dinkum.reset()
+    build_model()
+    dinkum.get_tissue("M").add_neighbor(neighbor=dinkum.get_tissue("M"))
+    assert cache.model_hash() == h  # tissues are their own neighbors already
+    Gene(name="W").is_present(where=dinkum.get_tissue("N"), start=2)
+    assert cache.model_hash() != h
+
+
+def test_model_hash_custom_fn_source():
+    dinkum.reset()
+    build_model()
+    h = cache.model_hash()
+
+    dinkum.reset()
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    m.add_neighbor(neighbor=n)
+    x.is_present(where=m, start=1, duration=3)
+    y.activated_by(source=x)
+
+    def state_fn(*, X):
+        return not X
+
+    z = Gene(name="Z")
+    z.custom_fn(state_fn=state_fn, delay=1)
+    assert cache.model_hash() != h
+
+
+def test_model_hash_no_source():
+    dinkum.reset()
+    build_model()
+    ns = {}
+    exec("def state_fn(*, X):\n    return X\n", ns)
+    Gene(name="W").custom_fn(state_fn=ns["state_fn"], delay=1)
+    assert cache.model_hash() is None
+
+
+THRESHOLD = 10
+
+
+def make_fn(th):
+    def state_fn(*, X):
+        return X.level > th, X.level > th
+
+    return state_fn
+
+
+def build_threshold_model(state_fn):
+    x = Gene(name="X")
+    m = Tissue(name="M")
+    x.is_present(where=m, start=1, level=50)
+    Gene(name="Z").custom_fn(state_fn=state_fn, delay=1)
+
+
+def test_model_hash_closure(cache_dir):
+    dinkum.reset()
+    build_threshold_model(make_fn(10))
+    h = cache.model_hash()
+    assert dinkum.run(1, 3).get_states()[3].get_by_tissue_name("M").is_active("Z")
+
+    # same source, different closure => different hash, and no stale hit
+    dinkum.reset()
+    build_threshold_model(make_fn(90))
+    assert cache.model_hash() != h
+    assert not dinkum.run(1, 3).get_states()[3].get_by_tissue_name("M").is_active("Z")
+
+    dinkum.reset()
+    build_threshold_model(make_fn(10))
+    assert cache.model_hash() == h
+
+
+def above(level, th=10):
+    return level > THRESHOLD and level > th
+
+
+def test_model_hash_defaults_and_globals(monkeypatch):
+    def state_fn(*, X):
+        return above(X.level), above(X.level)
+
+    dinkum.reset()
+    build_threshold_model(state_fn)
+    h = cache.model_hash()
+
+    # a global read by state_fn, and one read by the function it calls
+    monkeypatch.setitem(globals(), "THRESHOLD", 90)
+    assert cache.model_hash() != h
+    monkeypatch.undo()
+    assert cache.model_hash() == h
+
+    # the default of the function it calls
+    monkeypatch.setattr(above, "__defaults__", (90,))
+    assert cache.model_hash() != h
+    monkeypatch.undo()
+    assert cache.model_hash() == h
+
+
+def test_cache_hit(cache_dir, monkeypatch):
+    dinkum.reset()
+    build_model()
+    with cache.bypass():
+        tc = dinkum.run(1, 5)
+    expected = tc.get_states().to_dataframe()
+
+    tc = dinkum.run(1, 5)
+    assert len(os.listdir(cache_dir)) == 1
+    assert isinstance(tc.get_states(), store.StoredTissueGeneStates)
+
+    # no simulation on a hit
+    def fail(self, **kw):
+        raise Exception("should not run")
+
+    monkeypatch.setattr(dinkum.Timecourse, "_run", fail)
+    dinkum.reset()
+    build_model()
+    tc = dinkum.run(1, 5)
+    for df, expected_df in zip(tc.get_states().to_dataframe(), expected):
+        assert df.equals(expected_df)
+
+    # a different stop is a miss
+    with pytest.raises(Exception, match="should not run"):
+        dinkum.run(1, 6)
+
+
+def test_cache_bypass(cache_dir):
+    dinkum.reset()
+    build_model()
+    dinkum.run(1, 5, use_cache=False)
+    with cache.bypass():
+        dinkum.run_and_display_df(start=1, stop=5)
+    assert not os.path.exists(cache_dir)
+
+    dinkum.run_and_display_df(start=1, stop=5)
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_cache_lru_eviction(cache_dir):
+    dinkum.reset()
+    build_model()
+    dinkum.run(1, 5)
+    (entry,) = os.listdir(cache_dir)
+    size = cache._get_size(os.path.join(cache_dir, entry))
+
+    # room for two results
+    cache.enable(cache_dir, max_bytes=2 * size + size // 2)
+    dinkum.run(1, 6)
+    os.utime(os.path.join(cache_dir, entry), (0, 0))  # oldest...
+    dinkum.run(1, 5)  # ...until used again
+    assert len(os.listdir(cache_dir)) == 2
+
+    dinkum.run(1, 7)
+    keys = set(os.listdir(cache_dir))
+    assert keys == {cache.get_key(1, 5), cache.get_key(1, 7)}
+
+    # too big to keep at all
+    cache.enable(cache_dir, max_bytes=1)
+    tc = dinkum.run(1, 8)
+    assert tc.get_states()[8] is not None
+    assert cache.get_key(1, 8) not in os.listdir(cache_dir)
+
+    cache.clear()
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,191 @@
+import os
+
+import numpy as np
+import pytest
+
+import dinkum
+from dinkum import codegen
+from dinkum import vfg_functions as vf
+from dinkum.vfg import Gene, Ligand, Receptor
+from dinkum.vfn import Tissue, Lattice
+
+
+@pytest.fixture(autouse=True)
+def kernel_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(codegen, "_kernel_dir", str(tmp_path / "kernels"))
+    monkeypatch.setattr(codegen, "_kernels", {})
+    return str(tmp_path / "kernels")
+
+
+def state_fn(*, X, Y):
+    return X.level // 2, X.active and not Y.active
+
+
+class PlusOne:
+    "A custom rule object, called through by the kernel."
+
+    def set_gene(self, gene):
+        self.target = gene
+
+    def advance(self, timepoint, states, tissue):
+        gsi = states.get_gene_state_info(
+            timepoint=timepoint, delay=1, gene=dinkum.get_gene("X"), tissue=tissue
+        )
+        if gsi is None:
+            return None
+        return self.target, dinkum.GeneStateInfo(gsi.level + 1, True)
+
+
+def build_model():
+    "One of each kind of rule the kernel writes inline, and some it calls."
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    o = Tissue(name="O")
+    m.add_neighbor(neighbor=n)
+    n.add_neighbor(neighbor=o)
+
+    x, y, z, w, v, u = [Gene(name=name) for name in "XYZWVU"]
+    a = Ligand(name="A", range=2, attenuation=0.5)
+    r = Receptor(name="R", ligand=a, threshold=10)
+    r2 = Receptor(name="R2", ligand=a)
+
+    x.is_present(where=m, start=1, duration=4, level=101, decay=1.5)
+    x.is_present(where=o, start=2, level=60)
+    y.is_present(where=n, start=1, duration=2)
+    a.is_present(where=m, start=1)
+    r.is_present(where=n, start=1)
+    r.is_present(where=o, start=1)
+    y.activated_by(source=x)  # also is_present: the later rule wins
+    z.and_not(activator=x, repressor=y)
+    w.activated_by_or(sources=[x, y])
+    v.activated_by_and(sources=[x, y], delay=2)
+    u.custom_fn(state_fn=state_fn, delay=1)
+    r2.activated_by(source=x)
+
+    objs = dict(
+        L=vf.LinearCombination(weights=[0.5, -1], gene_names=["X", "Y"]),
+        LR=vf.LogisticRepressor(activator_name="X", repressor_name="Y"),
+        MR=vf.LogisticMultiRepressor(
+            activator_name="X", repressor_names=["Y", "Z"], weights=[1, 0.5]
+        ),
+        D=vf.Decay(rate=1.5, tissue=n),
+        G=vf.Growth(rate=0.3, tissue=m, start_time=2),
+        T=vf.GeneTimecourse(start_time=1, tissue=o, values=[1, 5, 10]),
+        P=PlusOne(),
+        # not a plain number, so called through
+        F=vf.LogisticMultiActivator(
+            activator_names=["X", "Y"], weights=[np.array(0.5), 1]
+        ),
+    )
+    for name, obj in objs.items():
+        Gene(name=name).custom_obj(obj)
+
+
+def assert_same(tc, expected_tc):
+    dfs = tc.get_states().to_dataframe()
+    expected = expected_tc.get_states().to_dataframe()
+    for df, expected_df in zip(dfs, expected):
+        assert df.equals(expected_df)
+
+
+def test_compiled_matches_timecourse(kernel_dir):
+    dinkum.reset()
+    build_model()
+    expected = dinkum.Timecourse(start=1, stop=8)
+    expected.run()
+
+    model = dinkum.compile()
+    assert os.path.dirname(model.path) == kernel_dir
+    source = open(model.path).read()
+    assert "exp(e)" in source  # inline logistic rules...
+    assert "adv18 = R[18].advance" in source  # ...and called through
+    assert "adv19 = R[19].advance" in source
+    assert_same(model.run(start=1, stop=8), expected)
+
+    # stop early
+    def stop_fn(state):
+        return state.get_by_tissue_name("N").is_active("Z")
+
+    expected = dinkum.Timecourse(start=1, stop=8)
+    expected.run(stop_fn=stop_fn)
+    tc = model.run(start=1, stop=8, stop_fn=stop_fn)
+    assert list(tc.get_states().keys()) == list(expected.get_states().keys())
+    assert_same(tc, expected)
+
+
+def test_compiled_lattice():
+    # stencil signaling, wrapping around one axis
+    dinkum.reset()
+    lattice = Lattice((6, 5), periodic=(True, False))
+    a = Ligand(name="A", range=2)
+    r = Receptor(name="R", ligand=a, threshold=50)
+    x = Gene(name="X")
+    a.is_present(where=lattice[0, 2], start=1)
+    for cell in lattice:
+        r.is_present(where=cell, start=1)
+    x.activated_by(source=r)
+
+    expected = dinkum.Timecourse(start=1, stop=4)
+    expected.run()
+    assert expected.get_states()[4].get_by_tissue_name("cell_5_2").is_active("X")
+    assert_same(dinkum.compile().run(start=1, stop=4), expected)
+
+
+def test_kernel_cached(monkeypatch):
+    dinkum.reset()
+    build_model()
+    model = dinkum.compile()
+    assert dinkum.compile().module is model.module
+
+    # a new process imports the kernel, without generating it again
+    def fail(self):
+        raise Exception("should not generate")
+
+    monkeypatch.setattr(codegen, "_kernels", {})
+    monkeypatch.setattr(codegen._Kernel, "generate", fail)
+    dinkum.reset()
+    build_model()
+    model2 = dinkum.compile()
+    assert model2.path == model.path
+    assert model2.module is not model.module
+
+    # a different model is a new kernel
+    Gene(name="extra")
+    with pytest.raises(Exception, match="should not generate"):
+        dinkum.compile()
+
+
+def test_compiled_model_changed():
+    dinkum.reset()
+    build_model()
+    model = dinkum.compile()
+    model.run(start=1, stop=2)
+
+    dinkum.get_gene("Y")  # no change
+    model.run(start=1, stop=2)
+
+    (rule,) = vf.get_ix2_for_gene_name("Z")
+    rule.obj.repressor_rate = 50
+    with pytest.raises(Exception, match="model has changed"):
+        model.run(start=1, stop=2)
+
+    dinkum.reset()
+    build_model()
+    model = dinkum.compile()
+    Gene(name="extra")
+    with pytest.raises(Exception, match="model has changed"):
+        model.run(start=1, stop=2)
+
+
+def test_compile_unhashable_model():
+    dinkum.reset()
+    build_model()
+    ns = {}
+    exec("def fn(*, X):\n    return X\n", ns)
+    Gene(name="E").custom_fn(state_fn=ns["fn"], delay=1)
+
+    expected = dinkum.Timecourse(start=1, stop=5)
+    expected.run()
+    model = dinkum.compile()
+    assert model.path is None
+    assert_same(model.run(start=1, stop=5), expected)
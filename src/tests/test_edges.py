@@ -0,0 +1,103 @@
+import pandas as pd
+import pytest
+
+import dinkum
+from dinkum.vfg import Gene, Ligand, Receptor
+from dinkum.vfn import Tissue
+
+
+def build_tissues(genes):
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    m.add_neighbor(neighbor=n)
+    genes["A"].is_present(where=m, start=1, duration=4)
+    genes["B"].is_present(where=m, start=3)
+    genes["B"].is_present(where=n, start=1)
+
+
+def get_results():
+    tc = dinkum.run(1, 8)
+    return tc.get_states().to_dataframe()
+
+
+def test_from_edges_matches_gene_methods():
+    dinkum.reset()
+    a = Gene(name="A")
+    b = Gene(name="B")
+    c = Gene(name="C")
+    d = Gene(name="D")
+    e = Gene(name="E")
+    f = Gene(name="F")
+    c.activated_by(source=a)
+    d.and_not(activator=a, repressor=b)
+    e.activated_by_and(sources=[a, b])
+    f.activated_by_or(sources=[c, e], delay=2)
+    build_tissues(dict(A=a, B=b))
+    expected = get_results()
+
+    dinkum.reset()
+    df = pd.DataFrame(
+        [
+            dict(source="A", target="C", sign=1, weight=1, delay=1, logic="or"),
+            dict(source="A", target="D", sign="+", weight=1, delay=1, logic="or"),
+            dict(source="B", target="D", sign="-", weight=1, delay=1, logic="or"),
+            dict(source="A", target="E", sign=1, weight=1, delay=1, logic="and"),
+            dict(source="B", target="E", sign=1, weight=1, delay=1, logic="and"),
+            dict(source="C", target="F", sign=1, weight=1, delay=2, logic="or"),
+            dict(source="E", target="F", sign=1, weight=1, delay=2, logic="or"),
+        ]
+    )
+    genes = dinkum.from_edges(df)
+    assert list(genes) == ["A", "C", "D", "B", "E", "F"]
+    build_tissues(genes)
+    for df, expected_df in zip(get_results(), expected):
+        assert df.equals(expected_df)
+
+
+def test_from_edges_signal():
+    dinkum.reset()
+    df = pd.DataFrame(
+        dict(
+            source=["L", "R", "X"],
+            target=["R", "Y", "L"],
+            logic=["signal", "or", "or"],
+        )
+    )
+    genes = dinkum.from_edges(df)
+    assert isinstance(genes["L"], Ligand)
+    assert isinstance(genes["R"], Receptor)
+    assert genes["R"]._set_ligand is genes["L"]
+    assert type(genes["Y"]) is Gene
+
+    # ligands don't regulate genes directly
+    dinkum.reset()
+    df = pd.DataFrame(
+        dict(source=["L", "L"], target=["R", "Y"], logic=["signal", "or"])
+    )
+    with pytest.raises(dinkum.DinkumNotATranscriptionFactor):
+        dinkum.from_edges(df)
+
+
+def test_from_edges_validates_before_adding():
+    dinkum.reset()
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    y.activated_by(source=x)
+
+    df = pd.DataFrame(dict(source=["X", "X"], target=["Z", "Y"]))
+    with pytest.raises(dinkum.DinkumMultipleRules):
+        dinkum.from_edges(df)
+    assert dinkum.vfg.get_gene_names() == ["X", "Y"]
+    assert len(dinkum.vfg.get_rules()) == 1
+
+    for bad in [
+        dict(source=["X"], target=["Z"], sign=[0]),
+        dict(source=["X"], target=["Z"], logic=["xor"]),
+        dict(source=["X", "W"], target=["Z", "Z"], delay=[1, 2]),
+        dict(source=["X", "X"], target=["Z", "Z"]),
+        dict(source=["X"], target=["Z"], sign=[-1]),
+        dict(source=["X"]),
+    ]:
+        with pytest.raises(Exception):
+            dinkum.from_edges(pd.DataFrame(bad))
+    assert dinkum.vfg.get_gene_names() == ["X", "Y"]
@@ -0,0 +1,112 @@
+import pytest
+import numpy as np
+
+import dinkum
+from dinkum import vfn
+from dinkum.exceptions import DinkumInvalidLattice
+from dinkum.vfg import Gene, Ligand, Receptor
+from dinkum.vfn import Lattice, Tissue
+
+
+def test_lattice_cells():
+    dinkum.reset()
+    lat = Lattice((3, 12))
+
+    assert len(lat) == 36
+    assert lat[0, 0].name == "cell_0_00"
+    assert lat[2, 11].name == "cell_2_11"
+    assert lat.tissue_names == sorted(lat.tissue_names)
+    assert vfn.get_tissue("cell_1_05") is lat[1, 5]
+
+    # von Neumann, not periodic
+    assert lat[1, 5].neighbors == {
+        lat[1, 5],
+        lat[0, 5],
+        lat[2, 5],
+        lat[1, 4],
+        lat[1, 6],
+    }
+    assert lat[0, 0].neighbors == {lat[0, 0], lat[1, 0], lat[0, 1]}
+
+
+def test_lattice_neighborhoods():
+    dinkum.reset()
+    lat = Lattice((4, 4), name="m", neighborhood="moore", periodic=True)
+    assert all(len(cell.neighbors) == 9 for cell in lat)
+    assert lat[0, 3] in lat[3, 0].neighbors
+
+    lat = Lattice((3, 3, 3), name="v", periodic=(True, False, False))
+    assert len(lat[1, 1, 1].neighbors) == 7
+    assert lat[2, 0, 0] in lat[0, 0, 0].neighbors
+    assert len(lat[0, 0, 0].neighbors) == 5
+
+    with pytest.raises(DinkumInvalidLattice):
+        Lattice((3, 3), name="x", neighborhood="hex")
+    with pytest.raises(DinkumInvalidLattice):
+        Lattice((3,), name="y")
+
+
+@pytest.mark.parametrize("neighborhood", ["von_neumann", "moore"])
+@pytest.mark.parametrize("periodic", [False, True])
+def test_stencil_matches_graph(neighborhood, periodic):
+    # stencil signaling agrees with the sparse adjacency matrix
+    dinkum.reset()
+    lat = Lattice((5, 7), neighborhood=neighborhood, periodic=periodic)
+    extra = Tissue(name="extra")
+    extra.add_neighbor(neighbor=lat[2, 3])
+
+    graph = vfn.get_neighbor_graph()
+    assert graph.extra.nnz == 3  # extra <=> cell, extra => extra
+
+    rng = np.random.default_rng(1)
+    on = rng.random(len(graph)) < 0.2
+    for juxtacrine in (False, True):
+        matrix = graph.juxtacrine if juxtacrine else graph.adjacency
+        expected = (matrix @ on.astype(int)) > 0
+        assert (graph.signal(on, juxtacrine=juxtacrine) == expected).all()
+
+
+@pytest.mark.parametrize("neighborhood", ["von_neumann", "moore"])
+@pytest.mark.parametrize("shape", [(1, 3), (2, 3), (2, 2), (1, 1), (2, 1, 3)])
+def test_stencil_short_periodic_axes(neighborhood, shape):
+    # on axes of length 1 or 2, wrapping around reaches a cell only once
+    dinkum.reset()
+    Lattice(shape, neighborhood=neighborhood, periodic=True)
+    graph = vfn.get_neighbor_graph()
+
+    levels = np.zeros(len(graph))
+    levels[0] = 100
+    for juxtacrine in (False, True):
+        weights = graph.get_weights(juxtacrine=juxtacrine)
+        expected = weights @ levels
+        assert (graph.signal(levels, juxtacrine=juxtacrine) == expected).all()
+
+
+def test_juxtacrine_signaling():
+    # Delta in the center cell activates Notch in its neighbors only
+    dinkum.reset()
+    lat = Lattice((5, 5))
+
+    delta = Ligand(name="Delta", is_juxtacrine=True)
+    notch = Receptor(name="Notch", ligand=delta)
+    lat.add_gene(gene=notch, start=1)
+    center = np.zeros((5, 5), dtype=bool)
+    center[2, 2] = True
+    lat.add_gene(gene=delta, start=1, mask=center)
+
+    tc = dinkum.Timecourse(start=1, stop=3)
+    tc.run()
+
+    timepoints, level, active = lat.to_images(
+        tc.get_states(), gene_names=["Delta", "Notch"]
+    )
+    assert timepoints == [1, 2, 3]
+    assert level.shape == (3, 2, 5, 5)
+    assert (level[:, 0] > 0).tolist() == [center.tolist()] * 3
+    assert (level[:, 1] == 100).all()
+
+    notch_active = active[2, 1]
+    expected = np.zeros((5, 5), dtype=bool)
+    expected[[1, 3, 2, 2], [2, 2, 1, 3]] = True
+    assert (notch_active == expected).all()
+    assert not active[0, 1].any()
@@ -73,3 +73,63 @@ def test_output_double_neg():
     define_model()
     print(f"writing to {filename}")
     dinkum.utils.output_biotapestry_csv("/tmp/out.btp.csv")
+
+
+def get_links():
+    "Return {target: {(source, sign)}} for the current model."
+    links = {}
+    for ix in vfg.get_rules():
+        for target, source, sign in ix.btp_autonomous_links():
+            links.setdefault(target.name, set()).add((source.name, sign))
+    return links
+
+
+def test_btp_links():
+    define_model()
+    links = get_links()
+    assert links["hesC"] == {("ub1", "positive"), ("pmar1", "negative")}
+    assert links["gcm"] == {("ub2", "positive"), ("su(h)", "positive")}
+    assert "pmar1" not in links
+
+    notch = vfg.get_gene("su(h)")
+    signal_links = set()
+    for ix in vfg.get_rules():
+        signal_links.update(ix.btp_signal_links())
+    assert signal_links == {(notch, vfg.get_gene("delta"), "positive")}
+
+    # rules without built-in links default to 'neutral' links from inputs
+    def state_fn(*, pmar1):
+        return pmar1
+
+    Gene(name="X").custom_fn(state_fn=state_fn, delay=1)
+    assert get_links()["X"] == {("pmar1", "neutral")}
+
+
+def test_read_biotapestry_csv(tmp_path):
+    define_model()
+    Gene(name="unlinked")
+    Tissue(name="far away")
+    filename = tmp_path / "out.btp.csv"
+    dinkum.utils.output_biotapestry_csv(filename)
+    expected_links = get_links()
+    expected_neighbors = {
+        t.name: sorted(n.name for n in t.neighbors) for t in vfn.get_tissues()
+    }
+
+    genes = dinkum.utils.read_biotapestry_csv(filename)
+    assert sorted(genes) == vfg.get_gene_names()
+    assert "unlinked" in genes
+    assert isinstance(genes["delta"], Ligand)
+    assert isinstance(genes["su(h)"], Receptor)
+    assert genes["su(h)"]._set_ligand is genes["delta"]
+    assert get_links() == expected_links
+    assert {
+        t.name: sorted(n.name for n in t.neighbors) for t in vfn.get_tissues()
+    } == expected_neighbors
+
+    # and back out again, once the receptor's maternal inputs are back
+    for tissue in ("micromeres", "rest of embryo"):
+        genes["su(h)"].is_present(where=vfn.get_tissue(tissue), start=1)
+    filename2 = tmp_path / "out2.btp.csv"
+    dinkum.utils.output_biotapestry_csv(filename2)
+    assert sorted(open(filename).readlines()) == sorted(open(filename2).readlines())
@@ -0,0 +1,184 @@
+import numpy as np
+import pytest
+
+import dinkum
+from dinkum import Timecourse, observations, partition
+from dinkum.exceptions import DinkumInvalidActivationResult
+from dinkum.vfg import Gene, Ligand, Receptor
+from dinkum.vfn import Tissue, Lattice
+
+
+def build_model():
+    # a signal relayed from cell to cell across a lattice, so that it
+    # crosses the partition boundaries, plus a chain of tissues
+    lat = Lattice((6, 6))
+    lig = Ligand(name="L")
+    r = Receptor(name="R", ligand=lig)
+    a = Gene(name="A")
+    corner = np.zeros((6, 6), dtype=bool)
+    corner[0, 0] = True
+    lat.add_gene(gene=a, start=1, mask=corner)
+    lat.add_gene(gene=r, start=1)
+    lig.activated_by_or(sources=[a, r])
+    Gene(name="B").activated_by(source=r)
+
+    cells = [Tissue(name=f"z{i}") for i in range(5)]
+    for x, y in zip(cells, cells[1:]):
+        x.add_neighbor(neighbor=y)
+    for c in cells:
+        r.is_present(where=c, start=1)
+    a.is_present(where=cells[0], start=2, level=51, decay=1.5)
+
+
+def run_model(**kw):
+    dinkum.reset()
+    build_model()
+    tc = Timecourse(start=1, stop=12)
+    tc.run(**kw)
+    return tc
+
+
+def test_partition_tissues():
+    dinkum.reset()
+    Lattice((8, 8))
+    Ligand(name="L")
+    graph = dinkum.vfn.get_neighbor_graph()
+
+    parts = partition.partition_tissues(4, graph)
+    assert sorted(np.concatenate(parts).tolist()) == list(range(64))
+    assert [len(p) for p in parts] == [16] * 4
+    # blocks of two rows => 3 cuts of 8 edges, in each direction
+    assert partition.count_cut_edges(parts, graph) == 48
+
+    halo = partition.get_halo(parts[0], graph)
+    assert halo.tolist() == list(range(16, 24))
+
+
+@pytest.mark.parametrize("processes", [2, 3])
+def test_partitioned_run_is_identical(processes):
+    serial = run_model()
+    tp, level, active = serial.get_states().to_arrays()
+    assert active[-1].any()
+
+    tc = run_model(processes=processes)
+    tp2, level2, active2 = tc.get_states().to_arrays()
+    assert tp2 == tp
+    assert (level2 == level).all()
+    assert (active2 == active).all()
+
+    # the same genes are set, with the same types of levels
+    for t in tp:
+        for tissue in dinkum.vfn.get_tissues():
+            a = serial.states_d[t][tissue].genes_by_name
+            b = tc.states_d[t][tissue].genes_by_name
+            assert sorted(a) == sorted(b)
+            for name in a:
+                assert a[name].level == b[name].level
+                assert type(a[name].level) is type(b[name].level)
+                assert a[name].active == b[name].active
+
+
+def test_partitioned_run_stop_fn():
+    seen = []
+
+    def stop_fn(state):
+        seen.append(state.time)
+        return state.time == 4
+
+    tc = run_model(processes=2, stop_fn=stop_fn)
+    assert seen == [1, 2, 3, 4]
+    assert sorted(tc.keys()) == [1, 2, 3, 4]
+
+
+def test_partitioned_run_seeded_state():
+    # initial conditions set before the run reach every worker
+    def run(**kw):
+        dinkum.reset()
+        cells = [Tissue(name=f"c{i}") for i in range(4)]
+        a = Gene(name="A")
+        b = Gene(name="B")
+        a.activated_by(source=b)
+        b.activated_by(source=a)
+
+        tc = Timecourse(start=1, stop=4)
+        init_state = dinkum.TissueAndGeneStateAtTime(tissues=cells, time=0)
+        for cell in cells:
+            genes = dinkum.OnlyGeneStates()
+            if cell.name in ("c0", "c3"):
+                gsi = dinkum.GeneStateInfo(100, True)
+                genes.set_gene_state(gene=a, state_info=gsi)
+            init_state[cell] = genes
+        tc.states_d[0] = init_state
+        tc.run(**kw)
+        return tc
+
+    serial = run()
+    assert serial.states_d[3].get_by_tissue_name("c3").get_level("B") == 100
+    tp, level, active = serial.get_states().to_arrays()
+
+    tc = run(processes=2)
+    tp2, level2, active2 = tc.get_states().to_arrays()
+    assert tp2 == tp
+    assert (level2 == level).all()
+    assert (active2 == active).all()
+
+
+def test_partitioned_run_error():
+    dinkum.reset()
+    cells = [Tissue(name=f"c{i}") for i in range(4)]
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    x.is_present(where=cells[3], start=1)
+
+    def bad_fn(*, X):
+        if X.active:
+            return "not a state"
+        return X
+
+    y.custom_fn(state_fn=bad_fn, delay=1)
+
+    tc = Timecourse(start=1, stop=5)
+    with pytest.raises(DinkumInvalidActivationResult):
+        tc.run(processes=2)
+
+
+@pytest.mark.parametrize("threads,processes", [(4, 1), (3, 2)])
+def test_threaded_run_is_identical(threads, processes):
+    _, level, active = run_model().get_states().to_arrays()
+
+    tc = run_model(threads=threads, processes=processes)
+    _, level2, active2 = tc.get_states().to_arrays()
+    assert (level2 == level).all()
+    assert (active2 == active).all()
+
+
+def test_rules_keep_no_state_between_runs():
+    from dinkum.vfg_functions import Decay, Growth
+
+    dinkum.reset()
+    m = Tissue(name="M")
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    z = Gene(name="Z")
+    x.custom_obj(Decay(start_time=1, rate=2, initial_level=100, tissue=m))
+    y.custom_obj(Growth(start_time=1, rate=0.5, tissue=m))
+    z.is_present(where=m, start=1, level=80, decay=2)
+
+    tc = Timecourse(start=1, stop=4)
+    tc.run()
+    _, level, _ = tc.get_states().to_arrays()
+    assert level[:, 0].tolist() == [
+        [100, 0, 80],
+        [50, 50, 40],
+        [25, 75, 20],
+        [12.5, 87, 10],
+    ]
+
+    # running again, or from a later start, gives the same levels
+    tc.reset()
+    tc.run(threads=2)
+    assert (tc.get_states().to_arrays()[1] == level).all()
+
+    tc = Timecourse(start=3, stop=4)
+    tc.run()
+    assert (tc.get_states().to_arrays()[1] == level[2:]).all()
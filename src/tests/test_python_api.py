@@ -34,3 +34,65 @@ def test_2():
 
     # run time course
     display_fn, level_df, active_df = dinkum.run_and_display_df(start=1, stop=5)
+
+
+def test_to_dataframe():
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    x.is_present(where=m, start=1, duration=2)
+    y.activated_by(source=x)
+
+    tc = Timecourse(start=1, stop=3)
+    tc.run()
+    states = tc.get_states()
+
+    level_df, active_df = states.to_dataframe()
+    assert level_df.index.name == "timepoint"
+    assert list(level_df.columns) == ["tissue", "timepoint_str", "X", "Y"]
+    assert list(level_df.index) == [1, 1, 2, 2, 3, 3]
+    assert list(level_df["tissue"]) == ["M", "N"] * 3
+    assert list(level_df["X"]) == [100, 0, 100, 0, 0, 0]
+    assert level_df["X"].dtype == int
+    assert list(level_df["Y"]) == [0, 0, 100, 0, 100, 0]
+    assert active_df["X"].dtype == bool
+
+    level_df, _ = states.to_dataframe(["Y"], multi_index=True)
+    assert level_df.index.names == ["timepoint", "tissue"]
+    assert list(level_df.columns) == ["Y"]
+    assert level_df.loc[(2, "M"), "Y"] == 100
+
+    with pytest.raises(DinkumInvalidGene):
+        states.to_dataframe(["Z"])
+
+
+def test_to_long_dataframe():
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    x.is_present(where=m, start=1, duration=2)
+    y.activated_by(source=x)
+
+    tc = Timecourse(start=1, stop=3)
+    tc.run()
+
+    df = tc.get_states().to_long_dataframe()
+    assert list(df.columns) == ["time", "tissue", "gene", "level", "active"]
+    assert len(df) == 3 * 2 * 2
+    assert df["tissue"].dtype == "category"
+
+    on = df[df["active"] & (df["level"] > 0)]
+    assert list(zip(on["time"], on["tissue"], on["gene"])) == [
+        (1, "M", "X"),
+        (2, "M", "X"),
+        (2, "M", "Y"),
+        (3, "M", "Y"),
+    ]
+    totals = df.groupby("gene", observed=True)["level"].sum()
+    assert totals.to_dict() == {"X": 200, "Y": 200}
@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 
 import dinkum
@@ -327,3 +328,123 @@ def test_community_effect():
         print(kw)
 
     dinkum.run(1, 12, trace_fn=trace_me)
+
+
+def test_neighbor_graph():
+    dinkum.reset()
+
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    o = Tissue(name="O")
+    m.add_neighbor(neighbor=n, bidirectional=False)
+
+    graph = dinkum.vfn.get_neighbor_graph()
+    assert graph.tissue_names == ["M", "N", "O"]
+    assert graph.adjacency.toarray().tolist() == [[1, 1, 0], [0, 1, 0], [0, 0, 1]]
+    assert graph.juxtacrine.toarray().tolist() == [[0, 1, 0], [0, 0, 0], [0, 0, 0]]
+
+    # N is on => seen by M and N, but only by M if juxtacrine
+    on = [False, True, False]
+    assert graph.signal(on).tolist() == [True, True, False]
+    assert graph.signal(on, juxtacrine=True).tolist() == [True, False, False]
+
+    # adding a neighbor rebuilds the graph
+    o.add_neighbor(neighbor=n)
+    graph2 = dinkum.vfn.get_neighbor_graph()
+    assert graph2 is not graph
+    assert graph2.adjacency[1, 2] == 1
+    assert dinkum.vfn.get_neighbor_graph() is graph2
+
+
+def test_signaling_chain():
+    # a relay of ligand => receptor => ligand along a chain of many cells
+    dinkum.reset()
+
+    n_cells = 300
+    cells = [Tissue(name=f"cell{i:03}") for i in range(n_cells)]
+    for a, b in zip(cells, cells[1:]):
+        a.add_neighbor(neighbor=b)
+
+    lig = Ligand(name="L", is_juxtacrine=True)
+    a = Gene(name="A")
+    r = Receptor(name="R", ligand=lig)
+
+    a.is_present(where=cells[0], start=1)
+    for c in cells:
+        r.is_present(where=c, start=1)
+    lig.activated_by_or(sources=[a, r])
+
+    tc = Timecourse(start=1, stop=12)
+    tc.run()
+
+    def active_r(tp):
+        state = tc.states_d[tp]
+        return [state.get_by_tissue_name(c.name).is_active("R") for c in cells]
+
+    # the signal moves one cell every two ticks
+    assert active_r(4)[:3] == [False, True, False]
+    assert active_r(12)[:6] == [True] * 6
+    assert not any(active_r(12)[6:])
+
+
+def test_ligand_range_weights():
+    dinkum.reset()
+
+    cells = [Tissue(name=f"cell{i}") for i in range(5)]
+    for a, b in zip(cells, cells[1:]):
+        a.add_neighbor(neighbor=b)
+
+    graph = dinkum.vfn.get_neighbor_graph()
+    w = graph.get_weights(range=2, attenuation=0.5).toarray()
+    assert w[0].tolist() == [1, 0.5, 0.25, 0, 0]
+    assert w[2].tolist() == [0.25, 0.5, 1, 0.5, 0.25]
+    assert graph.get_weights(range=2, attenuation=0.5) is graph.get_weights(
+        range=2, attenuation=0.5
+    )
+
+    w = graph.get_weights(range=2, attenuation=lambda d: 1 / (d + 1), juxtacrine=True)
+    assert w.toarray()[0].tolist() == [0, 0.5, 1 / 3, 0, 0]
+
+    # summed levels, and bools within range
+    levels = np.array([100.0, 0, 0, 0, 100])
+    assert graph.signal(levels, range=2, attenuation=0.5).tolist() == [
+        100,
+        50,
+        50,
+        50,
+        100,
+    ]
+    on = levels > 0
+    assert graph.signal(on, range=1).tolist() == [True, True, False, True, True]
+    assert graph.signal(on, range=2).all()
+
+
+def test_diffusible_ligand_gradient():
+    # a morphogen made at one end of a row of cells, read at two thresholds
+    dinkum.reset()
+
+    n_cells = 8
+    cells = [Tissue(name=f"cell{i}") for i in range(n_cells)]
+    for a, b in zip(cells, cells[1:]):
+        a.add_neighbor(neighbor=b)
+
+    morphogen = Ligand(name="M", range=5, attenuation=0.5)
+    low = Receptor(name="low", ligand=morphogen)
+    high = Receptor(name="high", ligand=morphogen, threshold=20)
+
+    morphogen.is_present(where=cells[0], start=1)
+    for c in cells:
+        low.is_present(where=c, start=1)
+        high.is_present(where=c, start=1)
+
+    tc = Timecourse(start=1, stop=3)
+    tc.run()
+
+    state = tc.states_d[3]
+
+    def is_active(name):
+        return [state.get_by_tissue_name(c.name).is_active(name) for c in cells]
+
+    # received level is 100 * 0.5 ** distance, out to 5 cells away
+    assert is_active("low") == [True] * 6 + [False] * 2
+    assert is_active("high") == [True] * 3 + [False] * 5
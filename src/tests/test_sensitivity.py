@@ -0,0 +1,143 @@
+import pytest
+import numpy as np
+
+import dinkum
+from dinkum.vfg import Gene
+from dinkum.vfn import Tissue
+from dinkum import observations
+from dinkum import sensitivity
+from dinkum.vfg_functions import GeneTimecourse, LinearCombination, ParameterMap
+
+
+def define_model():
+    # out = wX * 100 + wY * 10
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+
+    x.custom_obj(GeneTimecourse(start_time=1, tissue=m, values=[100] * 5))
+    y.custom_obj(
+        GeneTimecourse(start_time=1, tissue=m, values=[10] * 5, normalize=False)
+    )
+    lc = LinearCombination(weights=[0.5, 0.5], gene_names=["X", "Y"])
+    out.custom_obj(lc)
+
+    return out, lc
+
+
+def test_morris_samples():
+    unit = sensitivity.morris_samples(5, 3, num_levels=4, seed=1)
+    assert unit.shape == (5 * 4, 3)
+    assert unit.min() >= 0 and unit.max() <= 1
+
+    # each step changes exactly one parameter, by delta
+    for r in range(5):
+        traj = unit[r * 4 : (r + 1) * 4]
+        diffs = np.diff(traj, axis=0)
+        assert ((diffs != 0).sum(axis=1) == 1).all()
+        assert np.allclose(np.abs(diffs).sum(axis=1), 2 / 3)
+
+
+def test_morris_samples_odd_levels():
+    # with 3 levels, delta is 0.75 and 0.5 can't move by it in [0, 1]
+    for num_levels in (1, 3, 5):
+        with pytest.raises(Exception, match="num_levels must be even"):
+            sensitivity.morris_samples(5, 3, num_levels=num_levels, seed=1)
+
+    unit = sensitivity.morris_samples(20, 3, num_levels=6, seed=1)
+    assert unit.min() >= 0 and unit.max() <= 1
+
+
+def test_saltelli_samples():
+    unit = sensitivity.saltelli_samples(8, 3, seed=1)
+    assert unit.shape == (8 * 5, 3)
+    a, b = unit[:8], unit[8:16]
+    ab_1 = unit[24:32]
+    assert (ab_1[:, 1] == b[:, 1]).all()
+    assert (ab_1[:, [0, 2]] == a[:, [0, 2]]).all()
+
+
+def test_param_bounds():
+    out, lc = define_model()
+    pmap = ParameterMap([out])
+    names, lower, upper = sensitivity.get_param_bounds(pmap, {"out_wY": (0, 1)})
+    assert names == ["out_wX", "out_wY"]
+    assert list(lower) == [-20, 0]
+    assert list(upper) == [20, 1]
+
+    with pytest.raises(Exception):
+        sensitivity.get_param_bounds(pmap, {"nope": (0, 1)})
+
+
+def test_morris():
+    out, lc = define_model()
+    bounds = {"out_wX": (0, 1), "out_wY": (0, 1)}
+
+    res = sensitivity.morris(
+        1, 3, fit_genes=[out], bounds=bounds, n_trajectories=6, seed=1, processes=2
+    )
+    mu_star = res["mu_star"]
+    assert list(mu_star.columns) == ["out_wX", "out_wY"]
+
+    # out at time 2 is wX * 100 + wY * 10 => exact elementary effects
+    row = mu_star.loc[("out", "M", 2)]
+    assert round(row["out_wX"], 6) == 100
+    assert round(row["out_wY"], 6) == 10
+    assert round(res["sigma"].loc[("out", "M", 2), "out_wX"], 6) == 0
+
+    # X does not depend on the parameters at all
+    assert (mu_star.loc["X"] == 0).all().all()
+
+    # parameters are restored
+    assert lc.weights == [0.5, 0.5]
+
+
+def test_sobol():
+    out, lc = define_model()
+    bounds = {"out_wX": (0, 1), "out_wY": (0, 1)}
+
+    res = sensitivity.sobol(
+        1,
+        3,
+        fit_genes=[out],
+        bounds=bounds,
+        n_samples=2048,
+        seed=1,
+        gene_names=["out"],
+        processes=2,
+    )
+    s1 = res["S1"].loc[("out", "M", 3)]
+    st = res["ST"].loc[("out", "M", 3)]
+
+    # variance of 100 * wX dominates 10 * wY: 100^2 / (100^2 + 10^2)
+    assert abs(s1["out_wX"] - 0.99) < 0.1
+    assert abs(st["out_wX"] - 0.99) < 0.05
+    assert abs(st["out_wY"] - 0.01) < 0.01
+
+    # out is not set at time 1 => no variance => NaN
+    assert np.isnan(res["S1"].loc[("out", "M", 1), "out_wX"])
+
+
+def test_sobol_observations():
+    out, lc = define_model()
+    observations.check_level_is_between(
+        gene="out", time=2, tissue="M", min_level=50, max_level=200
+    )
+    bounds = {"out_wX": (0, 1), "out_wY": (0, 1)}
+
+    res = sensitivity.sobol(
+        1,
+        3,
+        fit_genes=[out],
+        bounds=bounds,
+        n_samples=256,
+        seed=2,
+        outputs="observations",
+        processes=2,
+    )
+    st = res["ST"].iloc[0]
+    assert st["out_wX"] > 0.9
+    assert st["out_wY"] < 0.1
@@ -0,0 +1,121 @@
+import pytest
+
+import dinkum
+from dinkum import parallel, serialize
+from dinkum.vfg import Gene, Ligand, Receptor
+from dinkum.vfn import Tissue, Lattice
+from dinkum.vfg_functions import Decay
+
+
+def state_fn(*, X, Y):
+    return X.level, X.active and not Y.active
+
+
+def build_model():
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    z = Gene(name="Z")
+    a = Ligand(name="A", range=2, attenuation=0.5)
+    r = Receptor(name="R", ligand=a, threshold=10)
+    d = Gene(name="D")
+
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    o = Tissue(name="O")
+    m.add_neighbor(neighbor=n)
+    n.add_neighbor(neighbor=o, bidirectional=False)
+
+    x.is_present(where=m, start=1, duration=3)
+    x.is_present(where=o, start=2, level=50, decay=2)
+    a.is_present(where=m, start=1)
+    r.is_present(where=n, start=1)
+    r.is_present(where=o, start=1)
+    y.activated_by(source=x)
+    z.custom_fn(state_fn=state_fn, delay=2)
+    d.custom_obj(Decay(rate=1.5, tissue=n))
+
+
+def get_results(stop=6):
+    tc = dinkum.run(1, stop)
+    return tc.get_states().to_dataframe()
+
+
+def test_round_trip(tmp_path):
+    dinkum.reset()
+    build_model()
+    expected = get_results()
+    d = serialize.to_dict()
+
+    for filename in ("model.json", "model.json.gz"):
+        path = tmp_path / filename
+        dinkum.save_model(path)
+
+        dinkum.reset()
+        dinkum.load_model(path)
+        assert serialize.to_dict() == d
+        for df, expected_df in zip(get_results(), expected):
+            assert df.equals(expected_df)
+
+
+def test_round_trip_lattice():
+    dinkum.reset()
+    lattice = Lattice((3, 4), name="c", periodic=(True, False))
+    extra = Tissue(name="extra")
+    extra.add_neighbor(neighbor=lattice[0, 0])
+    x = Ligand(name="X")
+    r = Receptor(name="R", ligand=x)
+    x.is_present(where=lattice[1, 1], start=1)
+    for cell in lattice:
+        r.is_present(where=cell, start=1)
+    expected = get_results(3)
+    d = serialize.to_dict()
+    assert d["tissues"] == ["extra"]
+    assert len(d["neighbors"]) == 2
+
+    serialize.from_dict(d)
+    assert serialize.to_dict() == d
+    for df, expected_df in zip(get_results(3), expected):
+        assert df.equals(expected_df)
+
+
+def test_save_not_importable():
+    dinkum.reset()
+    x = Gene(name="X")
+    y = Gene(name="Y")
+
+    def local_fn(*, X):
+        return X
+
+    y.custom_fn(state_fn=local_fn, delay=1)
+    with pytest.raises(Exception, match="not importable"):
+        serialize.to_dict()
+
+
+def test_load_checks_rules():
+    dinkum.reset()
+    build_model()
+    d = serialize.to_dict()
+    d["rules"].append(dict(d["rules"][-1]))
+    with pytest.raises(dinkum.DinkumMultipleRules):
+        serialize.from_dict(d)
+
+    d["format_version"] = 999
+    with pytest.raises(Exception, match="unsupported model format"):
+        serialize.from_dict(d)
+
+
+def count_z(stop):
+    tc = dinkum.run(1, stop)
+    return sum(
+        s.get_by_tissue_name("M").is_active("Z") for s in tc.get_states().values()
+    )
+
+
+def test_spawned_workers_get_model():
+    dinkum.reset()
+    build_model()
+    expected = [count_z(stop) for stop in (3, 4)]
+
+    with parallel.WorkerPool(count_z, processes=2, start_method="spawn") as pool:
+        assert pool.pool is not None
+        assert pool.map([3, 4]) == expected
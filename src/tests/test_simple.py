@@ -434,3 +434,51 @@ def test_multiple_rules_error():
     x.activated_by(source=x, delay=2)
     with pytest.raises(DinkumMultipleRules):
         x.activated_by(source=y, delay=2)
+
+
+def test_multiple_rules_is_present_allowed():
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    m = Tissue(name="M")
+
+    x.is_present(where=m, start=1)
+    x.activated_by(source=y)
+    x.is_present(where=m, start=3)
+    with pytest.raises(DinkumMultipleRules):
+        x.activated_by(source=x)
+
+    # the rejected rule is not kept
+    assert len(dinkum.vfg.get_rules()) == 3
+
+
+def test_add_rules():
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    z = Gene(name="Z")
+    m = Tissue(name="M")
+    y.activated_by(source=x)
+
+    def rule(dest, source):
+        obj = dinkum.vfg.Activator(rate=100, activator_name=source.name)
+        obj.set_gene(dest)
+        return dinkum.vfg.Interaction_CustomObj(dest=dest, obj=obj)
+
+    present = dinkum.vfg.Interaction_IsPresent(
+        dest=z, start=1, tissue=m, level=100, decay=1
+    )
+
+    # duplicates within the batch, or with existing rules => nothing added
+    with pytest.raises(DinkumMultipleRules):
+        dinkum.vfg.add_rules([rule(z, x), present, rule(z, y)])
+    with pytest.raises(DinkumMultipleRules):
+        dinkum.vfg.add_rules([rule(z, x), rule(y, x)])
+    assert len(dinkum.vfg.get_rules()) == 1
+
+    dinkum.vfg.add_rules([rule(z, x), present, present])
+    assert len(dinkum.vfg.get_rules()) == 4
+    with pytest.raises(DinkumMultipleRules):
+        z.activated_by(source=y)
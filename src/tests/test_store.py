@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+import pytest
+
+import dinkum
+from dinkum import Timecourse, store
+from dinkum.vfg import Gene, GeneStateInfo
+from dinkum.vfg_functions import Decay, LinearCombination
+from dinkum.vfn import Tissue
+
+
+def build_model():
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+    x.is_present(where=m, start=1, duration=3)
+    y.activated_by(source=x)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_into_store(tmp_path, processes):
+    dinkum.reset()
+    build_model()
+    tc = Timecourse(start=1, stop=5)
+    tc.run()
+    expected = tc.get_states().to_arrays()
+
+    path = str(tmp_path / "run")
+    tc = Timecourse(start=1, stop=5, store=path)
+    tc.run(processes=processes)
+    assert isinstance(tc.get_states(), store.StoredTissueGeneStates)
+    assert sorted(os.listdir(path)) == [
+        "active.npy",
+        "assigned.npy",
+        "kind.npy",
+        "level.npy",
+        "metadata.json",
+    ]
+
+    # reopen, without the model
+    dinkum.reset()
+    states = store.open_store(path)
+    assert [t.name for t in states[1].tissues] == ["M", "N"]
+    assert isinstance(states.level, np.memmap)
+    assert states.params == dict(start=1, stop=5)
+    assert list(states.keys()) == [1, 2, 3, 4, 5]
+
+    tp, level, active = states.to_arrays()
+    assert tp == expected[0]
+    assert (level == expected[1]).all()
+    assert (active == expected[2]).all()
+
+    assert states[4].get_by_tissue_name("M").get_level("Y") == 100
+    assert states[4].get_by_tissue_name("M").get_level("X") == 0
+    level_df, _ = states.to_dataframe()
+    assert list(level_df["Y"]) == [0, 0, 100, 0, 100, 0, 100, 0, 0, 0]
+
+    # read-only
+    with pytest.raises(ValueError):
+        states.set_gene_state(
+            timepoint=1, tissue_name="M", gene_name="X", state_info=GeneStateInfo(1)
+        )
+
+
+def test_store_reuse_and_stop(tmp_path):
+    dinkum.reset()
+    build_model()
+
+    path = str(tmp_path / "run")
+    tc = Timecourse(start=1, stop=5, store=path)
+    tc.run()
+    assert list(store.open_store(path).keys()) == [1, 2, 3, 4, 5]
+
+    # a second run into the same store replaces the first
+    tc.reset()
+    tc.run(stop_fn=lambda state: state.time == 2)
+    assert list(store.open_store(path).keys()) == [1, 2]
+
+    with pytest.raises(Exception):
+        store.create_store(path, timepoints=[1])
+
+
+def test_store_reuse_checked(tmp_path, monkeypatch):
+    dinkum.reset()
+    build_model()
+    path = str(tmp_path / "run")
+    Timecourse(start=1, stop=5, store=path).run()
+
+    # a run that doesn't fit fails before simulating anything
+    def fail(self, **kw):
+        raise AssertionError("should not run")
+
+    monkeypatch.setattr(Timecourse, "_run", fail)
+    s = store.open_store(path, mode="r+")
+    with pytest.raises(Exception, match="not 1 to 7"):
+        Timecourse(start=1, stop=7, store=s).run()
+    with pytest.raises(Exception, match="not open for writing"):
+        Timecourse(start=1, stop=5, store=store.open_store(path)).run()
+
+    Gene(name="Z")
+    with pytest.raises(Exception, match="other genes"):
+        Timecourse(start=1, stop=5, store=s).run()
+    assert list(store.open_store(path).keys()) == [1, 2, 3, 4, 5]
+
+
+def test_store_levels_exact(tmp_path):
+    # levels that float32 can't hold exactly, read back by a later rule
+    dinkum.reset()
+    m = Tissue(name="M")
+    Gene(name="D").custom_obj(Decay(rate=1.1, tissue=m))
+    Gene(name="E").custom_obj(LinearCombination(weights=[3], gene_names=["D"]))
+    tc = Timecourse(start=1, stop=6)
+    tc.run()
+    expected = tc.get_states().to_arrays()
+
+    path = str(tmp_path / "run")
+    Timecourse(start=1, stop=6, store=path).run()
+    states = store.open_store(path)
+    assert states.level.dtype == np.float64
+    _, level, _ = states.to_arrays()
+    assert (level == expected[1]).all()
+
+
+def test_create_store(tmp_path):
+    dinkum.reset()
+    path = str(tmp_path / "s")
+    states = store.create_store(
+        path,
+        timepoints=[1, 2],
+        tissue_names=["A"],
+        gene_names=["G"],
+        params=dict(seed=5),
+    )
+    states.set_gene_state(
+        timepoint=2, tissue_name="A", gene_name="G", state_info=GeneStateInfo(2.5, True)
+    )
+    with pytest.raises(Exception):
+        states.set_gene_state(
+            timepoint=3, tissue_name="A", gene_name="G", state_info=GeneStateInfo(1)
+        )
+    states.flush()
+
+    reopened = store.open_store(path, mode="r+")
+    assert reopened.params == dict(seed=5)
+    gsi = reopened[2].get_by_tissue_name("A").get_gene_state("G")
+    assert (gsi.level, gsi.active) == (2.5, True)
@@ -0,0 +1,118 @@
+import pytest
+
+import dinkum
+from dinkum.vfg import Gene
+from dinkum.vfn import Tissue
+from dinkum import observations, topology
+from dinkum.topology import canonical_topology, search_topologies
+
+
+def setup_model():
+    a = Gene(name="A")
+    b = Gene(name="B")
+    out = Gene(name="out")
+    t1 = Tissue(name="T1")
+    t2 = Tissue(name="T2")
+
+    a.is_present(where=t1, start=1)
+    a.is_present(where=t2, start=1)
+    b.is_present(where=t2, start=1)
+
+    # out = A and not B
+    observations.check_is_present(gene="out", time=2, tissue="T1")
+    observations.check_is_not_present(gene="out", time=2, tissue="T2")
+
+
+def test_canonical_topology():
+    t1 = canonical_topology(
+        [("out", "activated_by_or", ["B", "A"]), ("C", "activated_by", ["A"])]
+    )
+    t2 = canonical_topology(
+        [("C", "activated_by", ["A"]), ("out", "activated_by_or", ["A", "B"])]
+    )
+    assert t1 == t2
+    assert topology.topology_hash(t1) == topology.topology_hash(t2)
+    assert topology.count_edges(t1) == 3
+
+    # and_not is not symmetric
+    t3 = canonical_topology([("out", "and_not", ["A", "B"])])
+    t4 = canonical_topology([("out", "and_not", ["B", "A"])])
+    assert t3 != t4
+
+    with pytest.raises(Exception):
+        canonical_topology([("out", "nope", ["A"])])
+    with pytest.raises(Exception):
+        canonical_topology([("out", "activated_by", ["A"])] * 2)
+
+
+def test_neighbor_topologies():
+    start = canonical_topology([])
+    n = topology.neighbor_topologies(start, targets=["out"], sources=["A", "B"])
+    assert n == {
+        (("out", "activated_by", ("A",)),),
+        (("out", "activated_by", ("B",)),),
+    }
+
+    one = canonical_topology([("out", "activated_by", ["A"])])
+    n = topology.neighbor_topologies(one, targets=["out"], sources=["A", "B"])
+    assert canonical_topology([("out", "and_not", ["A", "B"])]) in n
+    assert canonical_topology([("out", "activated_by_and", ["A", "B"])]) in n
+    assert start in n
+
+    n = topology.neighbor_topologies(
+        one, targets=["out"], sources=["A", "B"], logic=["activated_by"]
+    )
+    assert n == {start, canonical_topology([("out", "activated_by", ["B"])])}
+
+
+def test_search_topologies():
+    cache = {}
+    pareto = search_topologies(
+        setup_model,
+        start=1,
+        stop=3,
+        targets=["out"],
+        sources=["A", "B"],
+        max_steps=3,
+        cache=cache,
+        processes=2,
+    )
+
+    best = pareto[-1]
+    assert best.n_failed == 0
+    assert best.n_edges == 2
+    assert best.topology == (("out", "and_not", ("A", "B")),)
+    assert best.key == topology.topology_hash(best.topology)
+
+    # fewer edges => more failures
+    assert pareto[0].n_edges == 0
+    assert [p.n_failed for p in pareto] == sorted(
+        [p.n_failed for p in pareto], reverse=True
+    )
+
+    # model is left as built by setup_model alone
+    assert len(observations.get_obs()) == 2
+    assert len(dinkum.vfg.get_rules()) == 3
+
+    # cache is reused
+    n_cached = len(cache)
+    assert n_cached > 0
+    pareto2 = search_topologies(
+        setup_model,
+        start=1,
+        stop=3,
+        targets=["out"],
+        sources=["A", "B"],
+        max_steps=3,
+        cache=cache,
+        processes=1,
+    )
+    assert pareto2 == pareto
+    assert len(cache) == n_cached
+
+
+def test_apply_topology():
+    dinkum.reset()
+    setup_model()
+    topology.apply_topology(canonical_topology([("out", "and_not", ["A", "B"])]))
+    tc = dinkum.run(1, 3)
@@ -1,4 +1,6 @@
 import pytest
+import numpy as np
+import pandas as pd
 from lmfit import Parameters
 
 import dinkum
@@ -11,10 +13,22 @@ from dinkum.vfg_functions import (
     LinearCombination,
     GeneTimecourse,
     run_lmfit,
+    run_lmfit_multistart,
+    run_emcee,
+    ParameterMap,
+    run_lmfit_df,
+    prepare_fit_data,
+    calc_jacobian,
+    continuous_relaxation,
+    logistic_output,
+    Dual,
+    LogisticMultiActivator,
+    sample_start_values,
     LogisticRepressor,
     LogisticActivator,
     calc_response_1d,
     calc_response_2d,
+    response_atlas,
     LogisticMultiRepressor,
     LogisticRepressor2,
 )
@@ -628,3 +642,537 @@ def test_fit_2_logistic_multi_repressor():
 
     assert int(logit.rate) == 19  # could change?
     assert round(logit.weights[0], 1) == 0.9
+
+
+def test_response_atlas():
+    # check atlas against calc_response_1d/calc_response_2d
+    dinkum.reset()
+
+    x = Gene(name="X")
+    z = Gene(name="Z")
+    a = Gene(name="A")
+    out = Gene(name="out")
+    out2 = Gene(name="out2")
+    m = Tissue(name="M")
+
+    x.is_present(where=m, start=1)
+    a.custom_obj(LogisticActivator(rate=20, midpoint=40, activator_name="X"))
+    out.custom_obj(
+        LogisticRepressor2(
+            activator_rate=100,
+            repressor_rate=50,
+            activator_name="X",
+            repressor_name="Z",
+        )
+    )
+    out2.custom_obj(LinearCombination(weights=[1, -1, 2], gene_names=["X", "Z", "A"]))
+
+    # is_present rule is skipped
+    atlas = response_atlas(levels=[0, 10, 20], processes=2)
+    assert set(atlas) == {"A", "out", "out2"}
+
+    surface = atlas["out2"]
+    assert surface.input_gene_names == ["X", "Z", "A"]
+    assert surface.response.shape == (3, 3, 3)
+    assert surface.response[1, 0, 2] == 10 - 0 + 40
+
+    atlas = response_atlas(
+        target_gene_names=["A", "out"], levels=range(0, 101), processes=2
+    )
+    assert set(atlas) == {"A", "out"}
+
+    surface = atlas["A"]
+    assert surface.input_gene_names == ["X"]
+    _, yvals = calc_response_1d(
+        timepoint=2, target_gene_name="A", variable_gene_name="X"
+    )
+    assert list(surface.response) == list(yvals)
+
+    surface = atlas["out"]
+    assert surface.input_gene_names == ["X", "Z"]
+    arr = calc_response_2d(
+        timepoint=2, target_gene_name="out", x_gene_name="X", y_gene_name="Z"
+    )
+    assert (surface.response == arr.T).all()
+
+
+def test_response_atlas_chunks_and_cache(tmp_path):
+    dinkum.reset()
+
+    x = Gene(name="X")
+    z = Gene(name="Z")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+
+    out.custom_obj(LinearCombination(weights=[1, 2], gene_names=["X", "Z"]))
+
+    atlas = response_atlas(levels=[0, 50, 100], chunk_size=4, processes=1)
+    response = atlas["out"].response
+    assert response.tolist() == [[0, 100, 200], [50, 150, 250], [100, 200, 300]]
+
+    atlas2 = response_atlas(
+        levels=[0, 50, 100], chunk_size=4, cache_dir=tmp_path, processes=1
+    )
+    assert isinstance(atlas2["out"].response, np.memmap)
+    assert (atlas2["out"].response == response).all()
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+
+    # same parameters => cached file
+    atlas3 = response_atlas(levels=[0, 50, 100], cache_dir=tmp_path, processes=1)
+    assert (atlas3["out"].response == response).all()
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+
+    # different parameters => new file
+    dinkum.reset()
+    x = Gene(name="X")
+    z = Gene(name="Z")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+    out.custom_obj(LinearCombination(weights=[1, 3], gene_names=["X", "Z"]))
+
+    atlas4 = response_atlas(levels=[0, 50, 100], cache_dir=tmp_path, processes=1)
+    assert atlas4["out"].response[0, 2] == 300
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+
+def test_response_atlas_cache_closures(tmp_path):
+    # same source, different captured values => different cached surfaces
+    def make(sign):
+        def state_fn(*, X):
+            return X.level * sign, True
+
+        return state_fn
+
+    def atlas_for(sign):
+        dinkum.reset()
+        Gene(name="X")
+        Tissue(name="M")
+        Gene(name="out").custom_fn(state_fn=make(sign), delay=1)
+        atlas = response_atlas(levels=[0, 50, 100], cache_dir=tmp_path, processes=1)
+        return atlas["out"].response.tolist()
+
+    assert atlas_for(1) == [0, 50, 100]
+    assert atlas_for(0) == [0, 0, 0]
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+    # the same model again => the cached surface
+    assert atlas_for(1) == [0, 50, 100]
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+
+def test_sample_start_values():
+    p = Parameters()
+    p.add("a", value=5, min=0, max=10)
+    p.add("b", value=1, min=0.01)  # no upper bound => not sampled
+    p.add("c", value=2, min=0, max=10, vary=False)
+
+    starts = sample_start_values(p, 20, seed=1)
+    assert len(starts) == 20
+    assert starts[0] == {"a": 5, "b": 1, "c": 2}
+    for values in starts:
+        assert 0 <= values["a"] <= 10
+        assert values["b"] == 1
+        assert values["c"] == 2
+    assert len(set(v["a"] for v in starts)) == 20
+
+
+def test_fit_multistart_logistic_activator():
+    # can multiple starts find a better LogisticActivator fit?
+
+    # first, calculate a response curve
+    dinkum.reset()
+
+    x = Gene(name="X")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+
+    x.custom_obj(Growth(start_time=1, rate=0.1, initial_level=0, tissue=m))
+    out.custom_obj(LogisticActivator(rate=30, midpoint=58, activator_name="X"))
+
+    tc = dinkum.run(start=1, stop=20, verbose=True)
+    states = tc.get_states()
+    level_df, _ = states.to_dataframe()
+    fit_to_vals = list(level_df["out"])
+
+    # ok, now, reset and run fit from a poor starting point
+    dinkum.reset()
+
+    x = Gene(name="X")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+
+    x.custom_obj(Growth(start_time=1, rate=0.1, initial_level=0, tissue=m))
+
+    logit = LogisticActivator(rate=11, midpoint=5, activator_name="X")
+    out.custom_obj(logit)
+
+    fits = run_lmfit_multistart(
+        1,
+        20,
+        fit_values=fit_to_vals,
+        fit_genes=[out],
+        n_starts=12,
+        seed=2,
+        processes=4,
+        method="nelder",
+    )
+
+    # ranked by residual, deduplicated, and all starts accounted for
+    chisqrs = [f.chisqr for f in fits]
+    assert chisqrs == sorted(chisqrs)
+    assert sum(f.count for f in fits) == 12
+    assert fits[0].init_values  # starting point recorded
+
+    # best params are set on the model, and fit the data well.
+    assert logit.rate == fits[0].params["out_rate"].value
+    assert fits[0].chisqr < fits[-1].chisqr or len(fits) == 1
+    assert int(logit.midpoint) in range(50, 65)
+
+
+def _define_emcee_model(rate=11, midpoint=50):
+    dinkum.reset()
+
+    x = Gene(name="X")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+
+    x.custom_obj(Growth(start_time=1, rate=0.1, initial_level=0, tissue=m))
+    logit = LogisticActivator(rate=rate, midpoint=midpoint, activator_name="X")
+    out.custom_obj(logit)
+
+    return out, logit
+
+
+def test_run_emcee(tmp_path):
+    out, _ = _define_emcee_model(rate=30, midpoint=58)
+    tc = dinkum.run(start=1, stop=20)
+    level_df, _ = tc.get_states().to_dataframe()
+    fit_to_vals = list(level_df["out"])
+
+    out, logit = _define_emcee_model(rate=30, midpoint=55)
+
+    checkpoint = tmp_path / "chain.pickle"
+    sampler = run_emcee(
+        1,
+        20,
+        fit_values=fit_to_vals,
+        fit_genes=[out],
+        nwalkers=8,
+        nsteps=30,
+        sigma=5,
+        seed=1,
+        processes=2,
+        checkpoint=checkpoint,
+        checkpoint_every=10,
+    )
+
+    chain = sampler.get_chain()
+    assert chain.shape == (30, 8, 2)
+    assert checkpoint.exists()
+
+    # all samples lie within the declared bounds
+    assert (chain[:, :, 0] >= 11).all() and (chain[:, :, 0] <= 100).all()
+    assert (chain[:, :, 1] >= 0).all() and (chain[:, :, 1] <= 100).all()
+
+    # max posterior params are set on the model
+    assert abs(logit.midpoint - 58) < 3
+
+    # resume from checkpoint, continuing the same chain
+    out, logit = _define_emcee_model(rate=30, midpoint=55)
+    sampler2 = run_emcee(
+        1,
+        20,
+        fit_values=fit_to_vals,
+        fit_genes=[out],
+        nwalkers=8,
+        nsteps=40,
+        sigma=5,
+        processes=1,
+        checkpoint=checkpoint,
+    )
+    chain2 = sampler2.get_chain()
+    assert chain2.shape == (40, 8, 2)
+    assert (chain2[:30] == chain).all()
+
+
+def test_run_emcee_resume_matches(tmp_path):
+    # an interrupted then resumed run gives the same chain as one run
+    out, _ = _define_emcee_model(rate=30, midpoint=58)
+    level_df, _ = dinkum.run(start=1, stop=10).get_states().to_dataframe()
+    fit_to_vals = list(level_df["out"])
+
+    def sample(nsteps, checkpoint):
+        out, _ = _define_emcee_model(rate=30, midpoint=55)
+        sampler = run_emcee(
+            1,
+            10,
+            fit_values=fit_to_vals,
+            fit_genes=[out],
+            nwalkers=8,
+            nsteps=nsteps,
+            sigma=5,
+            seed=3,
+            processes=1,
+            checkpoint=checkpoint,
+        )
+        return sampler.get_chain()
+
+    expected = sample(20, tmp_path / "full.pickle")
+    sample(8, tmp_path / "resumed.pickle")
+    chain = sample(20, tmp_path / "resumed.pickle")
+    assert (chain == expected).all()
+
+
+def test_parameter_map():
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    out = Gene(name="out")
+    out2 = Gene(name="out2")
+    other = Gene(name="other")
+    m = Tissue(name="M")
+
+    decay = Decay(rate=1.2, tissue=m)
+    x.custom_obj(decay)
+    multi = LogisticMultiActivator(activator_names=["X", "Y"], rate=20)
+    out.custom_obj(multi)
+    linear = LinearCombination(gene_names=["X", "Y"])  # weights default None
+    out2.custom_obj(linear)
+    unfit = LogisticActivator(activator_name="X", rate=50)
+    other.custom_obj(unfit)
+
+    pmap = ParameterMap([x, out, out2])
+    assert pmap.names == [
+        "X_decay",
+        "X_initial",
+        "out_rate",
+        "out_wX",
+        "out_wY",
+        "out2_wX",
+        "out2_wY",
+    ]
+    assert list(pmap.values) == [1.2, 100, 20, 1, 1, 1, 1]
+    assert linear.weights == [1, 1]
+
+    pmap.set_values([2, 50, 30, 0.5, 0.25, -1, 3])
+    assert decay.rate == 2 and decay.initial_level == 50
+    assert multi.rate == 30 and multi.weights == [0.5, 0.25]
+    assert linear.weights == [-1, 3]
+    assert unfit.rate == 50  # not a fit gene
+
+    # round trip through lmfit Parameters
+    p = pmap.to_params()
+    assert p["out2_wY"].value == 3
+    p["out2_wY"].value = 7
+    pmap.set_params(p)
+    assert linear.weights == [-1, 7]
+
+    # the view reads directly from the vector
+    assert pmap.view["out_rate"].value == 30
+    pmap.values[pmap.index["out_rate"]] = 40
+    assert pmap.view["out_rate"].value == 40
+
+
+def test_parameter_map_set_params_fallback():
+    # objects without get_param_slots are set through a ParameterView
+    class MyActivator(LogisticActivator):
+        get_param_slots = None
+
+    dinkum.reset()
+
+    x = Gene(name="X")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+
+    logit = MyActivator(activator_name="X")
+    out.custom_obj(logit)
+
+    pmap = ParameterMap([out])
+    pmap.set_values([42, 17])
+    assert logit.rate == 42
+    assert logit.midpoint == 17
+
+
+def _define_two_tissue_model(weights):
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+
+    x.custom_obj(Growth(start_time=1, rate=0.25, initial_level=0, tissue=m))
+    y.custom_obj(GeneTimecourse(start_time=2, tissue=n, values=[10, 40, 20, 80]))
+    lc = LinearCombination(weights=weights, gene_names=["X", "Y"])
+    out.custom_obj(lc)
+
+    return out, lc
+
+
+def test_states_to_arrays():
+    _define_two_tissue_model([1, 2])
+    tc = dinkum.run(1, 5)
+
+    timepoints, level, active = tc.get_states().to_arrays(
+        timepoints=[2, 3, 9], tissue_names=["N"], gene_names=["Y", "out"]
+    )
+    assert timepoints == [2, 3, 9]
+    assert level.shape == (3, 1, 2)
+    assert level[:, 0, 0].tolist() == [12, 50, 0]
+    assert level[1, 0, 1] == 2 * 12  # out at t=3 reads Y at t=2
+    assert active[0, 0, 0] and not active[2, 0, 0]
+
+
+def test_fit_df_multi_tissue():
+    # generate sparse observations in two tissues
+    _define_two_tissue_model([0.5, 2])
+    tc = dinkum.run(1, 8)
+    level_df, _ = tc.get_states().to_dataframe()
+
+    rows = []
+    for tissue, times in (("M", [3, 6, 8]), ("N", [3, 4, 5])):
+        sub = level_df[level_df["tissue"] == tissue]
+        for t in times:
+            value = sub.loc[t, "out"]
+            rows.append(dict(tissue=tissue, gene="out", time=t, value=value))
+    data = pd.DataFrame(rows)
+    data["weight"] = 1.0
+
+    fit_data = prepare_fit_data(data, 1, 8)
+    assert fit_data.tissue_names == ["M", "N"]
+    assert fit_data.gene_names == ["out"]
+    assert list(fit_data.index[0]) == [2, 5, 7, 2, 3, 4]
+
+    # now fit from wrong weights
+    out, lc = _define_two_tissue_model([1, 1])
+    res = run_lmfit_df(1, 8, data=data, fit_genes=[out])
+    assert len(res.residual) == 6
+    assert round(lc.weights[0], 2) == 0.5
+    assert round(lc.weights[1], 2) == 2
+
+
+def test_fit_df_bad_data():
+    out, lc = _define_two_tissue_model([1, 1])
+
+    data = pd.DataFrame([dict(tissue="Q", gene="out", time=2, value=5)])
+    with pytest.raises(dinkum.DinkumInvalidTissue):
+        run_lmfit_df(1, 8, data=data, fit_genes=[out])
+
+    data = pd.DataFrame([dict(tissue="M", gene="nope", time=2, value=5)])
+    with pytest.raises(DinkumInvalidGene):
+        run_lmfit_df(1, 8, data=data, fit_genes=[out])
+
+    data = pd.DataFrame([dict(tissue="M", gene="out", time=20, value=5)])
+    with pytest.raises(Exception):
+        run_lmfit_df(1, 8, data=data, fit_genes=[out])
+
+
+def test_dual_logistic_output():
+    rate = Dual(25, np.array([1.0, 0.0]))
+    midpoint = Dual(40, np.array([0.0, 1.0]))
+
+    # rounding is on by default...
+    assert logistic_output(rate=25, input_level=41, midpoint=40) == 71
+
+    with continuous_relaxation():
+        out = logistic_output(rate=rate, input_level=41, midpoint=midpoint)
+        plain = logistic_output(rate=25, input_level=41, midpoint=40)
+        assert out.value == plain
+        assert 71 < plain < 72
+
+        # compare against finite differences
+        eps = 1e-6
+        d_rate = logistic_output(rate=25 + eps, input_level=41, midpoint=40)
+        d_mid = logistic_output(rate=25, input_level=41, midpoint=40 + eps)
+        assert abs(out.grad[0] - (d_rate - plain) / eps) < 1e-4
+        assert abs(out.grad[1] - (d_mid - plain) / eps) < 1e-4
+
+
+def _define_jacobian_model():
+    dinkum.reset()
+
+    x = Gene(name="X")
+    y = Gene(name="Y")
+    a = Gene(name="A")
+    out = Gene(name="out")
+    m = Tissue(name="M")
+    n = Tissue(name="N")
+
+    x.custom_obj(Growth(start_time=1, rate=0.25, initial_level=0, tissue=m))
+    y.custom_obj(GeneTimecourse(start_time=2, tissue=n, values=[10, 40, 20, 80]))
+    a.custom_obj(LogisticActivator(rate=20, midpoint=40, activator_name="X"))
+    out.custom_obj(LinearCombination(weights=[0.5, 2], gene_names=["A", "Y"]))
+
+    return a, out
+
+
+def test_calc_jacobian():
+    a, out = _define_jacobian_model()
+
+    rows = []
+    for tissue in ("M", "N"):
+        for t in range(2, 9):
+            rows.append(dict(tissue=tissue, gene="out", time=t, value=0))
+            rows.append(dict(tissue=tissue, gene="A", time=t, value=0))
+    data = pd.DataFrame(rows)
+
+    pmap = ParameterMap([a, out])
+    assert pmap.names == ["A_rate", "A_midpoint", "out_wA", "out_wY"]
+    values = pmap.values.copy()
+
+    levels, jac = calc_jacobian(1, 8, data=data, fit_genes=[a, out], pmap=pmap)
+    assert jac.shape == (len(data), 4)
+    assert np.abs(jac).sum() > 0
+
+    # parameters are restored to plain floats afterwards
+    assert list(pmap.values) == list(values)
+    for ix in dinkum.vfg.get_rules():
+        for attr in ("rate", "midpoint", "weights"):
+            value = getattr(ix.obj, attr, [])
+            for v in value if isinstance(value, list) else [value]:
+                assert not isinstance(v, Dual)
+
+    # compare against finite differences on the relaxed model
+    eps = 1e-5
+    for i in range(4):
+        shifted = values.copy()
+        shifted[i] += eps
+        levels2, _ = calc_jacobian(
+            1, 8, data=data, fit_genes=[a, out], pmap=pmap, values=shifted
+        )
+        fd = (levels2 - levels) / eps
+        assert np.allclose(jac[:, i], fd, atol=1e-3), i
+
+
+def test_fit_df_jacobian():
+    a, out = _define_jacobian_model()
+    tc = dinkum.run(1, 8)
+    level_df, _ = tc.get_states().to_dataframe()
+
+    rows = []
+    for tissue, times in (("M", [3, 4, 5, 6, 8]), ("N", [3, 4, 5])):
+        sub = level_df[level_df["tissue"] == tissue]
+        for t in times:
+            value = sub.loc[t, "out"]
+            rows.append(dict(tissue=tissue, gene="out", time=t, value=value))
+    data = pd.DataFrame(rows)
+
+    # wrong weights; fit with and without the analytic jacobian
+    _, out = _define_jacobian_model()
+    ix = list(out_ix for out_ix in dinkum.vfg.get_rules() if out_ix.dest == out)[0]
+    ix.obj.weights = [1, 1]
+    res_fd = run_lmfit_df(1, 8, data=data, fit_genes=[out])
+
+    _, out = _define_jacobian_model()
+    ix = list(out_ix for out_ix in dinkum.vfg.get_rules() if out_ix.dest == out)[0]
+    ix.obj.weights = [1, 1]
+    res = run_lmfit_df(1, 8, data=data, fit_genes=[out], jacobian=True)
+
+    assert round(ix.obj.weights[0], 1) == 0.5
+    assert round(ix.obj.weights[1], 2) == 2
+    assert res.nfev < res_fd.nfev
+
+    with pytest.raises(Exception):
+        run_lmfit_df(1, 8, data=data, fit_genes=[out], jacobian=True, method="brute")